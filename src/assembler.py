@@ -1,5 +1,10 @@
 import struct
-from .utils import function_ranges2, op_uses_values, op_sets_result, simplify_op, op_is_comp, bin_ops, un_ops
+from .utils import function_ranges2, op_uses_values, op_sets_result, simplify_op, op_is_comp, bin_ops, un_ops, \
+    fused_compare_jumps
+from .regalloc import allocate, registers, callee_saved, strategies
+
+# 'x86-64' is generated by assembler64.py
+targets = ['x86', 'x86-64']
 
 
 class ASMInstruction:
@@ -48,12 +53,44 @@ op_to_asm = {
     '>': 'setg',
 }
 
+# the jump of a 'jumpfalse' after a comparison (the negated condition),
+# x87 'fcomip' and SSE 'ucomiss' set the flags like an unsigned comparison
+jump_if_false = {
+    '==': 'jne',
+    '!=': 'je',
+    '<=': 'jg',
+    '>=': 'jl',
+    '<': 'jge',
+    '>': 'jle',
+}
+float_jump_if_false = {
+    '==': 'jne',
+    '!=': 'je',
+    '<=': 'ja',
+    '>=': 'jb',
+    '<': 'jae',
+    '>': 'jbe',
+}
+
 
 def is_var_or_temp(arg):
     return type(arg) is str
 
 
-def gen_stack_mapping(code, params):
+def shift_operands(arg1, arg2):
+    '''
+    (operand, k) if one of the factors of an int '*' is the constant 2 ** k
+    (k > 0): the product is the other operand shifted left by k bits, both
+    wrap around at 32 bits. None for the other multiplications
+    '''
+    for factor, operand in [(arg2, arg1), (arg1, arg2)]:
+        if type(factor) is int and factor > 1 and factor & (factor - 1) == 0:
+            return operand, factor.bit_length() - 1
+    return None
+
+
+def gen_stack_mapping(code, params, registers=()):
+    ''' the variables in 'registers' (allocated by regalloc) get no stack slot '''
     currmap = {}
     for tac in code:
         op, _, _, _ = tac
@@ -71,7 +108,7 @@ def gen_stack_mapping(code, params):
                 if type(arg) is float:
                     currmap[arg] = -(len(currmap) + 1) * 4
                 continue
-            if arg in params:
+            if arg in params or arg in registers:
                 continue
             currmap[arg] = -(len(currmap) + 1) * 4
     for loc, param in enumerate(params):
@@ -123,9 +160,15 @@ def float_to_asm(f):
     return '$%s' % hex(struct.unpack('<I', struct.pack('<f', f))[0])
 
 
-def fun_to_asm(code, assembly):
+def is_memory(operand):
+    return '(' in operand
+
+
+def fun_to_asm(code, assembly, regalloc=None):
 
     def arg_to_asm(arg):
+        if is_var_or_temp(arg) and arg in allocation:
+            return allocation[arg]
         if is_var_or_temp(arg) or type(arg) is float:
             return '%d(%%ebp)' % register_to_stack[arg]
         elif type(arg) is int:
@@ -151,6 +194,8 @@ def fun_to_asm(code, assembly):
         elif op == 'end-fun':
             add(None)
         elif op == 'return':
+            for reg, offset in saved:
+                add('movl', '%d(%%ebp)' % offset, reg, comment='restore ' + reg)
             add('mov', '%ebp', '%esp')
             add('pop', '%ebp')
             add('ret')
@@ -160,16 +205,38 @@ def fun_to_asm(code, assembly):
             raise NotImplementedError
         elif op == 'assign':
             comment = res + ' := ' + str(arg1)
-            need_accum = (is_var_or_temp(arg1) and is_var_or_temp(res)) or type(arg1) is float
             arg1, res = [arg_to_asm(el) for el in [arg1, res]]
-            if need_accum:
+            if arg1 == res:
+                # coalesced by the register allocator
+                add(None, comment=comment)
+            elif is_memory(arg1) and is_memory(res):
                 add('mov', arg1, '%eax', comment=comment)
                 add('movl', '%eax', res)
             else:
                 add('movl', arg1, res, comment=comment)
         elif op in ['*', '/', '%']:
             comment = res + ' = ' + str(arg1) + ' ' + op + ' ' + str(arg2)
-            if totype == 'int':
+            if totype == 'int' and op == '*' and shift_operands(arg1, arg2) is not None:
+                operand, bits = shift_operands(arg1, arg2)
+                add('mov', arg_to_asm(operand), '%eax', comment=comment)
+                add('sall', '$%d' % bits, '%eax')
+                add('mov', '%eax', arg_to_asm(res))
+            elif totype == 'int' and regalloc is not None:
+                # only %eax and %edx are overwritten
+                add('mov', arg_to_asm(arg1), '%eax', comment=comment)
+                if op == '*':
+                    add('imull', arg_to_asm(arg2), '%eax')
+                else:
+                    divisor = arg_to_asm(arg2)
+                    if not is_var_or_temp(arg2):
+                        add('push', divisor)
+                        divisor = '(%esp)'
+                    add('cdq')
+                    add('idivl', divisor)
+                    if not is_var_or_temp(arg2):
+                        add('add', '$4', '%esp')
+                add('mov', '%edx' if op == '%' else '%eax', arg_to_asm(res))
+            elif totype == 'int':
                 add('mov', arg_to_asm(arg1), '%eax', comment=comment)
                 if op in ['/', '%']:
                     add('cdq')
@@ -193,7 +260,10 @@ def fun_to_asm(code, assembly):
         elif op in bin_ops:
             comment = res + ' = ' + str(arg1) + ' ' + op + ' ' + str(arg2)
             if op in op_is_comp:
-                if totype == 'int':
+                if totype == 'int' and regalloc is not None:
+                    add('mov', arg_to_asm(arg1), '%eax', comment=comment)
+                    add('cmp', arg_to_asm(arg2), '%eax')
+                elif totype == 'int':
                     add('mov', arg_to_asm(arg1), '%ebx', comment=comment)
                     add('mov', arg_to_asm(arg2), '%eax')
                     add('cmp', '%eax', '%ebx')
@@ -205,8 +275,14 @@ def fun_to_asm(code, assembly):
                     add('fstp', '%st(0)')
                 else:
                     raise NotImplementedError
-                add('movl', '$0', arg_to_asm(res))
-                add(op_to_asm[op], arg_to_asm(res))
+                if regalloc is not None:
+                    # 'set*' needs a byte register
+                    add(op_to_asm[op], '%al')
+                    add('movzbl', '%al', '%eax')
+                    add('mov', '%eax', arg_to_asm(res))
+                else:
+                    add('movl', '$0', arg_to_asm(res))
+                    add(op_to_asm[op], arg_to_asm(res))
             else:
                 if totype == 'int':
                     add('mov', arg_to_asm(arg1), '%eax', comment=comment)
@@ -236,32 +312,63 @@ def fun_to_asm(code, assembly):
                 raise NotImplementedError
         elif op == 'u!':
             comment = res + ' = ' + op[1:] + str(arg1)
-            add('mov', arg_to_asm(arg1), '%eax', comment=comment)
-            add('movl', '$0', arg_to_asm(res))
-            add('cmp', '$0', '%eax')
-            add('sete', arg_to_asm(res))
+            if regalloc is not None:
+                add('cmp', '$0', arg_to_asm(arg1), comment=comment)
+                add('sete', '%al')
+                add('movzbl', '%al', '%eax')
+                add('mov', '%eax', arg_to_asm(res))
+            else:
+                add('mov', arg_to_asm(arg1), '%eax', comment=comment)
+                add('movl', '$0', arg_to_asm(res))
+                add('cmp', '$0', '%eax')
+                add('sete', arg_to_asm(res))
         elif op == 'arr-def':
             name, size = str(arg2), arg1
             comment = 'new int ' + name + '[' + str(size) + ']'
-            add('movl', arg_to_asm(size), '%ebx', comment=comment)
-            add('leal', '(,%ebx, 4)', '%ebx')
-            add('sub', '%ebx', '%esp')
+            scratch = '%ebx' if regalloc is None else '%eax'
+            add('movl', arg_to_asm(size), scratch, comment=comment)
+            add('leal', '(,%s, 4)' % scratch, scratch)
+            add('sub', scratch, '%esp')
             add('movl', '%esp', arg_to_asm(name))
         # TODO use esi register?, remove %
         elif op == 'arr-acc':
             name, index = arg2, arg1
             comment = res + ' = ' + str(name) + '[' + str(index) + ']'
-            add('movl', arg_to_asm(index), '%ebx', comment=comment)
-            add('movl', arg_to_asm(name), '%ecx')
-            add('movl', '-4(%s,%s,4)' % ('%ecx', '%ebx'), '%eax')
+            base, offset = ('%ecx', '%ebx') if regalloc is None else ('%edx', '%eax')
+            add('movl', arg_to_asm(index), offset, comment=comment)
+            add('movl', arg_to_asm(name), base)
+            add('movl', '-4(%s,%s,4)' % (base, offset), '%eax')
             add('movl', '%eax', arg_to_asm(res))
         elif op == 'arr-ass':
             name, index, result = res, arg1, arg2
             comment = name + '[' + str(index) + ']' + ' = ' + str(result)
             add('movl', arg_to_asm(result), '%eax', comment=comment)
-            add('movl', arg_to_asm(index), '%ebx')
-            add('movl', arg_to_asm(name), '%ecx')
-            add('movl', '%eax', '-4(%s,%s,4)' % ('%ecx', '%ebx'))
+            if regalloc is not None:
+                # %edx = name + 4 * index
+                add('movl', arg_to_asm(index), '%edx')
+                add('shl', '$2', '%edx')
+                add('add', arg_to_asm(name), '%edx')
+                add('movl', '%eax', '-4(%edx)')
+            else:
+                add('movl', arg_to_asm(index), '%ebx')
+                add('movl', arg_to_asm(name), '%ecx')
+                add('movl', '%eax', '-4(%s,%s,4)' % ('%ecx', '%ebx'))
+        else:
+            raise NotImplementedError
+
+    def compare_and_jump(op, arg1, arg2, label, totype):
+        ''' a comparison which is only used by the next 'jumpfalse' (see utils.fused_compare_jumps) '''
+        comment = 'if(!(' + str(arg1) + ' ' + op + ' ' + str(arg2) + ')) goto ' + label
+        if totype == 'int':
+            add('mov', arg_to_asm(arg1), '%eax', comment=comment)
+            add('cmp', arg_to_asm(arg2), '%eax')
+            add(jump_if_false[op], label)
+        elif totype == 'float':
+            add('flds', arg_to_asm(arg2), comment=comment)
+            add('flds', arg_to_asm(arg1))
+            add('fcomip')
+            add('fstp', '%st(0)')
+            add(float_jump_if_false[op], label)
         else:
             raise NotImplementedError
 
@@ -306,6 +413,9 @@ def fun_to_asm(code, assembly):
                 this has to be a return value from a function call (the other
                 type of 'pop' only happens in function definitions). Thus we
                 just assign the value of '%eax' to the register.
+            comparison followed by a 'jumpfalse' of its result
+                if the result isn't used anywhere else both are mapped to a
+                'cmp' and a conditional jump
             'any other operation'
                 uses the simple mapping defined in the 'to_assembly' function
     '''
@@ -314,6 +424,9 @@ def fun_to_asm(code, assembly):
     line = 0
     args = []
     types = calc_types(code)
+    allocation = {} if regalloc is None else allocate(code, types, regalloc)
+    saved = []
+    fused = fused_compare_jumps(code)
     while line < len(code):
         totype = types[line]
         tac = code[line]
@@ -325,12 +438,17 @@ def fun_to_asm(code, assembly):
             elif op == 'pop':
                 params.append(res)
             else:
-                register_to_stack = gen_stack_mapping(code, params)
+                register_to_stack = gen_stack_mapping(code, params, allocation)
                 registersinframe = len(register_to_stack) - len(params)
+                # the used callee-saved registers are stored below the local variables
+                for reg in callee_saved:
+                    if reg in allocation.values():
+                        registersinframe += 1
+                        saved.append((reg, -registersinframe * 4))
                 # label
                 add(fname + ':\t', indent=False, comment='%d params already on stack' % len(params))
                 for var in params:
-                    add(None, comment=var.rjust(5) + ' := ' + arg_to_asm(var))
+                    add(None, comment=var.rjust(5) + ' := %d(%%ebp)' % register_to_stack[var])
                 # stack frame
                 add('push', '%ebp')
                 add('mov', '%esp', '%ebp')
@@ -339,9 +457,16 @@ def fun_to_asm(code, assembly):
                 for var in register_to_stack:
                     if var not in params:
                         add(None, comment=str(var).rjust(5) + ' := ' + arg_to_asm(var))
+                for var, reg in sorted(allocation.items(), key=lambda el: registers.index(el[1])):
+                    add(None, comment=str(var).rjust(5) + ' := ' + reg)
                 for val, var in register_to_stack.items():
                     if type(val) is float:
                         add('movl', float_to_asm(val), '%d(%%ebp)' % var, comment=('const float: ' + str(val)))
+                for reg, offset in saved:
+                    add('movl', reg, '%d(%%ebp)' % offset, comment='save ' + reg)
+                for var in params:
+                    if var in allocation:
+                        add('movl', '%d(%%ebp)' % register_to_stack[var], allocation[var])
                 add(None)
                 state = 'fun-body'
                 continue
@@ -365,18 +490,43 @@ def fun_to_asm(code, assembly):
                 args = []
             elif op == 'pop':
                 add('mov', '%eax', arg_to_asm(res))
+            elif line in fused:
+                _, _, _, label = code[line + 1]
+                compare_and_jump(op, arg1, tac[2], label, totype)
+                line += 1
             else:
                 to_assembly(*tac, totype=totype)
 
         line += 1
 
 
-def codetoassembly(code, verbose=0, assemblyfile=None):
-    assembly = ['.globl main', '.text']
-    fun_ranges = function_ranges2(code)
-    for _, start, end in fun_ranges:
-        fun_to_asm(code[start:end], assembly)
+def codetoassembly(code, verbose=0, assemblyfile=None, regalloc=None, target='x86', optimize=False):
+    ''' 'regalloc' is None (every variable on the stack) or a strategy of regalloc.strategies,
+        'target' is one of 'targets', 'optimize' runs the peephole optimizer on the result '''
+    if target == 'x86-64':
+        from .assembler64 import codetoassembly64
+        assembly = codetoassembly64(code, regalloc)
+    elif target == 'x86':
+        assembly = ['.globl main', '.text']
+        fun_ranges = function_ranges2(code)
+        for _, start, end in fun_ranges:
+            fun_to_asm(code[start:end], assembly, regalloc)
+    else:
+        raise NotImplementedError('Unknown target \'%s\'' % target)
+    if optimize:
+        from .peephole import peephole, count_instructions
+        before = count_instructions(assembly)
+        assembly, hits = peephole(assembly)
+        if verbose > 0:  # pragma: no cover
+            print('\n' + ' Peephole '.center(40, '#'))
+            for rule, count in hits.items():
+                print('%-20s%6d' % (rule, count))
+            print('instructions: %d -> %d' % (before, count_instructions(assembly)))
+    outputassembly(assembly, verbose, assemblyfile)
+    return assembly
+
 
+def outputassembly(assembly, verbose=0, assemblyfile=None):
     if verbose > 0:  # pragma: no cover
         print('\n' + ' GNU Assembly '.center(40, '#'))
         print('\n'.join(map(str, assembly)))
@@ -388,8 +538,6 @@ def codetoassembly(code, verbose=0, assemblyfile=None):
             f.write('\n'.join(map(str, assembly)))
             f.write('\n')
 
-    return assembly
-
 
 if __name__ == '__main__':
     import argparse
@@ -397,19 +545,49 @@ if __name__ == '__main__':
     from .three import asttothree
     from .bb import threetobbs
     from .lvn import lvn
+    from .sccp import sccp
+    from .dce import dce
+    from .licm import licm
     parser = argparse.ArgumentParser()
     parser.add_argument("filename", help="The *.mc file to convert to GNU Assembly")
     parser.add_argument('--lvn', '-l', action='count', default=False)
+    parser.add_argument('--sccp', '-s', action='count', default=False,
+                        help="Propagate the constants and fold the branches on them (sparse conditional)")
+    parser.add_argument('--dce', action='count', default=False,
+                        help="Remove the dead code (alternating with lvn until a fixpoint with --lvn)")
+    parser.add_argument('--licm', action='count', default=False,
+                        help="Hoist the loop-invariant code into preheaders of the loops")
+    parser.add_argument('--cache', '-c', nargs='?', const='.mccache', default=None,
+                        help="Reuse the compiled stages of unchanged files from this cache directory")
+    parser.add_argument('--regalloc', '-r', choices=strategies, default=None,
+                        help="Keep the int variables in registers (default: every variable on the stack)")
+    parser.add_argument('--target', '-t', choices=targets, default='x86',
+                        help="x86: 32-bit cdecl with x87 floats, x86-64: System V with SSE floats")
+    parser.add_argument('--optimize', '-O', action='count', default=False,
+                        help="Run the peephole optimizer on the assembly (enabled by --lvn)")
     parser.add_argument('--verbose', '-v', action='count', default=0)
     args = parser.parse_args()
-    bbs = threetobbs(
-        asttothree(
-            parsefile(
-                args.filename,
-                verbose=args.verbose - 2),
-            verbose=args.verbose - 1),
-        verbose=0 if args.lvn else args.verbose)
-    if args.lvn:
-        bbs = lvn(bbs, verbose=args.verbose)
-    code = [tac for bb in bbs for tac in bb]
-    codetoassembly(code, args.verbose + 1, args.filename + '.s')
+    optimize = bool(args.optimize or args.lvn)
+    if args.cache is not None:
+        from .cache import CompilationCache, CachedPipeline
+        pipeline = CachedPipeline(args.filename, CompilationCache(args.cache, verbose=args.verbose), args.lvn,
+                                  usesccp=args.sccp, usedce=args.dce, uselicm=args.licm)
+        outputassembly(pipeline.assembly(args.regalloc, args.target, optimize), args.verbose + 1, args.filename + '.s')
+    else:
+        bbs = threetobbs(
+            asttothree(
+                parsefile(
+                    args.filename,
+                    verbose=args.verbose - 2),
+                verbose=args.verbose - 1),
+            verbose=0 if args.lvn else args.verbose)
+        if args.lvn:
+            bbs = lvn(bbs, verbose=args.verbose)
+        if args.sccp:
+            bbs = sccp(bbs, verbose=args.verbose)
+        if args.dce:
+            bbs = dce(bbs, verbose=args.verbose, uselvn=args.lvn)
+        if args.licm:
+            bbs = licm(bbs, verbose=args.verbose)
+        code = [tac for bb in bbs for tac in bb]
+        codetoassembly(code, args.verbose + 1, args.filename + '.s', args.regalloc, args.target, optimize)
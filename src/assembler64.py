@@ -0,0 +1,393 @@
+from .utils import function_ranges2, op_is_comp, bin_ops, fused_compare_jumps
+from .assembler import ASMInstruction, gen_stack_mapping, calc_types, float_to_asm, is_var_or_temp, is_memory, \
+    jump_if_false, float_jump_if_false, shift_operands
+from .regalloc import allocate, registers64, callee_saved64
+
+# x86-64 System V code generator (AT&T syntax):
+#   * every variable/temporary/float constant has an 8-byte slot below %rbp
+#     (ints and floats use the lower 4 bytes, arrays store their address)
+#   * ints are 32-bit ('movl', 'addl', ...), %eax/%edx are the scratch registers
+#   * floats are scalar SSE ('movss', 'addss', 'ucomiss') in %xmm0/%xmm1
+#   * the first 6 int arguments are passed in %rdi, %rsi, %rdx, %rcx, %r8, %r9
+#     and the first 8 float arguments in %xmm0-7, the result in %eax/%xmm0
+#
+# A 'push' of the TAC still pushes the argument on the stack (its value may be
+# overwritten before the call), the arguments are pushed in reverse order so
+# the 'call' pops them in order into the argument registers.
+# At a call %rsp has to be a multiple of 16, the frame, arrays and the
+# arguments of outer calls (f(x, g(y))) are padded accordingly.
+
+int_arg_registers = ['%rdi', '%rsi', '%rdx', '%rcx', '%r8', '%r9']
+float_arg_registers = ['%%xmm%d' % i for i in range(8)]
+
+lib_signatures = {
+    'read_int': [],
+    'read_float': [],
+    'print_int': ['int'],
+    'print_float': ['float'],
+    'start_measurement': [],
+    'end_measurement': [],
+}
+
+int_op_to_asm = {
+    '+': 'addl',
+    '-': 'subl',
+    '*': 'imull',
+}
+float_op_to_asm = {
+    '+': 'addss',
+    '-': 'subss',
+    '*': 'mulss',
+    '/': 'divss',
+}
+int_set_to_asm = {
+    '==': 'sete',
+    '!=': 'setne',
+    '<=': 'setle',
+    '>=': 'setge',
+    '<': 'setl',
+    '>': 'setg',
+}
+# ucomiss sets the flags like an unsigned compare
+float_set_to_asm = {
+    '==': 'sete',
+    '!=': 'setne',
+    '<=': 'setbe',
+    '>=': 'setae',
+    '<': 'setb',
+    '>': 'seta',
+}
+
+
+def register64(reg):
+    ''' 64-bit name of a 32-bit register ('%ecx' -> '%rcx', '%r8d' -> '%r8') '''
+    if reg.endswith('d'):
+        return reg[:-1]
+    return '%r' + reg[2:]
+
+
+def is_immediate(operand):
+    return operand.startswith('$')
+
+
+def signatures(code):
+    ''' the parameter types of the library and of all the functions in 'code' '''
+    res = dict(lib_signatures)
+    for fname, start, end in function_ranges2(code):
+        params = []
+        for op, _, paramtype, _ in code[start + 1:end]:
+            if op != 'pop':
+                break
+            params.append(paramtype)
+        res[fname] = params
+    return res
+
+
+def var_types(code, types):
+    res = {}
+    for line, (op, _, arg2, result) in enumerate(code):
+        if op == 'arr-def':
+            res[arg2] = 'array'
+        elif op in op_is_comp:
+            # the result of a comparison is an int (calc_types returns the type of the operands)
+            res[result] = 'int'
+        elif types[line] is not None:
+            res[result] = types[line]
+    return res
+
+
+def fun_to_asm64(code, assembly, funsignatures, regalloc=None):
+    ''' same state machine as assembler.fun_to_asm '''
+
+    def arg_to_asm(arg):
+        if is_var_or_temp(arg) and arg in allocation:
+            return allocation[arg]
+        if is_var_or_temp(arg) or type(arg) is float:
+            return '%d(%%rbp)' % register_to_stack[arg]
+        elif type(arg) is int:
+            return '$%d' % arg
+        else:
+            raise NotImplementedError
+
+    def typeof(arg):
+        if is_var_or_temp(arg):
+            return vartypes[arg]
+        return 'int' if type(arg) is int else 'float'
+
+    def add(op, arg1=None, arg2=None, comment=None, indent=True):
+        assembly.append(ASMInstruction(op, arg1, arg2, comment, indent))
+
+    def compare_zero(arg, comment):
+        operand = arg_to_asm(arg)
+        if is_immediate(operand):
+            add('movl', operand, '%eax', comment=comment)
+            operand = '%eax'
+            comment = None
+        add('cmpl', '$0', operand, comment=comment)
+
+    def set_result(setop, res):
+        add(setop, '%al')
+        add('movzbl', '%al', '%eax')
+        add('movl', '%eax', arg_to_asm(res))
+
+    def index_to_rax(index):
+        operand = arg_to_asm(index)
+        if is_immediate(operand):
+            add('movq', operand, '%rax')
+        else:
+            add('movslq', operand, '%rax')
+
+    def compare_and_jump(op, arg1, arg2, label, totype):
+        ''' a comparison which is only used by the next 'jumpfalse' (see utils.fused_compare_jumps) '''
+        comment = 'if(!(' + str(arg1) + ' ' + op + ' ' + str(arg2) + ')) goto ' + label
+        if totype == 'float':
+            add('movss', arg_to_asm(arg1), '%xmm0', comment=comment)
+            add('ucomiss', arg_to_asm(arg2), '%xmm0')
+            add(float_jump_if_false[op], label)
+        elif totype == 'int':
+            add('movl', arg_to_asm(arg1), '%eax', comment=comment)
+            add('cmpl', arg_to_asm(arg2), '%eax')
+            add(jump_if_false[op], label)
+        else:
+            raise NotImplementedError
+
+    def to_assembly(op, arg1, arg2, res, totype=None):
+        if op == 'jump':
+            add('jmp', res)
+        elif op == 'jumpfalse':
+            compare_zero(arg1, 'if(' + str(arg1) + '==0) goto ' + res)
+            add('je', res)
+        elif op == 'label':
+            add(res + ':', indent=False)
+        elif op == 'end-fun':
+            add(None)
+        elif op == 'return':
+            for reg, offset in saved:
+                add('movq', '%d(%%rbp)' % offset, register64(reg), comment='restore ' + register64(reg))
+            add('mov', '%rbp', '%rsp')
+            add('pop', '%rbp')
+            add('ret')
+        elif op == 'assign':
+            comment = res + ' := ' + str(arg1)
+            arg1, res = [arg_to_asm(el) for el in [arg1, res]]
+            if arg1 == res:
+                # coalesced by the register allocator
+                add(None, comment=comment)
+            elif is_memory(arg1) and is_memory(res):
+                add('movl', arg1, '%eax', comment=comment)
+                add('movl', '%eax', res)
+            else:
+                add('movl', arg1, res, comment=comment)
+        elif op in bin_ops:
+            comment = res + ' = ' + str(arg1) + ' ' + op + ' ' + str(arg2)
+            if totype == 'float':
+                add('movss', arg_to_asm(arg1), '%xmm0', comment=comment)
+                if op in op_is_comp:
+                    add('ucomiss', arg_to_asm(arg2), '%xmm0')
+                    set_result(float_set_to_asm[op], res)
+                elif op in float_op_to_asm:
+                    add(float_op_to_asm[op], arg_to_asm(arg2), '%xmm0')
+                    add('movss', '%xmm0', arg_to_asm(res))
+                else:
+                    raise NotImplementedError
+            elif totype == 'int' and op == '*' and shift_operands(arg1, arg2) is not None:
+                operand, bits = shift_operands(arg1, arg2)
+                add('movl', arg_to_asm(operand), '%eax', comment=comment)
+                add('sall', '$%d' % bits, '%eax')
+                add('movl', '%eax', arg_to_asm(res))
+            elif totype == 'int':
+                add('movl', arg_to_asm(arg1), '%eax', comment=comment)
+                if op in op_is_comp:
+                    add('cmpl', arg_to_asm(arg2), '%eax')
+                    set_result(int_set_to_asm[op], res)
+                elif op in int_op_to_asm:
+                    add(int_op_to_asm[op], arg_to_asm(arg2), '%eax')
+                    add('movl', '%eax', arg_to_asm(res))
+                else:
+                    divisor = arg_to_asm(arg2)
+                    add('cltd')
+                    if is_immediate(divisor):
+                        add('pushq', divisor)
+                        add('idivl', '(%rsp)')
+                        add('add', '$8', '%rsp')
+                    else:
+                        add('idivl', divisor)
+                    add('movl', '%edx' if op == '%' else '%eax', arg_to_asm(res))
+            else:
+                raise NotImplementedError
+        elif op == 'u-':
+            comment = res + ' = ' + op[1:] + str(arg1)
+            if totype == 'int':
+                add('movl', arg_to_asm(arg1), '%eax', comment=comment)
+                add('negl', '%eax')
+                add('movl', '%eax', arg_to_asm(res))
+            elif totype == 'float':
+                add('xorps', '%xmm0', '%xmm0', comment=comment)
+                add('subss', arg_to_asm(arg1), '%xmm0')
+                add('movss', '%xmm0', arg_to_asm(res))
+            else:
+                raise NotImplementedError
+        elif op == 'u!':
+            compare_zero(arg1, res + ' = ' + op[1:] + str(arg1))
+            set_result('sete', res)
+        elif op == 'arr-def':
+            name, size = str(arg2), arg1
+            comment = 'new ' + str(res) + ' ' + name + '[' + str(size) + ']'
+            index_to_rax(size)
+            assembly[-1].comment = comment
+            # keep %rsp aligned to 16 bytes
+            add('leaq', '15(,%rax,4)', '%rax')
+            add('andq', '$-16', '%rax')
+            add('subq', '%rax', '%rsp')
+            add('movq', '%rsp', arg_to_asm(name))
+        elif op == 'arr-acc':
+            name, index = arg2, arg1
+            comment = res + ' = ' + str(name) + '[' + str(index) + ']'
+            index_to_rax(index)
+            assembly[-1].comment = comment
+            add('movq', arg_to_asm(name), '%rdx')
+            add('movl', '(%rdx,%rax,4)', '%eax')
+            add('movl', '%eax', arg_to_asm(res))
+        elif op == 'arr-ass':
+            name, index, result = res, arg1, arg2
+            comment = name + '[' + str(index) + ']' + ' = ' + str(result)
+            index_to_rax(index)
+            assembly[-1].comment = comment
+            add('movq', arg_to_asm(name), '%rdx')
+            add('leaq', '(%rdx,%rax,4)', '%rdx')
+            add('movl', arg_to_asm(result), '%eax')
+            add('movl', '%eax', '(%rdx)')
+        else:
+            raise NotImplementedError
+
+    register_to_stack = None
+    state, fname, params = 'fun-def', None, []
+    line = 0
+    args = []
+    # number of 8-byte values pushed for the calls which didn't happen yet
+    pushed = 0
+    types = calc_types(code)
+    vartypes = var_types(code, types)
+    allocation = {} if regalloc is None else allocate(code, types, regalloc, 'x86-64')
+    saved = []
+    fused = fused_compare_jumps(code)
+    while line < len(code):
+        totype = types[line]
+        tac = code[line]
+        op, arg1, _, res = tac
+
+        if state == 'fun-def':
+            if op == 'function':
+                fname = res
+            elif op == 'pop':
+                params.append(res)
+            else:
+                # all the parameters are stored in a stack slot first
+                stack = gen_stack_mapping(code, params, allocation)
+                register_to_stack = {arg: offset * 2 for arg, offset in stack.items() if arg not in params}
+                for param in params:
+                    register_to_stack[param] = -(len(register_to_stack) + 1) * 8
+                slots = len(register_to_stack)
+                for reg in callee_saved64:
+                    if reg in allocation.values():
+                        slots += 1
+                        saved.append((reg, -slots * 8))
+                framesize = (slots * 8 + 15) // 16 * 16
+                add(fname + ':\t', indent=False, comment='%d params in registers' % len(params))
+                add('push', '%rbp')
+                add('mov', '%rsp', '%rbp')
+                add('sub', '$' + str(framesize), '%rsp', comment='make space on stack for %d slots' % slots)
+                for var in register_to_stack:
+                    if type(var) is not float:
+                        add(None, comment=str(var).rjust(5) + ' := ' + '%d(%%rbp)' % register_to_stack[var])
+                for var, reg in sorted(allocation.items(), key=lambda el: registers64.index(el[1])):
+                    add(None, comment=str(var).rjust(5) + ' := ' + reg)
+                for val, var in register_to_stack.items():
+                    if type(val) is float:
+                        add('movl', float_to_asm(val), '%d(%%rbp)' % var, comment=('const float: ' + str(val)))
+                for reg, offset in saved:
+                    add('movq', register64(reg), '%d(%%rbp)' % offset, comment='save ' + register64(reg))
+                ints, floats = 0, 0
+                for param in params:
+                    slot = '%d(%%rbp)' % register_to_stack[param]
+                    if typeof(param) == 'float':
+                        if floats == len(float_arg_registers):
+                            raise NotImplementedError('More than %d float parameters' % floats)
+                        add('movss', float_arg_registers[floats], slot)
+                        floats += 1
+                    else:
+                        if ints == len(int_arg_registers):
+                            raise NotImplementedError('More than %d int parameters' % ints)
+                        add('movq', int_arg_registers[ints], slot)
+                        ints += 1
+                for param in params:
+                    if param in allocation:
+                        add('movl', '%d(%%rbp)' % register_to_stack[param], allocation[param])
+                add(None)
+                state = 'fun-body'
+                continue
+
+        elif state == 'fun-body':
+            if op == 'push':
+                nextop, _, _, _ = code[line + 1]
+                if nextop == 'return':
+                    if typeof(arg1) == 'float':
+                        add('movss', arg_to_asm(arg1), '%xmm0', comment='return ' + str(arg1))
+                    else:
+                        add('movl', arg_to_asm(arg1), '%eax', comment='return ' + str(arg1))
+                    args = []
+                else:
+                    operand = arg_to_asm(arg1)
+                    args.append(arg1)
+                    add('pushq', register64(operand) if operand in registers64 else operand)
+                    pushed += 1
+            elif op == 'call':
+                if res not in funsignatures:
+                    raise NotImplementedError('Unknown function \'%s\'' % res)
+                paramtypes = funsignatures[res]
+                nextop, _, _, nextret = code[line + 1]
+                retvalue = (nextret + ' := ') if nextop == 'pop' else ''
+                comment = retvalue + res + '(' + ','.join([str(el) for el in reversed(args[len(args) - len(paramtypes):])]) + ')'
+                ints, floats = 0, 0
+                for paramtype in paramtypes:
+                    if paramtype == 'float':
+                        if floats == len(float_arg_registers):
+                            raise NotImplementedError('More than %d float arguments' % floats)
+                        add('movss', '(%rsp)', float_arg_registers[floats])
+                        add('add', '$8', '%rsp')
+                        floats += 1
+                    else:
+                        if ints == len(int_arg_registers):
+                            raise NotImplementedError('More than %d int arguments' % ints)
+                        add('pop', int_arg_registers[ints])
+                        ints += 1
+                pushed -= len(paramtypes)
+                del args[len(args) - len(paramtypes):]
+                if pushed % 2 == 1:
+                    add('sub', '$8', '%rsp')
+                add('call', res, comment=comment)
+                if pushed % 2 == 1:
+                    add('add', '$8', '%rsp')
+            elif op == 'pop':
+                if typeof(res) == 'float':
+                    add('movss', '%xmm0', arg_to_asm(res))
+                else:
+                    add('movl', '%eax', arg_to_asm(res))
+            elif line in fused:
+                _, _, _, label = code[line + 1]
+                compare_and_jump(op, arg1, tac[2], label, totype)
+                line += 1
+            else:
+                to_assembly(*tac, totype=totype)
+
+        line += 1
+
+
+def codetoassembly64(code, regalloc=None):
+    ''' see assembler.codetoassembly '''
+    assembly = ['.globl main', '.text']
+    funsignatures = signatures(code)
+    for _, start, end in function_ranges2(code):
+        fun_to_asm64(code[start:end], assembly, funsignatures, regalloc)
+    assembly.append('.section .note.GNU-stack,"",@progbits')
+    return assembly
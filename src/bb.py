@@ -1,14 +1,19 @@
 from .three import printthree, prettythreestr
+from .packed import PackedTAC, leaders as packedleaders
 
 
 def threetobbs(threes, verbose=0):
+    ''' threes is the list form or a 'packed.PackedTAC', the blocks are in list form '''
     # find leaders by instruction line
-    leaders = set([0])
-    for line, (op, _, _, _) in enumerate(threes):
-        if op in ['label', 'function']:
-            leaders.add(line)
-        if op in ['jump', 'jumpfalse', 'end-fun']:
-            leaders.add(line + 1)
+    if isinstance(threes, PackedTAC):
+        leaders = packedleaders(threes)
+    else:
+        leaders = set([0])
+        for line, (op, _, _, _) in enumerate(threes):
+            if op in ['label', 'function']:
+                leaders.add(line)
+            if op in ['jump', 'jumpfalse', 'end-fun']:
+                leaders.add(line + 1)
 
     # generate basic blocks for every leader
     bbs = []
@@ -0,0 +1,145 @@
+import mmap
+import struct
+import sys
+from array import array
+from .vm import Frame
+
+# Binary bytecode file (*.mcb), all numbers are little-endian:
+#
+#   header      magic 'MCBC', version, #frames, #slots, #instructions, #name bytes, exitline
+#   frames      #frames   x int32[4]    start, end, first slot, #slots
+#   kinds       #slots    x int32       VARIABLE / INT / FLOAT
+#   values      #slots    x 8 bytes     int64 or float64 (the constant pool)
+#   code        #instr    x int32[4]    op, arg1, arg2, result (None is -1)
+#   names       utf-8, the names of the frames and of the VARIABLE slots separated by '\n'
+#
+# Every section starts at a multiple of 8 bytes, so the loader only casts
+# memoryviews of the mmap-ed file (no parsing besides the names).
+# This module doesn't import any compiler stage.
+
+MAGIC = b'MCBC'
+VERSION = 3
+header = struct.Struct('<4sIIIIIi')
+VARIABLE, INT, FLOAT = 0, 1, 2
+
+
+class BytecodeException(Exception):
+    pass
+
+
+def align(size):
+    return (size + 7) // 8 * 8
+
+
+def littleendian(arr):
+    if sys.byteorder == 'big':  # pragma: no cover
+        arr.byteswap()
+    return arr
+
+
+def dumps_bytecode(code, frames, exitline):
+    ''' returns the bytes of the bytecode file '''
+    frametable = array('i')
+    kinds = array('i')
+    values = bytearray()
+    names = [frame.name for frame in frames]
+    for frame in frames:
+        mem_to_arg = {mempos: arg for arg, mempos in frame.arg_to_mem.items() if type(arg) is str}
+        frametable.extend([frame.start, frame.end, len(kinds), len(frame.mem)])
+        for mempos, value in enumerate(frame.mem):
+            if value is None:
+                kinds.append(VARIABLE)
+                values += struct.pack('<q', 0)
+                names.append(mem_to_arg[mempos])
+            elif type(value) is float:
+                kinds.append(FLOAT)
+                values += struct.pack('<d', value)
+            else:
+                kinds.append(INT)
+                values += struct.pack('<q', value)
+    instructions = array('i', [-1 if el is None else el for tac in code for el in tac])
+    namebytes = '\n'.join(names).encode('utf-8')
+
+    sections = [
+        header.pack(MAGIC, VERSION, len(frames), len(kinds), len(code), len(namebytes), exitline),
+        littleendian(frametable).tobytes(),
+        littleendian(kinds).tobytes(),
+        bytes(values),
+        littleendian(instructions).tobytes(),
+        namebytes,
+    ]
+    return b''.join(section + b'\0' * (align(len(section)) - len(section)) for section in sections)
+
+
+def write_bytecode(code, frames, exitline, bcfile):
+    with open(bcfile, 'wb') as f:
+        f.write(dumps_bytecode(code, frames, exitline))
+
+
+def loads_bytecode(buf):
+    ''' returns (code, frames, exitline) like vm.bbs_to_bytecode '''
+    if len(buf) < header.size:
+        raise BytecodeException('The file is too short for a bytecode header')
+    magic, version, nframes, nslots, ncode, namesize, exitline = header.unpack_from(buf)
+    if magic != MAGIC:
+        raise BytecodeException('Not a bytecode file (magic %r)' % magic)
+    if version != VERSION:
+        raise BytecodeException('Unsupported bytecode version %d (expected %d)' % (version, VERSION))
+    offsets = []
+    offset = align(header.size)
+    for size in [16 * nframes, 4 * nslots, 8 * nslots, 16 * ncode, namesize]:
+        offsets.append((offset, size))
+        offset += align(size)
+    if offsets[-1][0] + namesize > len(buf):
+        raise BytecodeException('The bytecode file is truncated')
+
+    # all views have to be released before an mmap can be closed
+    views = [memoryview(buf)]
+    try:
+        sections = [views[0][offset:offset + size] for offset, size in offsets]
+        views += sections
+        frametable, kinds, values, instructions, namebytes = sections
+        if sys.byteorder == 'big':  # pragma: no cover
+            frametable, kinds, instructions = (littleendian(array('i', section.tobytes())) for section in [frametable, kinds, instructions])
+            ints, floats = (littleendian(array(typecode, values.tobytes())) for typecode in 'qd')
+        else:
+            frametable, kinds, instructions = (section.cast('i') for section in [frametable, kinds, instructions])
+            ints, floats = values.cast('q'), values.cast('d')
+            views += [frametable, kinds, instructions, ints, floats]
+        names = iter(bytes(namebytes).decode('utf-8').split('\n'))
+        framenames = [next(names) for _ in range(nframes)]
+
+        flat = [None if el == -1 else el for el in instructions.tolist()]
+        code = [flat[i:i + 4] for i in range(0, len(flat), 4)]
+        frames = []
+        for framenum in range(nframes):
+            start, end, firstslot, size = frametable[4 * framenum:4 * framenum + 4].tolist()
+            mem = []
+            arg_to_mem = {}
+            for slot in range(firstslot, firstslot + size):
+                kind = kinds[slot]
+                if kind == VARIABLE:
+                    arg, value = next(names), None
+                elif kind == INT:
+                    arg = value = ints[slot]
+                elif kind == FLOAT:
+                    arg = value = floats[slot]
+                else:
+                    raise BytecodeException('Unknown slot kind %d' % kind)
+                arg_to_mem[arg] = len(mem)
+                mem.append(value)
+            frames.append(Frame(start, end, mem, arg_to_mem, framenames[framenum]))
+        return code, frames, exitline
+    finally:
+        for view in reversed(views):
+            view.release()
+
+
+def load_bytecode(bcfile):
+    with open(bcfile, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise BytecodeException('The bytecode file "%s" is empty' % bcfile)
+    with buf:
+        return loads_bytecode(buf)
@@ -0,0 +1,204 @@
+import hashlib
+import os
+import pickle
+import zlib
+
+_compiler_version = None
+
+
+def compiler_version():
+    ''' hash over the sources of the compiler, any change to a pass invalidates the cache '''
+    global _compiler_version
+    if _compiler_version is None:
+        srcdir = os.path.dirname(os.path.abspath(__file__))
+        h = hashlib.sha1()
+        for fname in sorted(os.listdir(srcdir)):
+            if fname.endswith('.py'):
+                h.update(fname.encode())
+                with open(os.path.join(srcdir, fname), 'rb') as f:
+                    h.update(f.read())
+        _compiler_version = h.hexdigest()
+    return _compiler_version
+
+
+class CompilationCache(object):
+    ''' content-addressed on-disk cache for the results of the compiler stages
+
+        an entry is keyed by (compiler version, stage, options, source code) and
+        stored as a zlib compressed pickle '<cachedir>/<sha1>.pkz'.
+        The modification time of an entry is its last use: if the cache grows
+        larger than 'maxsize' bytes the least recently used entries are deleted.
+    '''
+
+    def __init__(self, cachedir='.mccache', maxsize=64 * 1024 * 1024, verbose=0):
+        self.cachedir = cachedir
+        self.maxsize = maxsize
+        self.verbose = verbose
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+
+    def key(self, stage, stringcode, options=None):
+        options = {} if options is None else options
+        h = hashlib.sha1()
+        h.update(compiler_version().encode())
+        h.update(stage.encode())
+        h.update(repr(sorted(options.items())).encode())
+        h.update(stringcode.encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cachedir, key + '.pkz')
+
+    def get(self, key):
+        ''' returns (True, value) on a hit and (False, None) on a miss '''
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.loads(zlib.decompress(f.read()))
+        except (IOError, OSError):
+            return False, None
+        except Exception:
+            # truncated or incompatible entry
+            os.remove(path)
+            return False, None
+        os.utime(path, None)
+        return True, value
+
+    def put(self, key, value):
+        path = self.path(key)
+        tmppath = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmppath, 'wb') as f:
+            f.write(zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+        os.replace(tmppath, path)
+        self.evict()
+
+    def stage(self, stage, stringcode, options, compute):
+        ''' returns the cached result of 'stage', computes and stores it on a miss '''
+        key = self.key(stage, stringcode, options)
+        found, value = self.get(key)
+        if found:
+            self.hits += 1
+            if self.verbose > 0:  # pragma: no cover
+                print('Cache hit: %s (%s)' % (stage, key))
+            return value
+        self.misses += 1
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def entries(self):
+        ''' [(last use, size, path)] of every entry, least recently used first '''
+        entries = []
+        for fname in os.listdir(self.cachedir):
+            if not fname.endswith('.pkz'):
+                continue
+            path = os.path.join(self.cachedir, fname)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.maxsize:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+
+
+class CachedPipeline(object):
+    ''' parsefile -> asttothree -> threetobbs [-> lvn] [-> sccp] [-> dce] [-> licm] -> cfg -> dominance, bytecode/assembly
+
+        every stage looks into the cache first and only computes
+        (the previous stages) on a miss
+    '''
+
+    def __init__(self, fname, cache, uselvn=False, verbose=0, usesccp=False, usedce=False, uselicm=False):
+        with open(fname, 'r') as mcfile:
+            # same wrapping as parser.parsefile
+            self.stringcode = '{\n' + mcfile.read()[:-1] + '\n}'
+        self.cache = cache
+        self.options = {'lvn': bool(uselvn)}
+        if usesccp:
+            self.options['sccp'] = True
+        if usedce:
+            self.options['dce'] = True
+        if uselicm:
+            self.options['licm'] = True
+        self.verbose = verbose
+
+    def ast(self):
+        from .parser import parse
+        return self.cache.stage('ast', self.stringcode, None,
+                                lambda: parse(self.stringcode, verbose=self.verbose))
+
+    def three(self):
+        from .three import asttothree
+        return self.cache.stage('three', self.stringcode, None,
+                                lambda: asttothree(self.ast()))
+
+    def bbs(self):
+        from .bb import threetobbs
+        from .lvn import lvn
+        from .sccp import sccp
+        from .dce import dce
+        from .licm import licm
+
+        def compute():
+            bbs = threetobbs(self.three())
+            if self.options['lvn']:
+                bbs = lvn(bbs)
+            if self.options.get('sccp'):
+                bbs = sccp(bbs)
+            if self.options.get('dce'):
+                bbs = dce(bbs, uselvn=self.options['lvn'])
+            if self.options.get('licm'):
+                bbs = licm(bbs)
+            return bbs
+        return self.cache.stage('bbs', self.stringcode, self.options, compute)
+
+    def cfg(self):
+        from .cfg import bbstocfg
+        return self.cache.stage('cfg', self.stringcode, self.options, lambda: bbstocfg(self.bbs()))
+
+    def dominance(self):
+        ''' the dominators and loops (dominators.Dominance) of the cfg, computed from the same blocks '''
+        from .dominators import Dominance
+        return self.cache.stage('dominance', self.stringcode, self.options, lambda: Dominance(self.bbs(), self.cfg()))
+
+    def bytecode(self):
+        from .vm import bbs_to_bytecode
+        return self.cache.stage('bytecode', self.stringcode, self.options,
+                                lambda: bbs_to_bytecode(self.bbs()))
+
+    def assembly(self, regalloc=None, target='x86', optimize=False):
+        from .assembler import codetoassembly
+
+        def compute():
+            code = [tac for bb in self.bbs() for tac in bb]
+            return codetoassembly(code, verbose=-1, regalloc=regalloc, target=target, optimize=optimize)
+        options = self.options if regalloc is None else dict(self.options, regalloc=regalloc)
+        options = options if target == 'x86' else dict(options, target=target)
+        options = dict(options, optimize=True) if optimize else options
+        return self.cache.stage('assembly', self.stringcode, options, compute)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('cachedir', nargs='?', default='.mccache', help="The cache directory")
+    parser.add_argument('--clear', '-c', action='count', default=False)
+    args = parser.parse_args()
+    cache = CompilationCache(args.cachedir)
+    if args.clear:
+        cache.clear()
+    print('%d entries, %d bytes' % (len(cache.entries()), cache.size()))
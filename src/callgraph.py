@@ -32,10 +32,13 @@ if __name__ == '__main__':
     from .three import asttothree
     from .bb import threetobbs
     from .lvn import lvn
+    from .dce import dce
     parser = argparse.ArgumentParser()
     parser.add_argument("filename", help="The *.mc file to convert into a Call Graph")
     parser.add_argument('dotfile', default=None)
     parser.add_argument('--lvn', '-l', action='count', default=False)
+    parser.add_argument('--dce', action='count', default=False,
+                        help="Remove the dead code (alternating with lvn until a fixpoint with --lvn)")
     parser.add_argument('--verbose', '-v', action='count', default=0)
     args = parser.parse_args()
     bbs = threetobbs(
@@ -47,4 +50,6 @@ if __name__ == '__main__':
         verbose=1 if not args.lvn else 0)
     if args.lvn:
         bbs = lvn(bbs, verbose=1)
+    if args.dce:
+        bbs = dce(bbs, verbose=1, uselvn=args.lvn)
     bbstocallgraph(bbs, args.verbose + 1, args.dotfile)
@@ -39,19 +39,36 @@ if __name__ == '__main__':
     from .three import asttothree
     from .bb import threetobbs
     from .lvn import lvn
+    from .dce import dce
+    from .licm import licm
     parser = argparse.ArgumentParser()
     parser.add_argument("filename", help="The *.mc file to convert into a Control Flow Graph and Basic Blocks")
     parser.add_argument('dotfile', default=None)
     parser.add_argument('--lvn', '-l', action='count', default=False)
+    parser.add_argument('--dce', action='count', default=False,
+                        help="Remove the dead code (alternating with lvn until a fixpoint with --lvn)")
+    parser.add_argument('--licm', action='count', default=False,
+                        help="Hoist the loop-invariant code into preheaders of the loops")
+    parser.add_argument('--cache', '-c', nargs='?', const='.mccache', default=None,
+                        help="Reuse the compiled stages of unchanged files from this cache directory")
     parser.add_argument('--verbose', '-v', action='count', default=0)
     args = parser.parse_args()
-    bbs = threetobbs(
-        asttothree(
-            parsefile(
-                args.filename,
-                verbose=args.verbose - 2),
-            verbose=args.verbose - 1),
-        verbose=1 if not args.lvn else 0)
-    if args.lvn:
-        bbs = lvn(bbs, verbose=1)
+    if args.cache is not None:
+        from .cache import CompilationCache, CachedPipeline
+        bbs = CachedPipeline(args.filename, CompilationCache(args.cache, verbose=args.verbose), args.lvn,
+                             usedce=args.dce, uselicm=args.licm).bbs()
+    else:
+        bbs = threetobbs(
+            asttothree(
+                parsefile(
+                    args.filename,
+                    verbose=args.verbose - 2),
+                verbose=args.verbose - 1),
+            verbose=1 if not args.lvn else 0)
+        if args.lvn:
+            bbs = lvn(bbs, verbose=1)
+        if args.dce:
+            bbs = dce(bbs, verbose=1, uselvn=args.lvn)
+        if args.licm:
+            bbs = licm(bbs, verbose=1)
     bbstocfg(bbs, args.verbose + 1, args.dotfile)
@@ -1,7 +1,385 @@
-from .utils import isvar, op_uses_values, op_sets_result, simplify_op
+from collections.abc import Mapping
+from functools import reduce
+from heapq import heappop, heappush
+from .utils import op_uses_values, op_sets_result, simplify_op, bin_ops, un_ops, op_commutative, \
+    is_constant, fold_constant
 
 
-def liveness(bbs, cfg, verbose=0):
+class BitSets(Mapping):
+    '''
+    The result of a bit-vector analysis: {block: frozenset of variables} for
+    {block: bitmask}, bit i of a mask stands for the variable names[i].
+    A set is only decoded the first time it is accessed.
+    '''
+
+    def __init__(self, masks, names):
+        self.masks = masks
+        self.names = names
+        self.decoded = {}
+
+    def __getitem__(self, b):
+        if b not in self.decoded:
+            self.decoded[b] = frozenset(decode(self.masks[b], self.names))
+        return self.decoded[b]
+
+    def __iter__(self):
+        return iter(self.masks)
+
+    def __len__(self):
+        return len(self.masks)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+def decode(mask, names):
+    # the bits from the lowest to the highest
+    bits = bin(mask)[:1:-1]
+    res = []
+    pos = bits.find('1')
+    while pos != -1:
+        res.append(names[pos])
+        pos = bits.find('1', pos + 1)
+    return res
+
+
+class Analysis(object):
+    '''
+    A dataflow problem for 'solve': 'top' is the initial value of every
+    block, 'boundary' the input of the blocks without predecessors (without
+    successors for backward problems), 'meet' combines the outputs of the
+    predecessors and transfer(b, value) is the output of the block b.
+    'result' converts the solution into the values returned by 'solve'.
+    '''
+    backward = False
+    title = 'Dataflow analysis'
+
+    def top(self):
+        raise NotImplementedError
+
+    def boundary(self):
+        raise NotImplementedError
+
+    def meet(self, a, b):
+        raise NotImplementedError
+
+    def transfer(self, b, value):
+        raise NotImplementedError
+
+    def result(self, inb, outb):
+        return inb, outb
+
+    def format(self, value):  # pragma: no cover
+        return '{%s}' % ', '.join(str(el) for el in value)
+
+
+class BitVectorAnalysis(Analysis):
+    '''
+    A gen/kill problem on bitmasks (python ints), the subclasses number the
+    facts with 'bit' and fill 'gen' and 'notkilled' (per block):
+        transfer(b, value) = gen[b] | (value & notkilled[b])
+    The facts which hold on some path ('must' is False) are joined with the
+    union, the facts which hold on all paths with the intersection.
+    '''
+    must = False
+
+    def __init__(self, bbs):
+        self.index = {}
+        self.names = []
+        self.gen = [0] * len(bbs)
+        self.notkilled = [-1] * len(bbs)
+
+    def bit(self, fact):
+        if fact not in self.index:
+            self.index[fact] = 1 << len(self.names)
+            self.names.append(fact)
+        return self.index[fact]
+
+    def top(self):
+        return (1 << len(self.names)) - 1 if self.must else 0
+
+    def boundary(self):
+        return 0
+
+    def meet(self, a, b):
+        return a & b if self.must else a | b
+
+    def transfer(self, b, value):
+        return self.gen[b] | (value & self.notkilled[b])
+
+    def result(self, inb, outb):
+        return BitSets(inb, self.names), BitSets(outb, self.names)
+
+
+class Liveness(BitVectorAnalysis):
+    ''' the variables which are read before they are written on some path from a block,
+        the results of the ops in 'results' are written (see definition for the array accesses) '''
+    backward = True
+    title = 'Live variable analysis'
+    results = op_sets_result
+
+    def __init__(self, bbs):
+        super(Liveness, self).__init__(bbs)
+        for i, block in enumerate(bbs):
+            uevar, killed = 0, 0
+            for code in block:
+                op, arg1, arg2, result = code
+                op = simplify_op(op)
+                if op not in op_uses_values:
+                    continue
+                # 'pop' only defines its result (a parameter or the value returned by a call)
+                uses = [] if op == 'pop' else op_uses_values[op]
+                for arg in uses:
+                    if type(code[arg]) is str:
+                        uevar |= self.bit(code[arg]) & ~killed
+                if op in self.results:
+                    killed |= self.bit(result)
+            self.gen[i], self.notkilled[i] = uevar, ~killed
+
+    def format(self, value):  # pragma: no cover
+        return '{%s}' % ', '.join(value)
+
+
+def definition(code):
+    ''' the variable written by a three address code, None if there is none '''
+    op = simplify_op(code[0])
+    # op_sets_result has 'arr_acc', liveness doesn't kill the result of an array access
+    if op in op_sets_result or op == 'arr-acc':
+        return code[3]
+    return None
+
+
+def expression(code):
+    ''' the expression computed by a binary or unary operation: (op, arg1, arg2), None for the other codes '''
+    op, arg1, arg2, _ = code
+    if op in un_ops:
+        return (op, arg1, None)
+    if op in bin_ops:
+        if op in op_commutative and str(arg2) < str(arg1):
+            arg1, arg2 = arg2, arg1
+        return (op, arg1, arg2)
+    return None
+
+
+def format_expression(expr):  # pragma: no cover
+    op, arg1, arg2 = expr
+    if arg2 is None:
+        return '%s%s' % (op[1:], arg1)
+    return '%s %s %s' % (arg1, op, arg2)
+
+
+class ReachingDefinitions(BitVectorAnalysis):
+    ''' the definitions (variable, block, line) which reach a block without being overwritten '''
+    title = 'Reaching definitions'
+
+    def __init__(self, bbs):
+        super(ReachingDefinitions, self).__init__(bbs)
+        # all the definitions of a variable (the ones of the later blocks are killed as well)
+        defs = {}
+        for b, block in enumerate(bbs):
+            for line, code in enumerate(block):
+                var = definition(code)
+                if var is not None:
+                    defs[var] = defs.get(var, 0) | self.bit((var, b, line))
+        for b, block in enumerate(bbs):
+            gen, killed = 0, 0
+            for line, code in enumerate(block):
+                var = definition(code)
+                if var is not None:
+                    gen = (gen & ~defs[var]) | self.index[(var, b, line)]
+                    killed |= defs[var]
+            self.gen[b], self.notkilled[b] = gen, ~killed
+
+    def format(self, value):  # pragma: no cover
+        return '{%s}' % ', '.join('%s@%d:%d' % el for el in sorted(value))
+
+
+class ExpressionAnalysis(BitVectorAnalysis):
+    ''' numbers the expressions, users[var] are the expressions with var as an operand '''
+    must = True
+
+    def __init__(self, bbs):
+        super(ExpressionAnalysis, self).__init__(bbs)
+        self.users = {}
+        for block in bbs:
+            for code in block:
+                expr = expression(code)
+                if expr is None:
+                    continue
+                mask = self.bit(expr)
+                for arg in expr[1:]:
+                    if type(arg) is str:
+                        self.users[arg] = self.users.get(arg, 0) | mask
+
+    def format(self, value):  # pragma: no cover
+        return '{%s}' % ', '.join(format_expression(el) for el in value)
+
+
+class AvailableExpressions(ExpressionAnalysis):
+    ''' the expressions which are computed on every path to a block and not killed afterwards '''
+    title = 'Available expressions'
+
+    def __init__(self, bbs):
+        super(AvailableExpressions, self).__init__(bbs)
+        for b, block in enumerate(bbs):
+            gen, killed = 0, 0
+            for code in block:
+                expr = expression(code)
+                if expr is not None:
+                    gen |= self.index[expr]
+                var = definition(code)
+                if var is not None:
+                    # 'x = x + 1' kills its own expression
+                    gen &= ~self.users.get(var, 0)
+                    killed |= self.users.get(var, 0)
+            self.gen[b], self.notkilled[b] = gen, ~killed
+
+
+class VeryBusyExpressions(ExpressionAnalysis):
+    ''' the expressions which are computed on every path from a block before their operands change '''
+    backward = True
+    title = 'Very busy expressions'
+
+    def __init__(self, bbs):
+        super(VeryBusyExpressions, self).__init__(bbs)
+        for b, block in enumerate(bbs):
+            gen, killed = 0, 0
+            for code in reversed(block):
+                var = definition(code)
+                if var is not None:
+                    gen &= ~self.users.get(var, 0)
+                    killed |= self.users.get(var, 0)
+                expr = expression(code)
+                if expr is not None:
+                    gen |= self.index[expr]
+            self.gen[b], self.notkilled[b] = gen, ~killed
+
+
+class ConstantPropagation(Analysis):
+    '''
+    The values are {variable: constant} for the variables which have the same
+    constant value on all paths (None for the blocks which aren't reached yet),
+    a variable read before it is written isn't a constant. Only the variables
+    which are read in another block than the one writing them are propagated,
+    the values of the other ones (mostly temporaries) end with their block.
+    '''
+    title = 'Constant propagation'
+
+    def __init__(self, bbs):
+        self.bbs = bbs
+        self.nonlocal_vars = set()
+        for block in bbs:
+            defined = set()
+            for code in block:
+                op = simplify_op(code[0])
+                if op in op_uses_values and op != 'pop':
+                    self.nonlocal_vars |= set(code[arg] for arg in op_uses_values[op]
+                                              if type(code[arg]) is str and code[arg] not in defined)
+                var = definition(code)
+                if var is not None:
+                    defined.add(var)
+
+    def top(self):
+        return None
+
+    def boundary(self):
+        return {}
+
+    def meet(self, a, b):
+        if a is None or b is None:
+            return b if a is None else a
+        # 1 == 1.0, but an int and a float constant aren't the same
+        return {var: value for var, value in a.items()
+                if var in b and b[var] == value and type(b[var]) is type(value)}
+
+    def transfer(self, b, value):
+        if value is None:
+            return None
+        res = dict(value)
+        for code in self.bbs[b]:
+            var = definition(code)
+            if var is None:
+                continue
+            value = self.evaluate(code, res)
+            if value is None:
+                res.pop(var, None)
+            else:
+                res[var] = value
+        return {var: value for var, value in res.items() if var in self.nonlocal_vars}
+
+    @staticmethod
+    def evaluate(code, constants):
+        ''' the constant result of 'code' for the 'constants', None if it isn't constant '''
+        op, arg1, arg2, _ = code
+
+        def value(arg):
+            return constants.get(arg) if type(arg) is str else arg
+        if op == 'assign':
+            return value(arg1)
+        if op in bin_ops or op in un_ops:
+            args = [value(arg1)] if op in un_ops else [value(arg1), value(arg2)]
+            if any(not is_constant(arg) for arg in args):
+                return None
+            return fold_constant(op, *args)
+        # 'pop' (parameters and call results) and array accesses
+        return None
+
+    def format(self, value):  # pragma: no cover
+        if value is None:
+            return 'unreachable'
+        return '{%s}' % ', '.join('%s=%s' % el for el in sorted(value.items()))
+
+
+def solve(bbs, cfg, analysis, stats=None):
+    ''' solves the Analysis with the worklist algorithm, returns (inb, outb) as converted by analysis.result '''
+    inb, outb = worklist(bbs, cfg, analysis.top, analysis.transfer, analysis.backward, stats=stats,
+                         meet=analysis.meet, boundary=analysis.boundary)
+    return analysis.result(inb, outb)
+
+
+def liveness(bbs, cfg, verbose=0, stats=None):
+    ''' the variables are numbered once, the sets are bitmasks (python ints), 'stats' as for worklist '''
+    analysis = Liveness(bbs)
+    inb, outb = solve(bbs, cfg, analysis, stats)
+
+    if verbose > 0:  # pragma: no cover
+        printinout(bbs, inb, outb, analysis)
+    if verbose > 1:  # pragma: no cover
+        print('uevars: %s' % BitSets(dict(enumerate(analysis.gen)), analysis.names))
+        print('killed: %s' % BitSets({b: ~mask for b, mask in enumerate(analysis.notkilled)}, analysis.names))
+
+    return inb, outb
+
+
+def analyze(bbs, cfg, analysis, verbose=0, stats=None):
+    inb, outb = solve(bbs, cfg, analysis, stats)
+    if verbose > 0:  # pragma: no cover
+        printinout(bbs, inb, outb, analysis)
+    return inb, outb
+
+
+def reaching_definitions(bbs, cfg, verbose=0, stats=None):
+    ''' {block: frozenset of (variable, block, line)} at the begin and the end of every block '''
+    return analyze(bbs, cfg, ReachingDefinitions(bbs), verbose, stats)
+
+
+def available_expressions(bbs, cfg, verbose=0, stats=None):
+    ''' {block: frozenset of (op, arg1, arg2)} at the begin and the end of every block '''
+    return analyze(bbs, cfg, AvailableExpressions(bbs), verbose, stats)
+
+
+def very_busy_expressions(bbs, cfg, verbose=0, stats=None):
+    ''' {block: frozenset of (op, arg1, arg2)} at the end (inb) and the begin (outb) of every block '''
+    return analyze(bbs, cfg, VeryBusyExpressions(bbs), verbose, stats)
+
+
+def constant_propagation(bbs, cfg, verbose=0, stats=None):
+    ''' {block: {variable: constant}} (None if unreachable) at the begin and the end of every block '''
+    return analyze(bbs, cfg, ConstantPropagation(bbs), verbose, stats)
+
+
+def liveness_sets(bbs, cfg, stats=None):
+    ''' same as liveness with python sets (the reference for tests and util/dataflowbench.py) '''
     uevars = {i: set() for i in range(len(bbs))}
     killed = {i: set() for i in range(len(bbs))}
     for i, block in enumerate(bbs):
@@ -10,21 +388,14 @@ def liveness(bbs, cfg, verbose=0):
             op = simplify_op(op)
             if op not in op_uses_values:
                 continue
-            uevars[i] |= set([code[arg] for arg in op_uses_values[op] if type(code[arg]) is str]) - killed[i]
+            uses = [] if op == 'pop' else op_uses_values[op]
+            uevars[i] |= set([code[arg] for arg in uses if type(code[arg]) is str]) - killed[i]
             if op in op_sets_result:
                 killed[i].add(result)
 
     def transform(b, livein):
         return uevars[b] | (livein - killed[b])
-    inb, outb = worklist(bbs, cfg, lambda: set(), transform, backward=True)
-
-    if verbose > 0:  # pragma: no cover
-        printinout(bbs, inb, outb, True)
-    if verbose > 1:  # pragma: no cover
-        print('uevars: %s' % uevars)
-        print('killed: %s' % killed)
-
-    return inb, outb
+    return worklist(bbs, cfg, lambda: set(), transform, backward=True, stats=stats)
 
 
 def invertgraph(cfg):
@@ -35,46 +406,115 @@ def invertgraph(cfg):
     return pred
 
 
-def worklist(bbs, cfg, initer, transform, backward=False):
+def postorder(graph, roots, descending=False, visited=None):
+    ''' the nodes in depth first postorder, a search starts at every root which isn't visited yet,
+        the children of a node are visited in increasing (or decreasing) order
+        ('visited' can be shared by several calls, it is updated) '''
+    visited = set() if visited is None else visited
+    res = []
+    for root in roots:
+        if root in visited:
+            continue
+        visited.add(root)
+        # an explicit stack, the nested loops of generated code are deeper than the recursion limit
+        stack = [(root, iter(sorted(graph[root], reverse=descending)))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if child not in visited:
+                    visited.add(child)
+                    stack.append((child, iter(sorted(graph[child], reverse=descending))))
+                    break
+            else:
+                stack.pop()
+                res.append(node)
+    return res
+
+
+def worklist(bbs, cfg, initer, transform, backward=False, stats=None, meet=None, boundary=None):
+    '''
+    The blocks are taken from a priority queue in reverse postorder: of the cfg
+    for forward problems, of the inverted cfg (starting at the exits) for
+    backward problems. So a block is usually visited after all of its inputs,
+    only the back edges make the solver visit a loop again.
+    The successor which stays in the loop (the fall through block of a loop
+    header, the latch of a loop for the inverted cfg) is searched last, then
+    it directly follows its block and the loops are solved before the blocks
+    after them. With a dict as 'stats', stats['iterations'] is the number of
+    visited blocks.
+    Without 'meet' the input of a block is the union (|=) of its previous input
+    and the outputs of its predecessors, otherwise meet(a, b) combines the
+    outputs of the predecessors and the blocks without predecessors get
+    boundary() (initer() is the top of the lattice then).
+    '''
     inb = {i: initer() for i in range(len(bbs))}
     outb = {i: initer() for i in range(len(bbs))}
     pred = invertgraph(cfg)
+    if backward:
+        exits = [b for b in sorted(cfg) if not cfg[b]]
+        order = postorder(pred, exits + sorted(cfg))[::-1]
+    else:
+        order = postorder(cfg, sorted(cfg), descending=True)[::-1]
+    rank = {b: i for i, b in enumerate(order)}
     if backward:
         cfg, pred = pred, cfg
 
     def gatherinput(b):
+        if meet is not None:
+            if not pred[b]:
+                return boundary()
+            return reduce(meet, [outb[parent] for parent in pred[b]])
         res = initer()
         res |= inb[b]
         for parent in pred[b]:
             res |= outb[parent]
         return res
 
-    w = set([el for el in range(len(bbs))])
+    # the ranks of the queued blocks, sorted ranks are already a heap
+    w = list(range(len(order)))
+    queued = set(order)
+    iterations = 0
     while len(w) > 0:
-        b = w.pop()
+        b = order[heappop(w)]
+        queued.remove(b)
+        iterations += 1
         inb[b] = gatherinput(b)
         newoutb = transform(b, inb[b])
         if outb[b] != newoutb:
-            w |= cfg[b]
+            for succ in cfg[b]:
+                if succ not in queued:
+                    queued.add(succ)
+                    heappush(w, rank[succ])
         outb[b] = newoutb
 
+    if stats is not None:
+        stats['iterations'] = iterations
     return inb, outb
 
 
-def printinout(bbs, inb, outb, backward):  # pragma: no cover
-    print('\n' + ' Live variable analysis '.center(40, '#'))
+def printinout(bbs, inb, outb, analysis):  # pragma: no cover
+    print('\n' + (' %s ' % analysis.title).center(40, '#'))
     from .bb import printbbsyield
     for i, block in enumerate(printbbsyield(bbs)):
-        if not backward:
-            print('IN: {%s}' % ', '.join(inb[i]))
+        if not analysis.backward:
+            print('IN: %s' % analysis.format(inb[i]))
         else:
-            print('OUT: {%s}' % ', '.join(outb[i]))
-        if backward:
-            print('IN: {%s}' % ', '.join(inb[i]))
+            print('OUT: %s' % analysis.format(outb[i]))
+        if analysis.backward:
+            print('IN: %s' % analysis.format(inb[i]))
         else:
-            print('OUT: {%s}' % ', '.join(outb[i]))
+            print('OUT: %s' % analysis.format(outb[i]))
         print('\n')
 
+
+analyses = {
+    'liveness': liveness,
+    'reaching': reaching_definitions,
+    'available': available_expressions,
+    'busy': very_busy_expressions,
+    'constants': constant_propagation,
+}
+
 if __name__ == '__main__':
     import argparse
     from .parser import parsefile
@@ -84,6 +524,8 @@ if __name__ == '__main__':
     from .lvn import lvn
     parser = argparse.ArgumentParser()
     parser.add_argument("filename", help="The *.mc file to apply Data Flow Analysis to")
+    parser.add_argument('--analysis', '-a', choices=sorted(analyses), default='liveness',
+                        help="The analysis to run (default: liveness)")
     parser.add_argument('--verbose', '-v', action='count', default=0)
     args = parser.parse_args()
     bbs = threetobbs(
@@ -95,4 +537,6 @@ if __name__ == '__main__':
         verbose=args.verbose - 1)
     bbs = lvn(bbs, verbose=1)
     cfg = bbstocfg(bbs, verbose=1)
-    liveness(bbs, cfg, verbose=args.verbose + 1)
+    stats = {}
+    analyses[args.analysis](bbs, cfg, verbose=args.verbose + 1, stats=stats)
+    print('%d worklist iterations for %d blocks' % (stats['iterations'], len(bbs)))
@@ -0,0 +1,149 @@
+from .cfg import bbstocfg
+from .dataflow import ReachingDefinitions, solve, definition
+from .utils import op_uses_values, simplify_op, isvar
+
+# Dead code elimination by mark and sweep (Cytron, Ferrante, Rosen, Wegman,
+# Zadeck: "Efficiently Computing Static Single Assignment Form and the Control
+# Dependence Graph", on the reaching definitions instead of the SSA form):
+#   The codes with an effect are marked first: pushes, returns, jumps, calls,
+#   pops, labels, the array definitions and stores and the assignments to the
+#   variables of the global code and of 'main' (the last frame of the vm, the
+#   global code or 'main' without global code, is the result of the program,
+#   they escape; the functions run in frames of their own, their assignments
+#   to a global never change it). Then the definitions which reach a use in a
+#   marked code are marked, until nothing changes. The unmarked assignments
+#   and computations are deleted, their values never reach an effect, even if
+#   they are used by each other (like a counter which is only incremented in
+#   a loop).
+#
+#   Every 'jumpfalse' stays, the constant branches are folded by lvn and sccp.
+#   With lvn both passes alternate until a sweep removes nothing, lvn replaces
+#   uses by earlier names, which can leave definitions without uses.
+
+
+def escaping(bbs):
+    '''
+    the variables assigned in the global code (outside of 'function' ... 'end-fun') and in 'main', the
+    last frame of the vm is the result of the program
+    '''
+    res = set()
+    function = None
+    for block in bbs:
+        for code in block:
+            if code[0] in ['function', 'end-fun']:
+                function = code[3] if code[0] == 'function' else None
+            elif function in [None, 'main'] and isvar(definition(code)):
+                res.add(definition(code))
+    return res
+
+
+def removable(code, escaped):
+    ''' a computation or an assignment without other effects than its result '''
+    var = definition(code)
+    return var is not None and code[0] != 'pop' and var not in escaped
+
+
+def uses(code):
+    op = simplify_op(code[0])
+    if op == 'pop' or op not in op_uses_values:
+        return []
+    return [code[pos] for pos in op_uses_values[op] if type(code[pos]) is str]
+
+
+def mark(bbs, cfg, escaped):
+    ''' the (block, line) of the codes whose values reach an effect '''
+    analysis = ReachingDefinitions(bbs)
+    reachin, _ = solve(bbs, cfg, analysis)
+    # {variable: the bits of its definitions}
+    defmasks = {}
+    for name, bit in analysis.index.items():
+        defmasks[name[0]] = defmasks.get(name[0], 0) | bit
+
+    # the definitions which reach the uses of every code
+    reaching = {}
+    for b, block in enumerate(bbs):
+        last = {}
+        for line, code in enumerate(block):
+            defs = []
+            for var in uses(code):
+                if var in last:
+                    defs.append(last[var])
+                    continue
+                mask = reachin.masks[b] & defmasks.get(var, 0)
+                while mask:
+                    bit = mask & -mask
+                    defs.append(analysis.names[bit.bit_length() - 1][1:])
+                    mask ^= bit
+            reaching[(b, line)] = defs
+            var = definition(code)
+            if var is not None:
+                last[var] = (b, line)
+
+    todo = [(b, line) for b, block in enumerate(bbs) for line, code in enumerate(block)
+            if not removable(code, escaped)]
+    marked = set(todo)
+    while todo:
+        for site in reaching[todo.pop()]:
+            if site not in marked:
+                marked.add(site)
+                todo.append(site)
+    return marked
+
+
+def sweep(bbs, cfg=None):
+    ''' deletes the dead codes of 'bbs' in place, returns their number '''
+    cfg = bbstocfg(bbs) if cfg is None else cfg
+    escaped = escaping(bbs)
+    marked = mark(bbs, cfg, escaped)
+    removed = 0
+    for b, block in enumerate(bbs):
+        newblock = [code for line, code in enumerate(block) if (b, line) in marked or not removable(code, escaped)]
+        removed += len(block) - len(newblock)
+        block[:] = newblock
+    return removed
+
+
+def dce(bbs, verbose=0, stats=None, uselvn=False):
+    '''
+    returns new blocks without the dead codes, with 'uselvn' lvn and the dead
+    code elimination alternate until a round removes nothing. 'stats' gets the
+    number of removed codes and of rounds
+    '''
+    from .lvn import lvn
+    stats = {} if stats is None else stats
+    stats.update({'removed': 0, 'rounds': 0})
+    res = [[list(code) for code in block] for block in bbs]
+    while True:
+        before = [[list(code) for code in block] for block in res]
+        if uselvn:
+            res = lvn(res)
+        removed = sweep(res)
+        stats['removed'] += removed
+        stats['rounds'] += 1
+        res = [block for block in res if block]
+        # without removed codes the next lvn has nothing new to replace
+        if not uselvn or not removed or res == before:
+            break
+
+    if verbose > 0:  # pragma: no cover
+        from .bb import printbbs
+        print('\n' + ' Dead Code Elimination '.center(40, '#'))
+        printbbs(res)
+        print('%(removed)d codes removed in %(rounds)d rounds' % stats)
+    return res
+
+
+if __name__ == '__main__':
+    import argparse
+    from .parser import parsefile
+    from .three import asttothree
+    from .bb import threetobbs
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename", help="The *.mc file to optimize with dead code elimination")
+    parser.add_argument('--lvn', '-l', action='count', default=False,
+                        help="Alternate with local value numbering until nothing is removed")
+    parser.add_argument('--verbose', '-v', action='count', default=0)
+    args = parser.parse_args()
+    bbs = threetobbs(asttothree(parsefile(args.filename, verbose=args.verbose - 2), verbose=args.verbose - 1),
+                     verbose=1)
+    dce(bbs, verbose=1, uselvn=args.lvn)
@@ -0,0 +1,236 @@
+from .dataflow import postorder, invertgraph
+from .utils import function_ranges
+
+# Dominance and loops on the cfg of bbstocfg:
+#   A block d dominates b if every path from the entry of its function to b
+#   passes through d. The entries are the first blocks of the functions (and
+#   of the global code), the blocks which can't be reached from an entry
+#   (e.g. global code after a function definition) are entries of their own.
+#   All the entries hang below a virtual root, so the code of all functions
+#   is handled in one go.
+#
+#   An edge t -> h is a back edge if h dominates t, its natural loop is h and
+#   the blocks which reach t without passing h. The loops with the same
+#   header are merged. Edges which jump back into a loop without passing its
+#   header (irreducible control flow) are no back edges and form no loop.
+
+
+def function_entries(bbs):
+    return [start for _, start, _ in function_ranges(bbs)]
+
+
+def immediate_dominators(cfg, entries):
+    '''
+    {block: immediate dominator}, None for the entries (Cooper, Harvey,
+    Kennedy: "A Simple, Fast Dominance Algorithm"). Returns (idom, roots),
+    roots are the entries and the blocks which aren't reachable from them.
+    '''
+    visited = set()
+    order = []
+    roots = []
+    for root in list(entries) + sorted(cfg):
+        if root not in visited:
+            roots.append(root)
+            order += postorder(cfg, [root], visited=visited)
+    number = {b: i for i, b in enumerate(order)}
+    pred = invertgraph(cfg)
+    preds = [[number[parent] for parent in pred[b]] for b in order]
+
+    # the postorder numbers of the dominators, the virtual root is len(order)
+    virtual = len(order)
+    doms = [None] * len(order) + [virtual]
+    for root in roots:
+        doms[number[root]] = virtual
+
+    def intersect(a, b):
+        while a != b:
+            while a < b:
+                a = doms[a]
+            while b < a:
+                b = doms[b]
+        return a
+
+    isroot = set(number[root] for root in roots)
+    changed = True
+    while changed:
+        changed = False
+        # reverse postorder, the parent in the search tree is processed first
+        for node in range(len(order) - 1, -1, -1):
+            if node in isroot:
+                continue
+            new = None
+            for parent in preds[node]:
+                if doms[parent] is not None:
+                    new = parent if new is None else intersect(parent, new)
+            if doms[node] != new:
+                doms[node] = new
+                changed = True
+    idom = {b: None if doms[number[b]] == virtual else order[doms[number[b]]] for b in order}
+    return idom, roots
+
+
+def dominator_tree(idom):
+    ''' {block: [the blocks it immediately dominates]} '''
+    tree = {b: [] for b in idom}
+    for b in sorted(idom):
+        if idom[b] is not None:
+            tree[idom[b]].append(b)
+    return tree
+
+
+def dominance_frontiers(cfg, idom):
+    ''' {block: the blocks where its dominance ends}, the joins of its paths with the paths of other blocks '''
+    frontiers = {b: set() for b in cfg}
+    pred = invertgraph(cfg)
+    for b in cfg:
+        for parent in pred[b]:
+            runner = parent
+            while runner is not None and runner != idom[b]:
+                frontiers[runner].add(b)
+                runner = idom[runner]
+    return frontiers
+
+
+class Loop(object):
+    ''' a natural loop: 'blocks' includes the header, the latches are the sources of the back edges '''
+
+    def __init__(self, header):
+        self.header = header
+        self.latches = set()
+        self.blocks = set([header])
+        self.parent = None
+        self.children = []
+        self.depth = 1
+
+    def __repr__(self):
+        return 'Loop(header=%d, blocks=%s, depth=%d)' % (self.header, sorted(self.blocks), self.depth)
+
+
+class Dominance(object):
+    '''
+    The dominator tree, the dominance frontiers and the loop nesting forest of
+    a cfg, 'loops' are sorted from the outermost to the innermost ones and
+    'depth' is the number of loops around every block.
+    '''
+
+    def __init__(self, bbs, cfg):
+        self.idom, self.roots = immediate_dominators(cfg, function_entries(bbs))
+        # the joins of the code of several roots are only dominated by the virtual root
+        self.roots += [b for b in sorted(self.idom) if self.idom[b] is None and b not in self.roots]
+        self.tree = dominator_tree(self.idom)
+        self.frontiers = dominance_frontiers(cfg, self.idom)
+        self.number_tree()
+        self.backedges = sorted((tail, head) for tail in cfg for head in cfg[tail] if self.dominates(head, tail))
+        self.find_loops(cfg)
+
+    def number_tree(self):
+        ''' preorder and postorder numbers of the dominator tree, for a constant time 'dominates' '''
+        self.pre = {}
+        self.post = {}
+        counter = 0
+        for root in self.roots:
+            stack = [(root, False)]
+            while stack:
+                b, done = stack.pop()
+                counter += 1
+                if done:
+                    self.post[b] = counter
+                    continue
+                self.pre[b] = counter
+                stack.append((b, True))
+                stack += [(child, False) for child in reversed(self.tree[b])]
+
+    def dominates(self, a, b):
+        ''' True if a dominates b (every block dominates itself) '''
+        return self.pre[a] <= self.pre[b] and self.post[b] <= self.post[a]
+
+    def find_loops(self, cfg):
+        pred = invertgraph(cfg)
+        loops = {}
+        for tail, head in self.backedges:
+            loop = loops.setdefault(head, Loop(head))
+            loop.latches.add(tail)
+            # the blocks which reach the latch without passing the header
+            todo = [tail]
+            while todo:
+                b = todo.pop()
+                if b not in loop.blocks:
+                    loop.blocks.add(b)
+                    todo += pred[b]
+
+        # the larger loops first, a loop's parent is the innermost larger loop around its header
+        self.loops = sorted(loops.values(), key=lambda loop: (-len(loop.blocks), loop.header))
+        self.innermost = {}
+        for loop in self.loops:
+            loop.parent = self.innermost.get(loop.header)
+            if loop.parent is not None:
+                loop.parent.children.append(loop)
+                loop.depth = loop.parent.depth + 1
+            for b in loop.blocks:
+                self.innermost[b] = loop
+        self.depth = {b: self.innermost[b].depth if b in self.innermost else 0 for b in cfg}
+
+    def loop_of(self, b):
+        ''' the innermost loop around the block b, None if it isn't in a loop '''
+        return self.innermost.get(b)
+
+
+def dominance(bbs, cfg, verbose=0):
+    res = Dominance(bbs, cfg)
+    if verbose > 0:  # pragma: no cover
+        printdominance(res)
+    return res
+
+
+def printdominance(dom):  # pragma: no cover
+    print('\n' + ' Dominator tree '.center(40, '#'))
+
+    def printtree(b, indent):
+        print('\t' * indent + str(b))
+        for child in dom.tree[b]:
+            printtree(child, indent + 1)
+    for root in dom.roots:
+        printtree(root, 0)
+    print('\n' + ' Dominance frontiers '.center(40, '#'))
+    for b in sorted(dom.frontiers):
+        print('%d\t->\t%s' % (b, ', '.join(str(el) for el in sorted(dom.frontiers[b]))))
+    print('\n' + ' Loops '.center(40, '#'))
+    for loop in dom.loops:
+        print('\t' * (loop.depth - 1) + 'header %d, latches %s, blocks %s' % (
+            loop.header, sorted(loop.latches), sorted(loop.blocks)))
+
+
+if __name__ == '__main__':
+    import argparse
+    from .parser import parsefile
+    from .three import asttothree
+    from .bb import threetobbs
+    from .cfg import bbstocfg
+    from .lvn import lvn
+    from .dce import dce
+    from .licm import licm
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename", help="The *.mc file to compute the dominators and loops of")
+    parser.add_argument('--lvn', '-l', action='count', default=False)
+    parser.add_argument('--dce', action='count', default=False,
+                        help="Remove the dead code (alternating with lvn until a fixpoint with --lvn)")
+    parser.add_argument('--licm', action='count', default=False,
+                        help="Hoist the loop-invariant code into preheaders of the loops")
+    parser.add_argument('--cache', '-c', nargs='?', const='.mccache', default=None,
+                        help="Reuse the compiled stages of unchanged files from this cache directory")
+    parser.add_argument('--verbose', '-v', action='count', default=0)
+    args = parser.parse_args()
+    if args.cache is not None:
+        from .cache import CompilationCache, CachedPipeline
+        printdominance(CachedPipeline(args.filename, CompilationCache(args.cache, verbose=args.verbose),
+                                      args.lvn, usedce=args.dce, uselicm=args.licm).dominance())
+    else:
+        bbs = threetobbs(asttothree(parsefile(args.filename, verbose=args.verbose - 2), verbose=args.verbose - 1),
+                         verbose=1)
+        if args.lvn:
+            bbs = lvn(bbs, verbose=1)
+        if args.dce:
+            bbs = dce(bbs, verbose=1, uselvn=args.lvn)
+        if args.licm:
+            bbs = licm(bbs, verbose=1)
+        dominance(bbs, bbstocfg(bbs, verbose=1), verbose=1)
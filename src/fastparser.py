@@ -0,0 +1,309 @@
+import re
+from .parser import ArrayDef, ArrayExp, FunDef, RetStmt, IfStmt, WhileStmt, ForStmt, DeclStmt, CompStmt, FunCall, BinOp, UnaOp, Literal, Variable
+
+# same terminals as 'mcgrammar', longest operators first
+token_spec = re.compile(
+    r'''
+    (?P<ws>\s+)
+    |(?P<float>\d+\.\d*)
+    |(?P<int>\d+)
+    |(?P<name>[a-zA-Z_][a-zA-Z_0-9]*)
+    |(?P<op>==|!=|<=|>=|[-+*/%<>=!(){}\[\];,])
+    ''', re.VERBOSE)
+
+types = ('int', 'float')
+binops = frozenset(['+', '-', '*', '/', '%', '==', '!=', '<=', '>=', '<', '>', '='])
+unops = frozenset(['-', '!'])
+
+# 'mcgrammar' doesn't express precedence (see the TODO in parser.py):
+# every binary operator binds equally and associates to the right,
+# i.e. 'a - b * c' => (- a (* b c)).
+# 'RecursiveDescentParser.expression' mirrors this, so both backends emit the same AST.
+
+
+class ParseException(Exception):
+    pass
+
+
+def tokenize(stringcode):
+    ''' returns the list of (kind, text, pos) tuples of the source code
+        (whitespace is dropped), kind is in ['float', 'int', 'name', 'op'] '''
+    tokens = []
+    pos = 0
+    end = len(stringcode)
+    match = token_spec.match
+    while pos < end:
+        m = match(stringcode, pos)
+        if m is None:
+            raise ParseException('Unexpected character %r at line %d' %
+                                 (stringcode[pos], stringcode.count('\n', 0, pos) + 1))
+        kind = m.lastgroup
+        if kind != 'ws':
+            tokens.append((kind, m.group(kind), pos))
+        pos = m.end()
+    tokens.append(('eof', '', end))
+    return tokens
+
+
+class RecursiveDescentParser(object):
+    ''' builds the AST namedtuples of parser.py directly from the token list,
+        every method corresponds to the rule with the same name in 'mcgrammar' '''
+
+    def __init__(self, stringcode):
+        self.stringcode = stringcode
+        self.tokens = tokenize(stringcode)
+        self.pos = 0
+
+    def error(self, expected):
+        _, text, pos = self.tokens[self.pos]
+        line = self.stringcode.count('\n', 0, pos) + 1
+        raise ParseException('Expected %s but found "%s" at line %d' % (expected, text, line))
+
+    def peek(self, offset=0):
+        return self.tokens[min(self.pos + offset, len(self.tokens) - 1)][1]
+
+    def next(self):
+        text = self.tokens[self.pos][1]
+        self.pos += 1
+        return text
+
+    def expect(self, text):
+        if self.tokens[self.pos][1] != text or self.tokens[self.pos][0] not in ('op', 'name'):
+            self.error('"%s"' % text)
+        self.pos += 1
+
+    def identifier(self):
+        kind, text, _ = self.tokens[self.pos]
+        if kind != 'name':
+            self.error('an identifier')
+        self.pos += 1
+        return text
+
+    def parse(self):
+        ast = self.statement()
+        if self.tokens[self.pos][0] != 'eof':
+            self.error('end of input')
+        return ast
+
+    def statement(self):
+        kind, text, _ = self.tokens[self.pos]
+        if kind == 'name':
+            if text in types or text == 'void':
+                nexttoken = self.tokens[self.pos + 2][1] if self.tokens[self.pos + 1][0] == 'name' else None
+                if nexttoken == '[' and text != 'void':
+                    return self.array_def()
+                if nexttoken == '(':
+                    return self.fun_def()
+                if text != 'void':
+                    return self.decl_stmt()
+            elif text == 'return':
+                return self.return_stmt()
+            elif text == 'if':
+                return self.if_stmt()
+            elif text == 'while':
+                return self.while_stmt()
+            elif text == 'for':
+                return self.for_stmt()
+        elif text == '{':
+            return self.compound_stmt()
+        return self.expr_stmt()
+
+    def array_def(self):
+        vartype = self.next()
+        name = self.identifier()
+        self.expect('[')
+        size = self.expression()
+        self.expect(']')
+        self.expect(';')
+        return ArrayDef(vartype, name, size)
+
+    def fun_def(self):
+        ret_type = self.next()
+        name = self.identifier()
+        self.expect('(')
+        params = []
+        if self.peek() != ')':
+            params.append(self.param())
+            while self.peek() == ',':
+                self.pos += 1
+                params.append(self.param())
+        self.expect(')')
+        if self.peek() != '{':
+            self.error('"{"')
+        return FunDef(ret_type, name, params, self.compound_stmt())
+
+    def param(self):
+        paramtype = self.type()
+        return (paramtype, self.identifier())
+
+    def type(self):
+        if self.peek() not in types:
+            self.error('a type')
+        return self.next()
+
+    def return_stmt(self):
+        self.pos += 1
+        expression = None
+        if self.peek() != ';':
+            expression = self.expression()
+        self.expect(';')
+        return RetStmt(expression)
+
+    def if_stmt(self):
+        self.pos += 1
+        expression = self.paren_expr()
+        if_stmt = self.statement()
+        else_stmt = None
+        if self.peek() == 'else':
+            self.pos += 1
+            else_stmt = self.statement()
+        return IfStmt(expression, if_stmt, else_stmt)
+
+    def while_stmt(self):
+        self.pos += 1
+        expression = self.paren_expr()
+        return WhileStmt(expression, self.statement())
+
+    def for_stmt(self):
+        self.pos += 1
+        self.expect('(')
+        if self.peek() in types:
+            initexpr = self.decl_stmt()
+        else:
+            initexpr = self.expr_stmt()
+        conditionexpr = self.expression()
+        self.expect(';')
+        afterexpr = self.expression()
+        self.expect(')')
+        return ForStmt(initexpr, conditionexpr, afterexpr, self.statement())
+
+    def decl_stmt(self):
+        vartype = self.type()
+        variable = self.identifier()
+        expression = None
+        if self.peek() == '=':
+            self.pos += 1
+            expression = self.expression()
+        self.expect(';')
+        return DeclStmt(vartype, variable, expression)
+
+    def compound_stmt(self):
+        self.expect('{')
+        stmts = []
+        while self.peek() != '}':
+            if self.tokens[self.pos][0] == 'eof':
+                self.error('"}"')
+            stmt = self.statement()
+            # empty compound statements vanish like in the parsimonious AST
+            if stmt is not None:
+                stmts.append(stmt)
+        self.pos += 1
+        if len(stmts) == 0:
+            return None
+        return CompStmt(stmts)
+
+    def expr_stmt(self):
+        expression = self.expression()
+        self.expect(';')
+        return expression
+
+    def expression(self):
+        ''' collects 'single_expr (bin_op single_expr)*' iteratively and folds
+            it from the right (no recursion depth limit on long chains) '''
+        operands = [self.single_expr()]
+        operations = []
+        while self.tokens[self.pos][0] == 'op' and self.peek() in binops:
+            operations.append(self.next())
+            operands.append(self.single_expr())
+        ast = operands[-1]
+        for i in range(len(operations) - 1, -1, -1):
+            ast = BinOp(operations[i], operands[i], ast)
+        return ast
+
+    def single_expr(self):
+        kind, text, _ = self.tokens[self.pos]
+        if kind == 'name':
+            nexttoken = self.peek(1)
+            if nexttoken == '(':
+                return self.call_expr()
+            if nexttoken == '[':
+                return self.array_exp()
+            self.pos += 1
+            return Variable(text)
+        if kind == 'int':
+            self.pos += 1
+            return Literal('int', int(text))
+        if kind == 'float':
+            self.pos += 1
+            return Literal('float', float(text))
+        if text == '(':
+            return self.paren_expr()
+        if text in unops:
+            self.pos += 1
+            return UnaOp('u' + text, self.expression())
+        self.error('an expression')
+
+    def call_expr(self):
+        name = self.next()
+        self.pos += 1
+        args = []
+        if self.peek() != ')':
+            args.append(self.expression())
+            while self.peek() == ',':
+                self.pos += 1
+                args.append(self.expression())
+        self.expect(')')
+        return FunCall(name, args)
+
+    def array_exp(self):
+        name = self.next()
+        self.pos += 1
+        expression = self.expression()
+        self.expect(']')
+        return ArrayExp(name, expression)
+
+    def paren_expr(self):
+        self.expect('(')
+        expression = self.expression()
+        self.expect(')')
+        return expression
+
+
+def fastparse(stringcode):
+    return RecursiveDescentParser(stringcode).parse()
+
+
+def benchmark(fnames, repeat=10):  # pragma: no cover
+    ''' returns the throughput of both parser backends in lines/second '''
+    import timeit
+    from .parser import mcgrammar, ASTFormatter
+    sources = []
+    for fname in fnames:
+        with open(fname, 'r') as mcfile:
+            source = '{\n' + mcfile.read()[:-1] + '\n}'
+        try:
+            mcgrammar.parse(source)
+        except Exception:
+            print('Skipping \'%s\' (not accepted by the grammar)' % fname)
+            continue
+        sources.append(source)
+    lines = sum(source.count('\n') + 1 for source in sources)
+    backends = [
+        ('parsimonious', lambda code: ASTFormatter().visit(mcgrammar.parse(code))),
+        ('fast', fastparse),
+    ]
+    results = {}
+    for name, parsefun in backends:
+        seconds = min(timeit.repeat(lambda: [parsefun(source) for source in sources], number=1, repeat=repeat))
+        results[name] = lines / seconds
+    return results
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filenames", nargs='+', help="The *.mc files to parse with both backends")
+    parser.add_argument('--repeat', '-r', type=int, default=10)
+    args = parser.parse_args()
+    print('\n' + ' Parser throughput '.center(40, '#'))
+    for name, linespersec in benchmark(args.filenames, args.repeat).items():
+        print(name.ljust(15) + '%12.0f lines/s' % linespersec)
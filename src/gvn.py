@@ -0,0 +1,169 @@
+from .cfg import bbstocfg
+from .dataflow import definition
+from .dominators import Dominance
+from .ssa import tossa, fromssa, uses, basename
+from .utils import bin_ops, un_ops, op_commutative, isvar, function_ranges
+
+# Global value numbering along the dominator tree (Briggs, Cooper, Simpson:
+# "Value Numbering", the dominator-based DVNT) on the SSA form:
+#   Every SSA name has one definition, so an expression computed in a block is
+#   available in all the blocks it dominates. The blocks are visited in a
+#   preorder walk of the dominator tree, the table of the expressions
+#   {(op, value numbers of the operands): name} of a block is visible to its
+#   subtree and dropped afterwards. The operands of the commutative operations
+#   are sorted like in lvn.
+#
+#   A redundant computation of a temporary is deleted and its uses read the
+#   earlier name, a variable gets a copy of the earlier name. A variable is only
+#   reused if it has no other version (a new assignment could end its value
+#   while a later use still needs it). Array accesses, calls and parameters
+#   aren't numbered.
+
+
+def constant_key(arg):
+    ''' 1 and 1.0 are different values '''
+    return arg if type(arg) is str else (type(arg).__name__, arg)
+
+
+class GlobalValueNumbering(object):
+    '''
+    Numbers the SSA blocks 'bbs' in place, 'eliminated' is the number of
+    removed (or copied) computations of every block.
+    '''
+
+    def __init__(self, bbs, cfg, dom):
+        self.bbs = bbs
+        self.cfg = cfg
+        self.dom = dom
+        versions = {}
+        for block in bbs:
+            for code in block:
+                var = code[3] if code[0] == 'phi' else definition(code)
+                if var is not None:
+                    versions[basename(var)] = versions.get(basename(var), 0) + 1
+        # the variables which can hold a value for the later blocks
+        self.single = set(base for base, count in versions.items() if count == 1)
+        # {name: its value number}, the names which aren't numbered are their own number
+        self.numbers = {}
+        # {removed temporary: the name with its value}
+        self.replaced = {}
+        self.eliminated = [0] * len(bbs)
+        for root in dom.roots:
+            self.walk(root)
+        # the phis read the values at the end of their predecessors, which may come later in the walk
+        for block in bbs:
+            for code in block:
+                if code[0] == 'phi':
+                    code[1] = {pred: self.replace(value) for pred, value in code[1].items()}
+
+    def number(self, arg):
+        return self.numbers.get(arg, arg) if type(arg) is str else constant_key(arg)
+
+    def replace(self, arg):
+        return self.replaced.get(arg, arg) if type(arg) is str else arg
+
+    def reusable(self, name):
+        return not isvar(basename(name)) or basename(name) in self.single
+
+    def key(self, b, code):
+        ''' the value of a code for the table, None if it isn't numbered '''
+        op = code[0]
+        if op == 'phi':
+            # the same values from the same predecessors
+            return ('phi', b) + tuple(sorted((pred, str(self.number(value))) for pred, value in code[1].items()))
+        if op in bin_ops or op in un_ops:
+            args = [self.number(code[pos]) for pos in uses(code)]
+            if op in op_commutative:
+                args.sort(key=lambda x: str(x))
+            return (op,) + tuple(args)
+        return None
+
+    def walk(self, root):
+        table = {}
+        todo = [(root, None)]
+        while todo:
+            b, added = todo.pop()
+            if added is not None:
+                # the entries of the block end with its subtree
+                for key, previous in reversed(added):
+                    if previous is None:
+                        del table[key]
+                    else:
+                        table[key] = previous
+                continue
+            added = []
+            block = []
+            for code in self.bbs[b]:
+                if code[0] != 'phi':
+                    for pos in uses(code):
+                        code[pos] = self.replace(code[pos])
+                if code[0] == 'assign' and type(code[1]) is str:
+                    self.numbers[code[3]] = self.number(code[1])
+                key = self.key(b, code)
+                if key is None:
+                    block.append(code)
+                    continue
+                leader = table.get(key)
+                if leader is not None:
+                    self.numbers[code[3]] = self.number(leader)
+                if leader is None or not self.reusable(leader):
+                    if self.reusable(code[3]) or leader is None:
+                        added.append((key, leader))
+                        table[key] = code[3]
+                    block.append(code)
+                    continue
+                self.eliminated[b] += 1
+                if isvar(basename(code[3])):
+                    block.append(['assign', leader, None, code[3]])
+                else:
+                    self.replaced[code[3]] = leader
+            self.bbs[b][:] = block
+            todo.append((b, added))
+            todo += [(child, None) for child in reversed(self.dom.tree[b])]
+
+
+def gvn(bbs, cfg=None, verbose=0, stats=None):
+    '''
+    returns new blocks without the computations which are available from a
+    dominating block, 'stats' gets the number of eliminated computations
+    of every function ({function name: count})
+    '''
+    cfg = bbstocfg(bbs) if cfg is None else cfg
+    dom = Dominance(bbs, cfg)
+    code = tossa(bbs, cfg, dom)
+    numbering = GlobalValueNumbering(code, cfg, dom)
+    stats = {} if stats is None else stats
+    for fun, start, end in function_ranges(bbs):
+        stats[fun] = sum(numbering.eliminated[start:end])
+    res = [block for block in fromssa(code, cfg) if block]
+
+    if verbose > 0:  # pragma: no cover
+        from .bb import printbbs
+        print('\n' + ' Global Value Numbering '.center(40, '#'))
+        printbbs(res)
+        for fun, count in stats.items():
+            print('%-20s%6d eliminated' % (fun, count))
+    return res
+
+
+if __name__ == '__main__':
+    import argparse
+    from .parser import parsefile
+    from .three import asttothree
+    from .bb import threetobbs
+    from .lvn import lvn
+    from .dce import dce
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename", help="The *.mc file to optimize with global value numbering")
+    parser.add_argument('--lvn', '-l', action='count', default=False)
+    parser.add_argument('--dce', action='count', default=False,
+                        help="Remove the dead code (alternating with lvn until a fixpoint with --lvn)")
+    parser.add_argument('--verbose', '-v', action='count', default=0)
+    args = parser.parse_args()
+    bbs = threetobbs(asttothree(parsefile(args.filename, verbose=args.verbose - 2), verbose=args.verbose - 1),
+                     verbose=1)
+    if args.lvn:
+        bbs = lvn(bbs, verbose=1)
+    if args.dce:
+        bbs = dce(bbs, verbose=1, uselvn=args.lvn)
+    gvn(bbs, verbose=1)
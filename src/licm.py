@@ -0,0 +1,212 @@
+from itertools import count
+from .cfg import bbstocfg
+from .dataflow import solve, definition
+from .dominators import Dominance
+from .dce import escaping
+from .ssa import ValueLiveness, uses
+from .utils import bin_ops, un_ops, isvar
+
+# Loop-invariant code motion (Aho, Lam, Sethi, Ullman: "Compilers", 9.5.2) on
+# the natural loops of dominators.Dominance, the innermost loops first:
+#   A computation, a copy or an array access is invariant if its operands are
+#   constants, have no definition in the loop or only an invariant one which is
+#   hoisted before it. It moves to a preheader, a new block which falls through
+#   to the header and takes the jumps from outside of the loop, if
+#     * its result has no other definition in the loop and isn't live at the
+#       header (every use in the loop reads this definition),
+#     * its block dominates every exit of the loop or it can't fail (no array
+#       access, no division by a variable), the result isn't live after the
+#       loop and doesn't escape (it may be computed although the loop body
+#       never runs),
+#     * an array access reads an array without stores or a declaration in
+#       the loop,
+#     * with a call in the loop, it neither reads nor writes a global
+#       variable or an array, the callee could change or read them.
+#   A 'return' leaves the loop too. The preheader of an outer loop gets the
+#   hoisted codes of the preheaders of its inner loops which are invariant
+#   for it.
+#
+#   A temporary lives in one block (lvn deletes the definitions without a use
+#   in their block), a hoisted one which is still used in the loop becomes a
+#   new variable '.l<n>', the vm leaves it out of the result like the
+#   temporaries. A temporary which is live after the loop stays.
+#
+#   A preheader shifts the later blocks, the cfg and the loops are recomputed
+#   after every loop.
+
+hoistable = bin_ops + un_ops + ['assign', 'arr-acc']
+
+
+def global_variables(bbs):
+    ''' the variables and arrays defined in the global code (outside of 'function' ... 'end-fun') '''
+    res = set()
+    function = None
+    for block in bbs:
+        for code in block:
+            if code[0] in ['function', 'end-fun']:
+                function = code[3] if code[0] == 'function' else None
+            elif function is None and code[0] == 'arr-def':
+                res.add(code[2])
+            elif function is None and isvar(definition(code)):
+                res.add(definition(code))
+    return res
+
+
+def trapping(code):
+    ''' an array access or a division which can fail at runtime '''
+    if code[0] == 'arr-acc':
+        return True
+    return code[0] in ['/', '%'] and (type(code[2]) is str or code[2] == 0)
+
+
+def newlabel(bbs):
+    ''' a label after the ones of three.py '''
+    numbers = [int(code[3][1:]) for block in bbs for code in block
+               if code[0] == 'label' and code[3][:1] == 'L' and code[3][1:].isdigit()]
+    return 'L%d' % (max(numbers) + 1 if numbers else 0)
+
+
+def invariants(bbs, cfg, dom, loop, globs, escaped):
+    ''' the (block, line) of the codes of 'loop' which can be hoisted, in the order of the preheader '''
+    blocks = sorted(loop.blocks)
+    codes = [(b, line) for b in blocks for line in range(len(bbs[b]))]
+    # {variable: the places of its definitions in the loop}
+    defs = {}
+    for b, line in codes:
+        var = definition(bbs[b][line])
+        if var is not None:
+            defs.setdefault(var, []).append((b, line))
+    stored = set(code[3] if code[0] == 'arr-ass' else code[2]
+                 for b in blocks for code in bbs[b] if code[0] in ['arr-ass', 'arr-def'])
+    calls = any(code[0] == 'call' for b in blocks for code in bbs[b])
+    exits = [b for b in blocks if cfg[b] - loop.blocks or any(code[0] == 'return' for code in bbs[b])]
+    targets = set(succ for b in exits for succ in cfg[b] - loop.blocks)
+    _, livein = solve(bbs, cfg, ValueLiveness(bbs))
+
+    def safe(b, code):
+        var = code[3]
+        if len(defs[var]) != 1 or var in livein[loop.header] or (calls and var in globs):
+            return False
+        if not isvar(var) and any(var in livein[t] for t in targets):
+            return False
+        if code[0] == 'arr-acc' and (code[2] in stored or calls):
+            return False
+        if exits and all(dom.dominates(b, exit) for exit in exits):
+            return True
+        return not trapping(code) and var not in escaped and not any(var in livein[t] for t in targets)
+
+    hoisted = []
+    done = set()
+    changed = True
+    while changed:
+        changed = False
+        for b, line in codes:
+            code = bbs[b][line]
+            if (b, line) in done or code[0] not in hoistable:
+                continue
+            args = [code[pos] for pos in uses(code) if type(code[pos]) is str]
+            if any(calls and arg in globs or any(site not in done for site in defs.get(arg, [])) for arg in args):
+                continue
+            if safe(b, code):
+                hoisted.append((b, line))
+                done.add((b, line))
+                changed = True
+    return hoisted
+
+
+def rename_temporaries(bbs, loop, codes, names):
+    ''' the hoisted temporaries 'codes' which are still used in 'loop' get the next of the new 'names' '''
+    rest = [code for b in loop.blocks for code in bbs[b]]
+    used = set(code[pos] for code in rest for pos in uses(code))
+    renamed = {code[3]: '.l%d' % next(names) for code in codes if not isvar(code[3]) and code[3] in used}
+    for code in codes + rest:
+        for pos in uses(code):
+            if type(code[pos]) is str:
+                code[pos] = renamed.get(code[pos], code[pos])
+    for code in codes:
+        code[3] = renamed.get(code[3], code[3])
+
+
+def preheader(bbs, cfg, loop, codes):
+    ''' inserts the block with 'codes' before the header of 'loop', the jumps from outside of the loop go to it '''
+    header = loop.header
+    label = bbs[header][0][3]
+    block = list(codes)
+    jumps = [code for b in cfg if b not in loop.blocks for code in bbs[b]
+             if code[0] in ['jump', 'jumpfalse'] and code[3] == label]
+    if jumps:
+        block.insert(0, ['label', None, None, newlabel(bbs)])
+        for code in jumps:
+            code[3] = block[0][3]
+    bbs.insert(header, block)
+
+
+def licm(bbs, verbose=0, stats=None):
+    '''
+    returns new blocks with the loop-invariant codes in preheaders, 'stats'
+    gets the number of hoisted codes and of loops with a preheader
+    '''
+    stats = {} if stats is None else stats
+    stats.update({'hoisted': 0, 'loops': 0})
+    res = [[list(code) for code in block] for block in bbs if block]
+    globs = global_variables(res)
+    escaped = escaping(res)
+    names = count(max([int(code[3][2:]) + 1 for block in res for code in block
+                       if isvar(code[3]) and code[3][:2] == '.l' and code[3][2:].isdigit()] + [0]))
+    # the labels of the headers of the finished loops
+    done = set()
+    while True:
+        cfg = bbstocfg(res)
+        dom = Dominance(res, cfg)
+        todo = [loop for loop in reversed(dom.loops)
+                if res[loop.header][0][0] == 'label' and res[loop.header][0][3] not in done]
+        if not todo:
+            break
+        loop = todo[0]
+        done.add(res[loop.header][0][3])
+        before = loop.header - 1
+        if before in loop.blocks and loop.header in cfg[before] and res[before][-1][0] != 'jump':
+            # a block of the loop falls through to the header, the preheader would be in the loop
+            continue
+        hoisted = invariants(res, cfg, dom, loop, globs, escaped)
+        if not hoisted:
+            continue
+        codes = [res[b][line] for b, line in hoisted]
+        hoisted = set(hoisted)
+        for b in loop.blocks:
+            res[b] = [code for line, code in enumerate(res[b]) if (b, line) not in hoisted]
+        rename_temporaries(res, loop, codes, names)
+        preheader(res, cfg, loop, codes)
+        res = [block for block in res if block]
+        stats['hoisted'] += len(codes)
+        stats['loops'] += 1
+
+    if verbose > 0:  # pragma: no cover
+        from .bb import printbbs
+        print('\n' + ' Loop-Invariant Code Motion '.center(40, '#'))
+        printbbs(res)
+        print('%(hoisted)d codes hoisted into %(loops)d preheaders' % stats)
+    return res
+
+
+if __name__ == '__main__':
+    import argparse
+    from .parser import parsefile
+    from .three import asttothree
+    from .bb import threetobbs
+    from .lvn import lvn
+    from .dce import dce
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename", help="The *.mc file to optimize with loop-invariant code motion")
+    parser.add_argument('--lvn', '-l', action='count', default=False)
+    parser.add_argument('--dce', action='count', default=False,
+                        help="Remove the dead code (alternating with lvn until a fixpoint with --lvn)")
+    parser.add_argument('--verbose', '-v', action='count', default=0)
+    args = parser.parse_args()
+    bbs = threetobbs(asttothree(parsefile(args.filename, verbose=args.verbose - 2), verbose=args.verbose - 1),
+                     verbose=1)
+    if args.lvn:
+        bbs = lvn(bbs, verbose=1)
+    if args.dce:
+        bbs = dce(bbs, verbose=1, uselvn=args.lvn)
+    licm(bbs, verbose=1)
@@ -1,61 +1,200 @@
 from .bb import printbbs
-from .utils import op_commutative, op_sets_result, op_uses_values, simplify_op
+from .utils import op_commutative, op_sets_result, op_uses_values, simplify_op, bin_ops, un_ops, op_is_comp, \
+    is_constant, fold_constant
 
+# the simplifications of localvaluenumbering, in the order of the statistics:
+#   fold            an operation on constants is computed (utils.fold_constant)
+#   add-zero        x + 0, 0 + x, x - 0 -> x
+#   mul-one         x * 1, 1 * x, x / 1 -> x
+#   mul-zero        x * 0, 0 * x, x % 1 -> 0
+#   mul-two         x * 2, 2 * x -> x + x (the other powers of two are shifts in the assemblers)
+#   neg             0 - x -> -x
+#   sub-self        x - x -> 0
+#   compare-self    x == x, x <= x, x >= x -> 1 and x != x, x < x, x > x -> 0
+#   branch          jumpfalse on a constant -> jump or nothing
+# Only the int operations are simplified, the float arithmetic isn't exact
+# (x + 0.0 is 0.0 for x = -0.0). An operand has the type of the constant it
+# is combined with (both operands of a binop have the same type, see
+# assembler.calc_types), the type of x in 'x - x' must be known.
+rules = ['fold', 'add-zero', 'mul-one', 'mul-zero', 'mul-two', 'neg', 'sub-self', 'compare-self', 'branch']
 
-def localvaluenumbering(basicblock):
-    values = {}
+
+def typeof(arg, types):
+    if type(arg) is str:
+        return types.get(arg)
+    return 'int' if type(arg) is int else 'float'
+
+
+def settype(code, types):
+    ''' records the type of the result of 'code' like assembler.calc_types '''
+    op, arg1, arg2, res = code
+    if op == 'assign':
+        types[res] = typeof(arg1, types) if arg2 is None else arg2
+    elif op == 'pop':
+        types[res] = arg2
+    elif op == 'arr-def':
+        types[arg2] = res
+    elif op == 'arr-acc':
+        types[res] = typeof(arg2, types)
+    elif op in un_ops or op in bin_ops:
+        types[res] = typeof(arg1, types)
+
+
+def simplify(op, args, types):
+    ''' (rule, [op, arg1, arg2]) for an operation on the value numbers 'args', None if there is no rule '''
+    if all(is_constant(arg) for arg in args):
+        value = fold_constant(op, *args)
+        return None if value is None else ('fold', ['assign', value, None])
+    if op in un_ops or typeof(args[0], types) not in ['int', None] or typeof(args[1], types) not in ['int', None]:
+        return None
+    x, y = args
+    if x == y and types.get(x) == 'int':
+        if op == '-':
+            return 'sub-self', ['assign', 0, None]
+        if op in op_is_comp:
+            return 'compare-self', ['assign', int(op in ['==', '<=', '>=']), None]
+    if op in op_commutative and is_constant(x):
+        # the constant on the right
+        x, y = y, x
+    if op == '-' and x == 0 and type(x) is int:
+        return 'neg', ['u-', y, None]
+    if type(y) is not int:
+        return None
+    if (op in ['+', '-'] and y == 0) or (op in ['*', '/'] and y == 1):
+        return 'add-zero' if op in ['+', '-'] else 'mul-one', ['assign', x, None]
+    if (op == '*' and y == 0) or (op == '%' and y == 1):
+        return 'mul-zero', ['assign', 0, None]
+    if op == '*' and y == 2:
+        return 'mul-two', ['+', x, x]
+    return None
+
+
+class ValueTable(object):
+    '''
+    The value numbers of a block. The forward tables map the names and the
+    constants ('numbers') and the expressions on value numbers
+    ('expressions') to their value number, the reverse tables map a value
+    number to its constant ('constants'), to the names which hold it
+    ('variables' and 'temporaries', in the order of their assignments) and to
+    the operation which computed it first ('definitions': op and the value
+    numbers of the operands in their order). Redefining a name only removes
+    it from the holders of its old value, every lookup is constant time.
+    '''
+
+    def __init__(self):
+        self.numbers = {}
+        self.expressions = {}
+        self.constants = {}
+        self.variables = {}
+        self.temporaries = {}
+        self.definitions = {}
+
+    def new(self):
+        number = len(self.variables)
+        self.variables[number] = {}
+        self.temporaries[number] = {}
+        return number
+
+    def number(self, arg):
+        ''' the value number of a name or a constant, a name without one holds a new value '''
+        # 1 and 1.0 are different values
+        key = arg if type(arg) is str else (type(arg).__name__, arg)
+        number = self.numbers.get(key)
+        if number is None:
+            number = self.new()
+            if type(arg) is str:
+                self.assign(arg, number)
+            else:
+                self.numbers[key] = number
+                self.constants[number] = arg
+        return number
+
+    def value(self, number):
+        ''' the constant or the name which represents a value, the variables come first, None if it got lost '''
+        if number in self.constants:
+            return self.constants[number]
+        for names in [self.variables[number], self.temporaries[number]]:
+            for name in names:
+                return name
+        return None
+
+    def assign(self, name, number):
+        ''' 'name' holds the value 'number' now, its old value is killed '''
+        old = self.numbers.get(name)
+        if old is not None:
+            del (self.variables if isrealvar(name) else self.temporaries)[old][name]
+        self.numbers[name] = number
+        (self.variables if isrealvar(name) else self.temporaries)[number][name] = None
+
+    def expression(self, op, numbers):
+        ''' the value number of 'op' on the value numbers 'numbers', a new value if it wasn't computed yet '''
+        key = (op,) + tuple(sorted(numbers) if op in op_commutative else numbers)
+        number = self.expressions.get(key)
+        if number is None:
+            number = self.expressions[key] = self.new()
+            self.definitions[number] = (op, numbers)
+        return number
+
+
+def localvaluenumbering(basicblock, types=None, stats=None):
+    ''' 'types' are the types of the names before the block, 'stats' counts the applied rules '''
+    types = {} if types is None else types
+    stats = {} if stats is None else stats
+    table = ValueTable()
+    # the names read by the earlier codes of the block
+    read = set()
     for code in basicblock:
         op, arg1, arg2, res = code
         simple_op = simplify_op(op)
         if simple_op not in op_uses_values:
             continue
 
-        # put constants into the map
-        for argpos in op_uses_values[simple_op]:
-            arg = code[argpos]
-            if str(arg) not in values:
-                values[str(arg)] = arg
+        # replace used arguments with the constant or the first name holding their value
+        # ('pop' writes its argument)
+        positions = [] if simple_op == 'pop' else op_uses_values[simple_op]
+        for pos in positions:
+            code[pos] = table.value(table.number(code[pos]))
 
-        # replace used arguments with their map-value
-        valargs = []
-        for arg in op_uses_values[simple_op]:
-            valarg = values[str(code[arg])]
-            code[arg] = valarg
-            valargs.append(valarg)
+        if simple_op == 'jumpfalse' and is_constant(code[1]):
+            stats['branch'] = stats.get('branch', 0) + 1
+            code[:] = ['jump', None, None, res] if not code[1] else [None] * 4
+            continue
 
-        newval = None
         if simple_op in ['binop', 'unop']:
-            if op in op_commutative:
-                valargs.sort(key=lambda x: str(x))
-            arghash = (op,) + tuple(valargs)
+            simplified = simplify(op, [code[pos] for pos in positions], types)
+            if simplified is not None:
+                rule, code[:3] = simplified
+                stats[rule] = stats.get(rule, 0) + 1
+                op = code[0]
+                simple_op = simplify_op(op)
+                positions = op_uses_values[simple_op]
+
+        number = None
+        if simple_op in ['binop', 'unop']:
+            number = table.expression(op, [table.number(code[pos]) for pos in positions])
+            available = table.value(number)
+            if available is not None:
+                code[:] = ['assign', available, None, res]
+        elif simple_op == 'assign':
+            number = table.number(code[1])
+            definition = table.definitions.get(number)
+            if isrealvar(res) and type(code[1]) is str and not isrealvar(code[1]):
+                if definition is None:
+                    # a call result or an array element, the variable holds a new value
+                    number = None
+                elif code[1] not in read and None not in [table.value(arg) for arg in definition[1]]:
+                    # the variable gets the computation of the temporary, which becomes unused (the later
+                    # uses read the variable), a temporary with an earlier use stays like the reuse above
+                    args = [table.value(arg) for arg in definition[1]]
+                    code[:] = [definition[0]] + args + [None] * (2 - len(args)) + [res]
+        if simple_op in op_sets_result or op == 'arr-acc':
+            # the old value of the name is gone
+            table.assign(res, table.new() if number is None else number)
+        if simplify_op(code[0]) != 'pop':
+            read.update(code[pos] for pos in op_uses_values[simplify_op(code[0])] if type(code[pos]) is str)
+        settype(code, types)
+    basicblock[:] = [code for code in basicblock if code[0] is not None]
 
-            if arghash not in values:
-                values[arghash] = res
-            else:
-                newval = values[arghash]
-                code[0] = 'assign'
-                code[1] = newval
-                code[2] = None
-                code[3] = res
-        if simple_op in ['assign']:
-            assval = valargs[0]
-            if isrealvar(res) and not isrealvar(assval):
-                for args, var in values.items():
-                    if var == assval and args != assval:
-                        if type(args) is tuple:
-                            print(res, args, var)
-                            code[0] = args[0]
-                            code[1] = args[1]
-                            if len(args)==3:
-                                code[2] = args[2]
-                            code[3] = res
-                            values[args] = res
-                            values[valargs[0]] = res
-                            break
-            else:
-                newval = valargs[0]
-        if newval is not None:
-            values[res] = newval
 
 def isrealvar(arg):
     return type(arg) is str and not arg.startswith('.t')
@@ -72,14 +211,9 @@ def removeunusedlines_block(bb):
             if type(arg) is str and arg.startswith('.t'):
                 usedtemps.add(arg)
 
-    unneccesarylines = []
-    for i, (op, _, _, res) in enumerate(bb):
-        if simplify_op(op) not in op_sets_result:
-            continue
-        if res.startswith('.t') and res not in usedtemps:
-            unneccesarylines.append(i)
-    for i in reversed(unneccesarylines):
-        del bb[i]
+    # one pass, deleting the lines one by one is quadratic in long blocks
+    bb[:] = [code for code in bb if simplify_op(code[0]) not in op_sets_result or
+             not code[3].startswith('.t') or code[3] in usedtemps]
     return len(bb) == 0
 
 
@@ -92,14 +226,19 @@ def removeunusedlines(bbs):
         del bbs[blocknum]
 
 
-def lvn(bbs, verbose=0):
+def lvn(bbs, verbose=0, stats=None):
+    ''' 'stats' gets the number of applications of every rule in 'rules' '''
+    stats = {} if stats is None else stats
+    stats.update((rule, 0) for rule in rules)
+    types = {}
     for bb in bbs:
-        localvaluenumbering(bb)
+        localvaluenumbering(bb, types, stats)
         # cleanup
     removeunusedlines(bbs)
     if verbose > 0:  # pragma: no cover
         print('\n' + ' Local Value Numbering '.center(40, '#'))
         printbbs(bbs)
+        print('\n'.join('%-20s%6d' % (rule, stats[rule]) for rule in rules))
     return bbs
 
 if __name__ == '__main__':
@@ -0,0 +1,146 @@
+from array import array
+from .utils import all_ops, bin_ops, un_ops, op_uses_values, op_sets_result, simplify_op
+
+# A compact (struct-of-arrays) form of the 3-address-code:
+#   * the operation is a small int (index into 'opcodes')
+#   * every operand (variable, temporary, label, function name, constant, type)
+#     is interned into a 'SymbolTable' and stored as its index (None is -1)
+#   * the four columns are 'array('i')'s, i.e. 16 bytes per instruction
+# 'PackedTAC.fromcode' / 'PackedTAC.tolist' convert from/to the list form,
+# so the passes can migrate one at a time.
+
+opcodes = [op for op in all_ops if op not in ['binop', 'unop']] + bin_ops + un_ops
+opcode_index = {op: i for i, op in enumerate(opcodes)}
+
+# per opcode lookup tables, so passes don't need 'simplify_op' and string compares
+opcode_kind = [simplify_op(op) for op in opcodes]
+opcode_uses_values = [tuple(op_uses_values.get(simplify_op(op), ())) for op in opcodes]
+opcode_sets_result = [simplify_op(op) in op_sets_result for op in opcodes]
+
+JUMP, JUMPFALSE, LABEL, FUNCTION, ENDFUN = (opcode_index[op] for op in ['jump', 'jumpfalse', 'label', 'function', 'end-fun'])
+NONE = -1
+
+
+class SymbolTable(object):
+    ''' interns operands, '1', '1.0' and 'True' are different symbols '''
+
+    def __init__(self):
+        self.symbols = []
+        self.index = {}
+
+    def intern(self, value):
+        if value is None:
+            return NONE
+        key = (type(value), value)
+        num = self.index.get(key)
+        if num is None:
+            num = len(self.symbols)
+            self.index[key] = num
+            self.symbols.append(value)
+        return num
+
+    def __getitem__(self, num):
+        if num == NONE:
+            return None
+        return self.symbols[num]
+
+    def __len__(self):
+        return len(self.symbols)
+
+
+class PackedTAC(object):
+
+    def __init__(self, symbols=None):
+        self.symbols = SymbolTable() if symbols is None else symbols
+        self.ops = array('i')
+        self.arg1 = array('i')
+        self.arg2 = array('i')
+        self.res = array('i')
+
+    @classmethod
+    def fromcode(cls, code, symbols=None):
+        packed = cls(symbols)
+        for tac in code:
+            packed.append(*tac)
+        return packed
+
+    def append(self, op, arg1, arg2, res):
+        intern = self.symbols.intern
+        self.ops.append(opcode_index[op])
+        self.arg1.append(intern(arg1))
+        self.arg2.append(intern(arg2))
+        self.res.append(intern(res))
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __getitem__(self, line):
+        if isinstance(line, slice):
+            packed = PackedTAC(self.symbols)
+            packed.ops, packed.arg1, packed.arg2, packed.res = \
+                self.ops[line], self.arg1[line], self.arg2[line], self.res[line]
+            return packed
+        symbols = self.symbols
+        return [opcodes[self.ops[line]], symbols[self.arg1[line]], symbols[self.arg2[line]], symbols[self.res[line]]]
+
+    def __setitem__(self, line, tac):
+        op, arg1, arg2, res = tac
+        intern = self.symbols.intern
+        self.ops[line] = opcode_index[op]
+        self.arg1[line] = intern(arg1)
+        self.arg2[line] = intern(arg2)
+        self.res[line] = intern(res)
+
+    def __iter__(self):
+        for line in range(len(self.ops)):
+            yield self[line]
+
+    def tolist(self):
+        return list(self)
+
+    def nbytes(self):
+        ''' memory of the instruction columns (the symbol table is shared) '''
+        return sum(col.itemsize * len(col) for col in [self.ops, self.arg1, self.arg2, self.res])
+
+
+def leaders(packed):
+    ''' basic block leaders by integer compares on the opcode column (see bb.threetobbs) '''
+    res = set([0])
+    for line, op in enumerate(packed.ops):
+        if op == LABEL or op == FUNCTION:
+            res.add(line)
+        elif op == JUMP or op == JUMPFALSE or op == ENDFUN:
+            res.add(line + 1)
+    return res
+
+
+def packbbs(bbs):
+    ''' packs every basic block, all blocks share one symbol table '''
+    symbols = SymbolTable()
+    return [PackedTAC.fromcode(bb, symbols) for bb in bbs]
+
+
+def unpackbbs(packedbbs):
+    return [packed.tolist() for packed in packedbbs]
+
+
+def listsize(code):  # pragma: no cover
+    ''' memory of the list form (outer list and the 4-element lists, operands are shared) '''
+    import sys
+    return sys.getsizeof(code) + sum(sys.getsizeof(tac) for tac in code)
+
+if __name__ == '__main__':
+    import argparse
+    from .parser import parsefile
+    from .three import asttothree
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename", help="The *.mc file to translate to packed 3-address code")
+    parser.add_argument('--verbose', '-v', action='count', default=0)
+    args = parser.parse_args()
+    code = asttothree(parsefile(args.filename, verbose=args.verbose - 1), verbose=args.verbose)
+    packed = PackedTAC.fromcode(code)
+    print('\n' + ' Packed 3-address-code '.center(40, '#'))
+    print('instructions:  %d' % len(packed))
+    print('symbols:       %d' % len(packed.symbols))
+    print('list form:     %d bytes' % listsize(code))
+    print('packed form:   %d bytes' % packed.nbytes())
@@ -193,12 +193,21 @@ def functionslast(ast):
     ast.stmts.sort(key=functools.cmp_to_key(functionslast))
 
 
-def parse(stringcode, verbose=0):
-    parsetree = mcgrammar.parse(stringcode)
-    if verbose > 1:  # pragma: no cover
-        print('\n' + ' Parse Tree '.center(40, '#'))
-        print(parsetree)
-    ast = ASTFormatter().visit(parsetree)
+def parse(stringcode, verbose=0, backend='parsimonious'):
+    ''' backend is 'parsimonious' (the 'mcgrammar' parse tree is visited by the
+        'ASTFormatter') or 'fast' (hand-written tokenizer and recursive descent
+        parser in fastparser.py which emits the AST directly) '''
+    if backend == 'fast':
+        from .fastparser import fastparse
+        ast = fastparse(stringcode)
+    elif backend == 'parsimonious':
+        parsetree = mcgrammar.parse(stringcode)
+        if verbose > 1:  # pragma: no cover
+            print('\n' + ' Parse Tree '.center(40, '#'))
+            print(parsetree)
+        ast = ASTFormatter().visit(parsetree)
+    else:
+        raise NotImplementedError('Unknown parser backend "%s"' % backend)
     functionslast(ast)
     if verbose > 0:  # pragma: no cover
         print('\n' + ' AST '.center(40, '#'))
@@ -206,18 +215,19 @@ def parse(stringcode, verbose=0):
     return ast
 
 
-def parsefile(fname, verbose=0):
+def parsefile(fname, verbose=0, backend='parsimonious'):
     with open(fname, 'r') as mcfile:
         print('\n' + ' Source code '.center(40, '#'))
         stringcode = mcfile.read()[:-1]
         stringcode = '{\n' + stringcode + '\n}'
         print(stringcode)
-        return parse(stringcode, verbose)
+        return parse(stringcode, verbose, backend)
 
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("filename", help="The *.mc file to parse")
+    parser.add_argument('--backend', '-b', choices=['parsimonious', 'fast'], default='parsimonious')
     parser.add_argument('--verbose', '-v', action='count', default=0)
     args = parser.parse_args()
-    parsefile(args.filename, verbose=args.verbose + 1)
+    parsefile(args.filename, verbose=args.verbose + 1, backend=args.backend)
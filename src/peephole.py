@@ -0,0 +1,185 @@
+from collections import OrderedDict
+from .assembler import ASMInstruction
+
+# Peephole optimizer for the output of assembler.codetoassembly (x86 and x86-64):
+#   every rule looks at a window of consecutive instructions (the comment-only
+#   lines are skipped) and returns (#instructions to replace, replacement) or None.
+#   The rules are applied until none of them matches anymore.
+#
+# The rules only rely on the shape of the generated code: every instruction
+# which reads the flags directly follows the instruction which sets them and
+# every jump target is a label.
+
+moves = ['mov', 'movl']
+commutative = ['add', 'addl', 'imul', 'imull']
+compare_zero = [('cmp', '$0'), ('cmpl', '$0')]
+negated_conditions = {
+    'e': 'ne',
+    'ne': 'e',
+    'l': 'ge',
+    'ge': 'l',
+    'le': 'g',
+    'g': 'le',
+    'b': 'ae',
+    'ae': 'b',
+    'be': 'a',
+    'a': 'be',
+    'nb': 'b',
+    'nae': 'ae',
+}
+
+
+def is_comment(el):
+    return type(el) is not str and el.op is None
+
+
+def is_instruction(el):
+    return type(el) is not str and el.op is not None and not is_label(el)
+
+
+def is_label(el):
+    return type(el) is not str and el.op is not None and el.op.rstrip().endswith(':')
+
+
+def is_register(operand):
+    return operand is not None and operand.startswith('%')
+
+
+def is_move(el, op=moves):
+    return is_instruction(el) and el.op in op
+
+
+def store_load(window):
+    ''' mov R, M; mov M, R -> mov R, M '''
+    first, second = window
+    if is_move(first) and is_move(second) and (first.arg1, first.arg2) == (second.arg2, second.arg1):
+        return 2, [first]
+    if is_move(first, ['movss']) and is_move(second, ['movss']) and (first.arg1, first.arg2) == (second.arg2, second.arg1):
+        return 2, [first]
+
+
+def store_forward(window):
+    ''' mov R, M; mov M, R2 -> mov R, M; mov R, R2 (no memory access) '''
+    first, second = window
+    if is_move(first) and is_move(second) and is_register(first.arg1) and not is_register(first.arg2) and \
+            first.arg2 == second.arg1 and is_register(second.arg2):
+        return 2, [first, ASMInstruction(second.op, first.arg1, second.arg2, second.comment)]
+
+
+def commute_reload(window):
+    ''' mov R, M; mov X, R; add M, R -> mov R, M; add X, R (R = X + R) '''
+    store, load, op = window
+    if is_move(store) and is_register(store.arg1) and is_move(load) and load.arg2 == store.arg1 and \
+            store.arg1 not in load.arg1 and is_instruction(op) and op.op in commutative and \
+            (op.arg1, op.arg2) == (store.arg2, store.arg1):
+        return 3, [store, ASMInstruction(op.op, load.arg1, op.arg2, load.comment)]
+
+
+def duplicate_move(window):
+    ''' mov A, B; mov A, B -> mov A, B '''
+    first, second = window
+    if is_move(first) and first == second and first.arg2 not in first.arg1:
+        return 2, [first]
+
+
+def self_move(window):
+    ''' mov R, R -> (nothing) '''
+    instr, = window
+    if is_move(instr) and instr.arg1 == instr.arg2:
+        return 1, []
+
+
+def set_compare_jump(window):
+    ''' setCC X; [mov X, Y]; cmp $0, Y; je L -> setCC X; [mov X, Y]; jNCC L '''
+    first = window[0]
+    if not is_instruction(first) or not first.op.startswith('set') or first.op[3:] not in negated_conditions:
+        return None
+    holder = first.arg1
+    for pos, instr in enumerate(window[1:], 1):
+        if is_move(instr, moves + ['movzbl']) and instr.arg1 == holder:
+            holder = instr.arg2
+        elif is_instruction(instr) and (instr.op, instr.arg1) in compare_zero and instr.arg2 == holder:
+            jump = window[pos + 1] if pos + 1 < len(window) else None
+            if is_instruction(jump) and jump.op == 'je':
+                condition = negated_conditions[first.op[3:]]
+                return pos + 2, window[:pos] + [ASMInstruction('j' + condition, jump.arg1, comment=instr.comment)]
+            return None
+        else:
+            return None
+
+
+def jump_to_next(window):
+    ''' jmp L; L: -> L: '''
+    jump, label = window
+    if is_instruction(jump) and jump.op.startswith('j') and is_label(label) and label.op == jump.arg1 + ':':
+        return 2, [label]
+
+
+def unreachable(window):
+    ''' jmp L; X -> jmp L (if X isn't a label) '''
+    jump, instr = window
+    if is_instruction(jump) and jump.op in ['jmp', 'ret'] and is_instruction(instr):
+        return 2, [jump]
+
+
+# name: (minimum window size, maximum window size, rule)
+rules = OrderedDict([
+    ('store-load', (2, 2, store_load)),
+    ('store-forward', (2, 2, store_forward)),
+    ('commute-reload', (3, 3, commute_reload)),
+    ('duplicate-move', (2, 2, duplicate_move)),
+    ('self-move', (1, 1, self_move)),
+    ('set-compare-jump', (3, 5, set_compare_jump)),
+    ('jump-to-next', (2, 2, jump_to_next)),
+    ('unreachable', (2, 2, unreachable)),
+])
+
+
+def count_instructions(assembly):
+    return sum(1 for el in assembly if is_instruction(el))
+
+
+def peephole_pass(assembly, hits):
+    ''' applies the rules once from top to bottom, returns the new assembly and if it changed '''
+    res = list(assembly)
+    maxsize = max(size for _, size, _ in rules.values())
+    changed = False
+    line = 0
+    while line < len(res):
+        if not is_instruction(res[line]) and not is_label(res[line]):
+            line += 1
+            continue
+        positions = [line]
+        for pos in range(line + 1, len(res)):
+            if len(positions) == maxsize:
+                break
+            if is_comment(res[pos]):
+                continue
+            positions.append(pos)
+        window = [res[pos] for pos in positions]
+        for name, (minsize, size, rule) in rules.items():
+            match = rule(window[:size]) if len(window) >= minsize else None
+            if match is None:
+                continue
+            length, replacement = match
+            last = positions[length - 1]
+            # keep the comment-only lines and the comments of the removed instructions
+            kept = [res[pos] for pos in range(line, last + 1) if pos not in positions[:length]]
+            kept += [ASMInstruction(None, comment=instr.comment) for instr in window[:length]
+                     if instr.comment is not None and all(instr.comment != other.comment for other in replacement)]
+            res[line:last + 1] = replacement + kept
+            hits[name] += 1
+            changed = True
+            break
+        else:
+            line += 1
+    return res, changed
+
+
+def peephole(assembly):
+    ''' returns the optimized assembly and {rule: #applications} '''
+    hits = OrderedDict((name, 0) for name in rules)
+    changed = True
+    while changed:
+        assembly, changed = peephole_pass(assembly, hits)
+    return assembly, hits
@@ -0,0 +1,294 @@
+from .bb import threetobbs
+from .cfg import bbstocfg
+from .dataflow import liveness, invertgraph
+from .utils import op_uses_values, simplify_op
+
+# Register allocation for the assembler:
+#   the int variables/temporaries of a function are mapped to the registers
+#   below, the other values (floats, arrays, spilled variables) keep their
+#   stack slot (see assembler.gen_stack_mapping).
+#   %eax is never allocated, it is the accumulator of all the instruction sequences.
+#
+# The 'linear' strategy is a linear scan over the live intervals of the
+# variables ([first, last] position where the variable is defined, used or
+# live according to dataflow.liveness). An instruction reads its operands at
+# position 2 * line and writes its result at 2 * line + 1, so the result can
+# reuse the register of an operand which dies there.
+# If there is no free register the interval which ends last is spilled.
+#
+# The 'graph' strategy colors the interference graph (Chaitin/Briggs):
+#   * two variables interfere if one is defined where the other is live
+#     (the source of a copy doesn't interfere with its destination)
+#   * the copies ('assign' of a variable) are coalesced if the merged node
+#     has less than K neighbors of significant degree (Briggs)
+#   * nodes with less than K neighbors are removed from the graph, if there
+#     is none the node with the lowest spill cost / degree is removed
+#     (optimistically), the spill cost is the sum of 10 ** loop depth over
+#     its definitions and uses
+#   * the nodes are colored in reverse order, a node without a free color is spilled
+#
+# A variable may not get a register which is overwritten by an instruction
+# it is live at (or used by):
+#   'call'                      %ecx, %edx (caller-saved)
+#   '/', '%'                    %edx (cdq, idivl)
+#   'arr-acc', 'arr-ass'        %edx (address computation)
+
+# in order of preference, the caller-saved registers don't have to be saved in the prologue
+registers = ['%ecx', '%edx', '%ebx', '%esi', '%edi']
+callee_saved = ['%ebx', '%esi', '%edi']
+strategies = ['linear', 'graph']
+
+clobbered_registers = {
+    'call': set(['%ecx', '%edx']),
+    '/': set(['%edx']),
+    '%': set(['%edx']),
+    'arr-acc': set(['%edx']),
+    'arr-ass': set(['%edx']),
+}
+
+# x86-64 (see assembler64.py): %rax and %rdx are the scratch registers,
+# the int values use the 32-bit names of the registers
+registers64 = ['%ecx', '%esi', '%edi', '%r8d', '%r9d', '%r10d', '%r11d', '%ebx', '%r12d', '%r13d', '%r14d', '%r15d']
+callee_saved64 = ['%ebx', '%r12d', '%r13d', '%r14d', '%r15d']
+clobbered_registers64 = {
+    'call': set(reg for reg in registers64 if reg not in callee_saved64),
+}
+
+targets = {
+    'x86': (registers, clobbered_registers),
+    'x86-64': (registers64, clobbered_registers64),
+}
+
+
+def defs_and_uses(tac):
+    op, _, _, result = tac
+    simpleop = simplify_op(op)
+    uses = [tac[pos] for pos in op_uses_values.get(simpleop, []) if simpleop != 'pop']
+    defs = [result] if simpleop in ['pop', 'assign', 'binop', 'unop', 'arr-acc'] else []
+    return [el for el in defs if type(el) is str], [el for el in uses if type(el) is str]
+
+
+def block_liveness(code):
+    ''' returns the basic blocks, the cfg and the live variables at the beginning/end of every block '''
+    bbs = threetobbs(code)
+    cfg = bbstocfg(bbs)
+    # backward analysis: 'liveout' is the input of a block, 'livein' its output
+    liveout, livein = liveness(bbs, cfg)
+    return bbs, cfg, livein, liveout
+
+
+def live_intervals(code):
+    ''' returns {var: [start, end]} (positions) for the code of one function '''
+    bbs, _, livein, liveout = block_liveness(code)
+    intervals = {}
+
+    def extend(var, line):
+        if var in intervals:
+            interval = intervals[var]
+            interval[0] = min(interval[0], line)
+            interval[1] = max(interval[1], line)
+        else:
+            intervals[var] = [line, line]
+
+    start = 0
+    for b, block in enumerate(bbs):
+        end = start + len(block) - 1
+        for var in livein[b]:
+            extend(var, 2 * start)
+        for var in liveout[b]:
+            extend(var, 2 * end + 1)
+        for line in range(start, end + 1):
+            defs, uses = defs_and_uses(code[line])
+            for var in uses:
+                extend(var, 2 * line)
+            for var in defs:
+                extend(var, 2 * line + 1)
+        start = end + 1
+    return intervals
+
+
+def clobbers(code, clobbered=clobbered_registers):
+    ''' returns {line: registers overwritten by the instruction} '''
+    res = {}
+    for line, (op, _, _, _) in enumerate(code):
+        if op in clobbered:
+            res[line] = clobbered[op]
+    return res
+
+
+def forbidden_registers(interval, clobbered):
+    start, end = interval
+    forbidden = set()
+    for line, regs in clobbered.items():
+        # the result of the instruction can live in a clobbered register
+        if start <= 2 * line <= end:
+            forbidden |= regs
+    return forbidden
+
+
+def linear_scan(intervals, clobbered, regs=registers):
+    ''' returns {var: register}, the missing variables are spilled '''
+    allocation = {}
+    active = []
+    free = list(regs)
+    order = sorted(intervals, key=lambda var: (intervals[var][0], intervals[var][1], str(var)))
+    for var in order:
+        start, end = intervals[var]
+        for other in list(active):
+            if intervals[other][1] < start:
+                active.remove(other)
+                free.append(allocation[other])
+        free.sort(key=regs.index)
+        forbidden = forbidden_registers(intervals[var], clobbered)
+        candidates = [reg for reg in free if reg not in forbidden]
+        if candidates:
+            allocation[var] = candidates[0]
+            free.remove(candidates[0])
+            active.append(var)
+            continue
+        spillable = [other for other in active if allocation[other] not in forbidden]
+        if not spillable:
+            continue
+        spill = max(spillable, key=lambda other: intervals[other][1])
+        if intervals[spill][1] > end:
+            allocation[var] = allocation.pop(spill)
+            active.remove(spill)
+            active.append(var)
+    return allocation
+
+
+def loop_depths(bbs, cfg):
+    ''' number of loops around every block, a jump to a previous block closes a loop '''
+    depth = [0] * len(bbs)
+    pred = invertgraph(cfg)
+    for source in cfg:
+        for header in cfg[source]:
+            if header > source:
+                continue
+            body = set([header])
+            todo = [source]
+            while todo:
+                b = todo.pop()
+                if b not in body:
+                    body.add(b)
+                    todo += pred[b]
+            for b in body:
+                depth[b] += 1
+    return depth
+
+
+def interference_graph(code, candidates, clobbered=clobbered_registers):
+    ''' returns the interference graph {var: neighbors}, the copies [(dst, src, weight)],
+        the spill costs and the registers every variable can't use '''
+    bbs, cfg, _, liveout = block_liveness(code)
+    depths = loop_depths(bbs, cfg)
+    graph = {var: set() for var in candidates}
+    costs = {var: 0 for var in candidates}
+    forbidden = {var: set() for var in candidates}
+    moves = []
+    end = len(code)
+    for b in reversed(range(len(bbs))):
+        weight = 10 ** depths[b]
+        live = liveout[b] & candidates
+        start = end - len(bbs[b])
+        for line in reversed(range(start, end)):
+            op = code[line][0]
+            defs, uses = defs_and_uses(code[line])
+            defs = [var for var in defs if var in candidates]
+            uses = [var for var in uses if var in candidates]
+            source = None
+            if op == 'assign' and defs and uses:
+                source = uses[0]
+                moves.append((defs[0], source, weight))
+            for var in defs:
+                for other in live:
+                    if other != var and other != source:
+                        graph[var].add(other)
+                        graph[other].add(var)
+            if op in clobbered:
+                for var in (live - set(defs)) | set(uses):
+                    forbidden[var] |= clobbered[op]
+            for var in defs + uses:
+                costs[var] += weight
+            live = (live - set(defs)) | set(uses)
+        end = start
+    return graph, moves, costs, forbidden
+
+
+def coalesce(graph, moves, costs, forbidden, regs):
+    ''' merges the nodes of the copies (conservatively), returns {var: representative} '''
+    alias = {}
+
+    def find(var):
+        while var in alias:
+            var = alias[var]
+        return var
+    for dst, src, _ in sorted(moves, key=lambda move: -move[2]):
+        a, b = find(dst), find(src)
+        if a == b or b in graph[a]:
+            continue
+        colors = len(regs) - len(forbidden[a] | forbidden[b])
+        significant = [other for other in graph[a] | graph[b] if len(graph[other]) >= len(regs)]
+        if len(significant) >= colors:
+            continue
+        for other in graph.pop(b):
+            graph[other].discard(b)
+            graph[other].add(a)
+            graph[a].add(other)
+        forbidden[a] |= forbidden.pop(b)
+        costs[a] += costs.pop(b)
+        alias[b] = a
+    return {var: find(var) for var in list(graph) + list(alias)}
+
+
+def graph_coloring(graph, moves, costs, forbidden, regs=registers):
+    ''' returns {var: register}, the missing variables are spilled '''
+    representative = coalesce(graph, moves, costs, forbidden, regs)
+    degree = {var: len(graph[var]) for var in graph}
+    remaining = sorted(graph, key=str)
+    stack = []
+    while remaining:
+        low = [var for var in remaining if degree[var] < len(regs) - len(forbidden[var])]
+        if low:
+            var = low[0]
+        else:
+            var = min(remaining, key=lambda var: costs[var] / (degree[var] + 1))
+        remaining.remove(var)
+        stack.append(var)
+        for other in graph[var]:
+            degree[other] -= 1
+
+    # prefer the color of a copy's other side
+    partners = {var: set() for var in graph}
+    for dst, src, _ in moves:
+        dst, src = representative[dst], representative[src]
+        if dst != src:
+            partners[dst].add(src)
+            partners[src].add(dst)
+    colors = {}
+    while stack:
+        var = stack.pop()
+        used = set(colors[other] for other in graph[var] if other in colors)
+        free = [reg for reg in regs if reg not in used and reg not in forbidden[var]]
+        preferred = [colors[other] for other in partners[var] if other in colors and colors[other] in free]
+        if preferred or free:
+            colors[var] = (preferred + free)[0]
+    return {var: colors[rep] for var, rep in representative.items() if rep in colors}
+
+
+def allocate(code, types, strategy='linear', target='x86'):
+    ''' maps the int variables of a function to registers, 'types' is assembler.calc_types(code) '''
+    if strategy not in strategies:
+        raise NotImplementedError('Unknown register allocator \'%s\'' % strategy)
+    regs, clobbered = targets[target]
+    stackonly = set()
+    for line, (op, _, arg2, res) in enumerate(code):
+        if op == 'arr-def':
+            stackonly.add(arg2)
+        elif types[line] == 'float':
+            stackonly.add(res)
+    if strategy == 'graph':
+        candidates = set(var for tac in code for var in sum(defs_and_uses(tac), []) if var not in stackonly)
+        return graph_coloring(*interference_graph(code, candidates, clobbered), regs=regs)
+    intervals = {var: interval for var, interval in live_intervals(code).items() if var not in stackonly}
+    return linear_scan(intervals, clobbers(code, clobbered), regs)
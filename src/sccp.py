@@ -0,0 +1,246 @@
+from .cfg import bbstocfg
+from .dataflow import definition
+from .dominators import Dominance, function_entries
+from .ssa import tossa, fromssa, uses, basename
+from .utils import bin_ops, un_ops, fold_constant, isvar
+
+# Sparse conditional constant propagation (Wegman, Zadeck) on the SSA form:
+#   Every SSA name starts as undefined, it becomes a constant when its
+#   definition is reached and can be evaluated at compile time, or not
+#   constant. Only the blocks on reached edges are evaluated, a 'jumpfalse'
+#   on a constant only reaches one of its successors and a phi only merges
+#   the values of the reached edges. The values only go down in the lattice
+#       undefined -> constant -> not constant
+#   so every name and edge is visited a bounded number of times.
+#
+# The constants are folded like utils.fold_constant: the int results fit into
+# 32 bits, '/' and '%' only for non negative ints, so the vm and the generated
+# code agree. Afterwards the uses of the constants are replaced by their
+# values, the temporaries holding constants disappear, a 'jumpfalse' on a
+# constant becomes a 'jump' or nothing and the blocks which are never reached
+# are deleted (the 'function' and 'end-fun' markers stay).
+
+# the value of a name without a reached definition
+undefined = object()
+
+
+def meet(a, b):
+    if a is undefined or b is undefined:
+        return b if a is undefined else a
+    # 1 == 1.0, but an int and a float constant aren't the same
+    if a is None or b is None or a != b or type(a) is not type(b):
+        return None
+    return a
+
+
+class SCCP(object):
+    '''
+    The lattice values of the SSA names of 'bbs' ({name: constant}, None if
+    it isn't a constant, missing names are undefined) and the reached
+    'edges' (pred, block) of the cfg, (None, entry) for the entries.
+    '''
+
+    def __init__(self, bbs, cfg, entries):
+        self.bbs = bbs
+        self.cfg = cfg
+        self.labels = {}
+        self.defined = set()
+        self.users = {}
+        for b, block in enumerate(bbs):
+            for line, code in enumerate(block):
+                if code[0] == 'label':
+                    self.labels[code[3]] = b
+                if code[0] == 'phi':
+                    args = code[1].values()
+                    self.defined.add(code[3])
+                else:
+                    args = [code[pos] for pos in uses(code)]
+                    if definition(code) is not None:
+                        self.defined.add(code[3])
+                for arg in args:
+                    if type(arg) is str:
+                        self.users.setdefault(arg, []).append((b, line))
+        self.values = {}
+        self.edges = set()
+        self.reached = set()
+        self.propagate(entries)
+
+    def value(self, arg):
+        if type(arg) is not str:
+            return arg
+        if arg not in self.defined:
+            # parameters of the code: globals read in a function, variables read before they are written
+            return None
+        return self.values.get(arg, undefined)
+
+    def evaluate(self, b, code):
+        op = code[0]
+        if op == 'phi':
+            # at an entry the value before the function is merged, too
+            res = None if (None, b) in self.edges else undefined
+            for pred, arg in code[1].items():
+                if (pred, b) in self.edges:
+                    res = meet(res, self.value(arg))
+            return res
+        if op == 'assign':
+            return self.value(code[1])
+        if op in bin_ops or op in un_ops:
+            args = [self.value(code[1])] if op in un_ops else [self.value(code[1]), self.value(code[2])]
+            if any(arg is None for arg in args):
+                return None
+            if any(arg is undefined for arg in args):
+                return undefined
+            return fold_constant(op, *args)
+        # 'pop' (parameters and call results) and array accesses
+        return None
+
+    def successors(self, b):
+        ''' the successors of the reached block b, only one of them for a 'jumpfalse' on a constant '''
+        block = self.bbs[b]
+        if not block or block[-1][0] != 'jumpfalse':
+            return self.cfg[b]
+        cond = self.value(block[-1][1])
+        if cond is undefined:
+            return set()
+        if cond is None:
+            return self.cfg[b]
+        target = self.labels[block[-1][3]]
+        if not cond:
+            return set([target])
+        return self.cfg[b] - set([target]) or set([target])
+
+    def propagate(self, entries):
+        cfgwork = [(None, entry) for entry in reversed(entries)]
+        ssawork = []
+
+        def visit(b, line):
+            code = self.bbs[b][line]
+            if line == len(self.bbs[b]) - 1 and code[0] == 'jumpfalse':
+                cfgwork.extend((b, succ) for succ in sorted(self.successors(b), reverse=True))
+            if code[0] != 'phi' and definition(code) is None:
+                return
+            new = self.evaluate(b, code)
+            old = self.values.get(code[3], undefined)
+            if new is not old and (new is None or old is undefined):
+                self.values[code[3]] = new
+                ssawork.extend(self.users.get(code[3], []))
+
+        while cfgwork or ssawork:
+            if cfgwork:
+                edge = cfgwork.pop()
+                if edge in self.edges:
+                    continue
+                self.edges.add(edge)
+                b = edge[1]
+                if b in self.reached:
+                    # only the phis see the new edge
+                    for line, code in enumerate(self.bbs[b]):
+                        if code[0] == 'phi':
+                            visit(b, line)
+                    continue
+                self.reached.add(b)
+                for line in range(len(self.bbs[b])):
+                    visit(b, line)
+                if not self.bbs[b] or self.bbs[b][-1][0] != 'jumpfalse':
+                    cfgwork.extend((b, succ) for succ in sorted(self.cfg[b], reverse=True))
+            else:
+                b, line = ssawork.pop()
+                if b in self.reached:
+                    visit(b, line)
+
+    def constant(self, arg):
+        ''' the constant value of arg, None if it isn't known to be constant '''
+        value = self.value(arg)
+        return None if value is undefined else value
+
+
+def rewrite(bbs, result, stats):
+    ''' the SSA blocks with the constants of 'result' (an SCCP) folded, the unreached blocks are emptied '''
+
+    def replace(arg):
+        value = result.constant(arg)
+        return arg if value is None else value
+
+    res = []
+    for b, block in enumerate(bbs):
+        if b not in result.reached:
+            res.append([code for code in block if code[0] in ['function', 'end-fun']])
+            continue
+        newblock = []
+        for code in block:
+            op = code[0]
+            if op == 'phi':
+                # the versions of a variable keep their definitions and are coalesced again by fromssa
+                code = ['phi', {pred: arg if isvar(basename(arg)) else replace(arg)
+                                for pred, arg in code[1].items() if (pred, b) in result.edges}, None, code[3]]
+            elif op == 'jumpfalse' and result.constant(code[1]) is not None:
+                stats['branches'] += 1
+                if not result.constant(code[1]):
+                    newblock.append(['jump', None, None, code[3]])
+                continue
+            else:
+                code = list(code)
+                for pos in uses(code):
+                    if result.constant(code[pos]) is not None:
+                        code[pos] = result.constant(code[pos])
+                        stats['uses'] += 1
+            value = result.constant(code[3]) if op == 'phi' or definition(code) is not None else None
+            if value is not None:
+                stats['constants'] += 1
+                if not isvar(basename(code[3])):
+                    # all the uses of the temporary have the value now
+                    continue
+                if op != 'phi':
+                    code = ['assign', value, code[2] if op == 'assign' else None, code[3]]
+            newblock.append(code)
+        res.append(newblock)
+    return res
+
+
+def sccp(bbs, cfg=None, verbose=0, stats=None):
+    '''
+    returns new blocks with the constants propagated and the branches on
+    constants folded. 'stats' gets the number of constant SSA names, replaced
+    uses, folded branches and deleted blocks
+    '''
+    cfg = bbstocfg(bbs) if cfg is None else cfg
+    dom = Dominance(bbs, cfg)
+    code = tossa(bbs, cfg, dom)
+    result = SCCP(code, cfg, function_entries(bbs))
+    stats = {} if stats is None else stats
+    stats.update({'constants': 0, 'uses': 0, 'branches': 0, 'blocks': 0})
+    code = rewrite(code, result, stats)
+    reached = {b: set(succ for succ in cfg[b] if (b, succ) in result.edges) for b in cfg}
+    res = [block for block in fromssa(code, reached) if block]
+    stats['blocks'] = len(bbs) - len(res)
+
+    if verbose > 0:  # pragma: no cover
+        from .bb import printbbs
+        print('\n' + ' Sparse Conditional Constant Propagation '.center(40, '#'))
+        printbbs(res)
+        print('%(constants)d constants, %(uses)d uses replaced, %(branches)d branches folded, '
+              '%(blocks)d blocks removed' % stats)
+    return res
+
+
+if __name__ == '__main__':
+    import argparse
+    from .parser import parsefile
+    from .three import asttothree
+    from .bb import threetobbs
+    from .lvn import lvn
+    from .dce import dce
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename", help="The *.mc file to optimize with sparse conditional constant propagation")
+    parser.add_argument('--lvn', '-l', action='count', default=False)
+    parser.add_argument('--dce', action='count', default=False,
+                        help="Remove the dead code (alternating with lvn until a fixpoint with --lvn)")
+    parser.add_argument('--verbose', '-v', action='count', default=0)
+    args = parser.parse_args()
+    bbs = threetobbs(asttothree(parsefile(args.filename, verbose=args.verbose - 2), verbose=args.verbose - 1),
+                     verbose=1)
+    if args.lvn:
+        bbs = lvn(bbs, verbose=1)
+    if args.dce:
+        bbs = dce(bbs, verbose=1, uselvn=args.lvn)
+    sccp(bbs, verbose=1)
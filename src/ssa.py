@@ -0,0 +1,276 @@
+from .cfg import bbstocfg
+from .dataflow import Liveness, solve, definition
+from .dominators import Dominance
+from .utils import op_uses_values, op_sets_result, simplify_op
+
+# Static single assignment form of the basic blocks:
+#   every definition of a variable (or a temporary) 'x' gets a new version
+#   'x.N', the name without a version is the value of x at the entry of its
+#   function. At the joins the versions are merged by phis
+#       ['phi', {predecessor block: value}, None, result]
+#   which stand at the begin of their block (after its label). The phis are
+#   placed on the iterated dominance frontiers of the definitions, but only
+#   where the variable is live (pruned SSA). Arrays aren't renamed.
+#
+# Out of SSA (Sreedhar et al. method I): every phi x.3 = phi(x.1, x.2) gets a
+# fresh name W, the copies W = x.1 and W = x.2 are appended to the
+# predecessors and the phi becomes x.3 = W. The versions of a variable which
+# don't interfere (none is live at a definition of the other one, the copies
+# don't count) are coalesced and the copies between them disappear. Without
+# optimizations in between all the versions get their original name again.
+
+
+class ValueLiveness(Liveness):
+    ''' an array access writes its result like any other definition '''
+    results = op_sets_result + ['arr-acc']
+
+
+def basename(name):
+    ''' 'x.3' -> 'x', '.t4.1' -> '.t4', names without a version are returned unchanged '''
+    head, _, tail = name.rpartition('.')
+    return head if head and tail.isdigit() else name
+
+
+def hidden(name):
+    ''' 'x.3' -> '.vx.3', the names of the temporaries and of other passes already start with a '.' '''
+    return name if name.startswith('.') else '.v' + name
+
+
+def uses(code):
+    ''' the positions of the values read by a three address code (not by a phi) '''
+    op = simplify_op(code[0])
+    if op == 'pop' or op not in op_uses_values:
+        return []
+    return op_uses_values[op]
+
+
+def phi_position(block):
+    ''' the phis of a block follow its label '''
+    return 1 if block and block[0][0] == 'label' else 0
+
+
+def tossa(bbs, cfg=None, dom=None, verbose=0):
+    ''' returns the blocks in SSA form, 'cfg' and 'dom' (dominators.Dominance) are computed if missing '''
+    cfg = bbstocfg(bbs) if cfg is None else cfg
+    dom = Dominance(bbs, cfg) if dom is None else dom
+    _, livein = solve(bbs, cfg, ValueLiveness(bbs))
+    defsites = {}
+    for b, block in enumerate(bbs):
+        for code in block:
+            var = definition(code)
+            if var is not None:
+                defsites.setdefault(var, set()).add(b)
+
+    # phi placement on the iterated dominance frontiers
+    phis = [{} for _ in bbs]
+    for var in sorted(defsites):
+        todo = sorted(defsites[var])
+        placed = set()
+        while todo:
+            b = todo.pop()
+            for frontier in dom.frontiers[b]:
+                if frontier not in placed and var in livein[frontier]:
+                    placed.add(frontier)
+                    phis[frontier][var] = ['phi', {}, None, var]
+                    if frontier not in defsites[var]:
+                        todo.append(frontier)
+
+    # renaming in a preorder walk of the dominator tree
+    counter = {}
+    stacks = {var: [] for var in defsites}
+
+    def newname(var):
+        counter[var] = counter.get(var, 0) + 1
+        name = '%s.%d' % (var, counter[var])
+        stacks[var].append(name)
+        return name
+
+    def current(arg):
+        if type(arg) is str and arg in stacks and stacks[arg]:
+            return stacks[arg][-1]
+        return arg
+
+    res = [None] * len(bbs)
+    for root in dom.roots:
+        todo = [(root, None)]
+        while todo:
+            b, pushed = todo.pop()
+            if pushed is not None:
+                for var in pushed:
+                    stacks[var].pop()
+                continue
+            pushed = []
+            # the label, then the phis (also in a block with only a label)
+            position = phi_position(bbs[b])
+            block = [list(code) for code in bbs[b][:position]]
+            for var in sorted(phis[b]):
+                phis[b][var][3] = newname(var)
+                pushed.append(var)
+                block.append(phis[b][var])
+            for code in bbs[b][position:]:
+                code = list(code)
+                for pos in uses(code):
+                    code[pos] = current(code[pos])
+                var = definition(code)
+                if var is not None:
+                    code[3] = newname(var)
+                    pushed.append(var)
+                block.append(code)
+            res[b] = block
+            for succ in cfg[b]:
+                for var, phi in phis[succ].items():
+                    phi[1][b] = current(var)
+            todo.append((b, pushed))
+            todo += [(child, None) for child in reversed(dom.tree[b])]
+
+    if verbose > 0:  # pragma: no cover
+        from .bb import printbbs
+        print('\n' + ' SSA '.center(40, '#'))
+        printbbs(res)
+    return res
+
+
+def copy_position(block, values):
+    ''' where the copies of the phis of a successor are inserted: before the jump at the end of the block,
+        a comparison directly before a 'jumpfalse' which reads it stays there (see utils.fused_compare_jumps) '''
+    if not block or block[-1][0] not in ['jump', 'jumpfalse']:
+        return len(block)
+    if block[-1][0] == 'jumpfalse' and len(block) > 1 and block[-2][3] == block[-1][1] and \
+            simplify_op(block[-2][0]) == 'binop' and block[-1][1] not in values:
+        return len(block) - 2
+    return len(block) - 1
+
+
+def fromssa(bbs, cfg=None, verbose=0):
+    ''' returns the blocks without phis, the code can be used by vm.run and codetoassembly again '''
+    cfg = bbstocfg(bbs) if cfg is None else cfg
+    versions = {}
+    for block in bbs:
+        for code in block:
+            if type(code[3]) is str:
+                base = basename(code[3])
+                suffix = code[3][len(base) + 1:]
+                versions[base] = max(versions.get(base, 0), int(suffix) if suffix else 0)
+
+    res = [list(block) for block in bbs]
+    copies = [[] for _ in bbs]
+    webs = set()
+    for b, block in enumerate(res):
+        for line, code in enumerate(block):
+            if code[0] != 'phi':
+                continue
+            base = basename(code[3])
+            versions[base] += 1
+            web = '%s.%d' % (base, versions[base])
+            webs.add(web)
+            for pred, value in sorted(code[1].items()):
+                copies[pred].append(['assign', value, None, web])
+            block[line] = ['assign', web, None, code[3]]
+    for b, block in enumerate(res):
+        if copies[b]:
+            pos = copy_position(block, set(copy[1] for copy in copies[b]))
+            block[pos:pos] = copies[b]
+
+    res = coalesce(res, cfg, webs)
+    if verbose > 0:  # pragma: no cover
+        from .bb import printbbs
+        print('\n' + ' Out of SSA '.center(40, '#'))
+        printbbs(res)
+    return res
+
+
+def coalesce(bbs, cfg, webs=()):
+    ''' gives the versions of a variable which don't interfere the same name and removes the copies from or to
+        the 'webs' (the names of the phis) which became useless, the other copies stay like in the source '''
+    analysis = ValueLiveness(bbs)
+    liveout, _ = solve(bbs, cfg, analysis)
+    bit = analysis.bit
+
+    # the names of every variable in the order of their first appearance
+    groups = {}
+    groupmask = {}
+    for block in bbs:
+        for code in block:
+            names = [code[pos] for pos in uses(code)] + [definition(code)]
+            for name in names:
+                if type(name) is not str:
+                    continue
+                base = basename(name)
+                if name not in groups.setdefault(base, {}):
+                    groups[base][name] = len(groups[base])
+                    groupmask[base] = groupmask.get(base, 0) | bit(name)
+
+    # interference with the versions of the same variable which are live at a definition
+    interference = {}
+    for b, block in enumerate(bbs):
+        live = liveout.masks[b]
+        for code in reversed(block):
+            var = definition(code)
+            if var is not None:
+                mask = live & ~bit(var) & groupmask[basename(var)]
+                if code[0] == 'assign' and type(code[1]) is str:
+                    mask &= ~bit(code[1])
+                interference[var] = interference.get(var, 0) | mask
+                live &= ~bit(var)
+            for pos in uses(code):
+                if type(code[pos]) is str:
+                    live |= bit(code[pos])
+
+    rename = {}
+    for base, names in groups.items():
+        # [members, their bits, the bits interfering with them]
+        classes = []
+        for name in sorted(names, key=names.get):
+            for cls in classes:
+                if not (cls[1] & interference.get(name, 0)) and not (cls[2] & bit(name)):
+                    cls[0].append(name)
+                    cls[1] |= bit(name)
+                    cls[2] |= interference.get(name, 0)
+                    break
+            else:
+                classes.append([[name], bit(name), interference.get(name, 0)])
+        # the original name for the class of the first name (the value at the entry or the declaration),
+        # the other classes get a name with a '.' like the temporaries, the vm leaves them out of its result
+        for cls in classes:
+            for name in cls[0]:
+                rename[name] = base if cls is classes[0] else hidden(cls[0][0])
+
+    res = []
+    for block in bbs:
+        newblock = []
+        for code in block:
+            if code[0] == 'assign' and code[2] is None and (code[1] in webs or code[3] in webs) and \
+                    type(code[1]) is str and rename[code[1]] == rename[code[3]]:
+                continue
+            code = list(code)
+            for pos in uses(code):
+                if type(code[pos]) is str:
+                    code[pos] = rename[code[pos]]
+            if definition(code) is not None:
+                code[3] = rename[code[3]]
+            newblock.append(code)
+        res.append(newblock)
+    return res
+
+
+if __name__ == '__main__':
+    import argparse
+    from .parser import parsefile
+    from .three import asttothree
+    from .bb import threetobbs
+    from .lvn import lvn
+    from .dce import dce
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename", help="The *.mc file to convert into SSA form and back")
+    parser.add_argument('--lvn', '-l', action='count', default=False)
+    parser.add_argument('--dce', action='count', default=False,
+                        help="Remove the dead code (alternating with lvn until a fixpoint with --lvn)")
+    parser.add_argument('--verbose', '-v', action='count', default=0)
+    args = parser.parse_args()
+    bbs = threetobbs(asttothree(parsefile(args.filename, verbose=args.verbose - 2), verbose=args.verbose - 1),
+                     verbose=1)
+    if args.lvn:
+        bbs = lvn(bbs, verbose=1)
+    if args.dce:
+        bbs = dce(bbs, verbose=1, uselvn=args.lvn)
+    fromssa(tossa(bbs, verbose=1), verbose=1)
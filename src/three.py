@@ -358,6 +358,9 @@ def asttothree(ast, three=None, scope=None, result=None, verbose=0):
 def prettythreestr(op, arg1, arg2, res):  # pragma: no cover
     if op == 'assign':
         return '{:.6s}\t:=\t{:.6s}'.format(res, str(arg1))
+    elif op == 'phi':
+        # ssa.py: arg1 is {predecessor block: value}
+        return '{:s}\t:=\tphi({:s})'.format(res, ', '.join('%s: %s' % el for el in sorted(arg1.items())))
     elif op in all_ops:
         if res is None:
             # return, end-fun, push, array-def
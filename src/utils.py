@@ -71,6 +71,68 @@ def isvar(arg):
     return True
 
 
+def fused_compare_jumps(code):
+    '''
+    Returns the lines of the comparisons whose result is a temporary which is
+    only used by the directly following 'jumpfalse':
+        .t1 = a < b
+        jumpfalse .t1 L1
+    The code generators emit such a pair as a single compare-and-branch.
+    '''
+    uses = {}
+    for tac in code:
+        op = simplify_op(tac[0])
+        if op == 'pop':
+            continue
+        for pos in op_uses_values.get(op, []):
+            uses[tac[pos]] = uses.get(tac[pos], 0) + 1
+    fused = set()
+    for line, (op, _, _, result) in enumerate(code[:-1]):
+        nextop, nextarg, _, _ = code[line + 1]
+        if op in op_is_comp and nextop == 'jumpfalse' and nextarg == result and \
+                type(result) is str and not isvar(result) and uses[result] == 1:
+            fused.add(line)
+    return fused
+
+
+def is_constant(arg):
+    return type(arg) in [int, float]
+
+
+def fold_constant(op, arg1, arg2=None):
+    '''
+    The value of 'op' on the constants arg1 (and arg2), None if it can't be
+    computed at compile time with the same result in the vm and the
+    generated code: an int result must fit into 32 bits, the division and the
+    remainder are only folded for non negative ints (the vm rounds down, x86
+    towards zero) and both operands must have the same type.
+    '''
+    if op in un_ops:
+        if op == 'u!':
+            return int(not arg1)
+        res = -arg1
+    elif type(arg1) is not type(arg2):
+        return None
+    elif op in op_is_comp:
+        return int({
+            '==': arg1 == arg2,
+            '!=': arg1 != arg2,
+            '<=': arg1 <= arg2,
+            '>=': arg1 >= arg2,
+            '<': arg1 < arg2,
+            '>': arg1 > arg2,
+        }[op])
+    elif op in ['/', '%']:
+        if type(arg1) is not int or arg1 < 0 or arg2 <= 0:
+            return None
+        res = arg1 // arg2 if op == '/' else arg1 % arg2
+    else:
+        res = {'+': lambda a, b: a + b, '-': lambda a, b: a - b, '*': lambda a, b: a * b}[op](arg1, arg2)
+    if type(res) is int and not -2 ** 31 <= res < 2 ** 31:
+        return None
+    return res
+
+
 # TODO function_ranges should only work on code, not basic blocks
 def function_ranges(bbs, asDic=False):
     '''
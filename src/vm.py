@@ -1,7 +1,9 @@
+from array import array
 from collections import namedtuple
-from .utils import function_ranges
+from .utils import function_ranges, lib_sigs, fused_compare_jumps
 
-Frame = namedtuple('Frame', ['start', 'end', 'mem', 'arg_to_mem'])
+Frame = namedtuple('Frame', ['start', 'end', 'mem', 'arg_to_mem', 'name'])
+engines = ['interpreter', 'threaded', 'pygen']
 opcode = [
     'assign',     # 00
     'jump',       # 01
@@ -23,7 +25,23 @@ opcode = [
     'return',     # 17
     'push',       # 18
     'pop',        # 19
+    'arr-def',    # 20
+    'arr-acc',    # 21
+    'arr-ass',    # 22
+    # fused comparison + 'jumpfalse' (see utils.fused_compare_jumps):
+    # goto 'result' unless 'arg1 OP arg2'
+    'jumpfalse<=',  # 23
+    'jumpfalse>=',  # 24
+    'jumpfalse==',  # 25
+    'jumpfalse!=',  # 26
+    'jumpfalse<',   # 27
+    'jumpfalse>',   # 28
 ]
+compare_jumps = ['jumpfalse' + op for op in ['<=', '>=', '==', '!=', '<', '>']]
+# the result of 'arr-def' is the index of the element type,
+# arrays are stored as 'array's of 32-bit ints/floats (the sizes of the assembler)
+arraytypes = ['int', 'float']
+arraytypecodes = ['i', 'f']
 
 
 def bbs_to_bytecode(bbs, verbose=0):
@@ -36,6 +54,13 @@ def bbs_to_bytecode(bbs, verbose=0):
         else:  # need to create a new global which calls main
             bbs.insert(0, [['call', None, None, 'main']])
 
+    # the library functions have no I/O in the vm:
+    # 'print_*' drop their argument and 'read_*' return 0
+    called = set(result for bb in bbs for op, _, _, result in bb if op == 'call')
+    for name, rettype, params in lib_sigs:
+        if name in called and name not in functions:
+            bbs.append(lib_function(name, rettype, params))
+
     # flatten basic blocks into code
     # remove [label, function, end-fun] instructions but remember
     #   * line number of labels
@@ -44,15 +69,22 @@ def bbs_to_bytecode(bbs, verbose=0):
     fun_ranges = function_ranges(bbs)
     func_starter = {}
     label_to_line = {}
+    # a comparison which is only used by the next 'jumpfalse' becomes a 'jumpfalse<op>'
     for fun, start, end in fun_ranges:
         funstart = len(code)
-        for bb in bbs[start:end]:
-            for tac in bb:
-                op, _, _, result = tac
-                if op == 'label':
-                    label_to_line[result] = len(code)
-                if op not in ['label', 'function', 'end-fun']:
-                    code.append(tac)
+        funcode = [tac for bb in bbs[start:end] for tac in bb]
+        fused = fused_compare_jumps(funcode)
+        for line, tac in enumerate(funcode):
+            op, arg1, arg2, result = tac
+            if line - 1 in fused:
+                continue
+            if line in fused:
+                _, _, _, label = funcode[line + 1]
+                tac = ['jumpfalse' + op, arg1, arg2, label]
+            if op == 'label':
+                label_to_line[result] = len(code)
+            if op not in ['label', 'function', 'end-fun']:
+                code.append(tac)
         func_starter[fun] = [funstart, len(code)]
     exitline = func_starter['main' if 'main' in func_starter else '__global__'][1] - 1
     func_starter = sorted([(name, start, end) for name, (start, end) in func_starter.items()], key=lambda x: x[1])
@@ -63,68 +95,120 @@ def bbs_to_bytecode(bbs, verbose=0):
     for func, start, end in func_starter:
         mem = []
         arg_to_mem = {}
+        # constants are keyed by type too, '1' and '1.0' need different slots
+        slots = {}
 
         def memloc(arg):
             if arg is None:
                 return None
-            if arg in arg_to_mem:
-                return arg_to_mem[arg]
-            arg_to_mem[arg] = len(arg_to_mem)
-            if type(arg) is str:
-                mem.append(None)
-            else:
-                mem.append(arg)
-            return arg_to_mem[arg]
+            key = arg if type(arg) is str else (type(arg), arg)
+            if key not in slots:
+                slots[key] = len(mem)
+                arg_to_mem[arg] = len(mem)
+                if type(arg) is str:
+                    mem.append(None)
+                else:
+                    mem.append(arg)
+            return slots[key]
 
         # rewrite instructions with opcodes
         # line number for jumps instead of labels
         # memlocations instead of registernames
         for j, (op, arg1, arg2, result) in enumerate(code[start:end]):
             i = j + start
-            if op in ['jump', 'jumpfalse']:
+            if op in ['jump', 'jumpfalse'] or op in compare_jumps:
                 result = label_to_line[result]
                 arg1, arg2 = (memloc(el) for el in [arg1, arg2])
             elif op == 'call':
                 result = func_to_num[result]
+            elif op == 'arr-def':
+                arg1, arg2 = (memloc(el) for el in [arg1, arg2])
+                result = arraytypes.index(result)
             else:
                 arg1, arg2, result = (memloc(el) for el in [arg1, arg2, result])
             op = opcode.index(op)
             code[i][0], code[i][1], code[i][2], code[i][3] = op, arg1, arg2, result
-        frames.append(Frame(start, end - 1, mem, arg_to_mem))
+        frames.append(Frame(start, end - 1, mem, arg_to_mem, func))
 
     return code, frames, exitline
 
 
+def lib_function(name, rettype, params):
+    bb = [['function', None, None, name]]
+    bb += [['pop', None, paramtype, paramname] for paramtype, paramname in params]
+    if rettype != 'void':
+        bb.append(['push', 0 if rettype == 'int' else 0.0, None, None])
+    return bb + [['return', None, None, None], ['end-fun', None, None, None]]
+
+
 def generate_bytecode(bbs, bcfile, verbose=0):
+    ''' writes the binary bytecode file (see bytecode.py), 'python -m src.vm --load bcfile' runs it '''
     if len(bbs) == 0:
         return
-    code, mem, arg_to_mem = bbs_to_bytecode(bbs)
-    mem_to_arg = {k: v for v, k in arg_to_mem.items()}
-
-    with open(bcfile, 'w') as f:
-        f.write('%d %d\n' % (len(mem), len(code)))
-        for i in range(len(mem)):
-            name = str(mem_to_arg[i])
-            val = 0 if mem[i] is None else mem[i]
-            f.write('%s %s\n' % (name, val))
-        for op, arg1, arg2, result in code:
-            f.write(' '.join([str(-1 if el is None else el) for el in [op, arg1, arg2, result]]) + '\n')
+    from .bytecode import write_bytecode
+    code, frames, exitline = bbs_to_bytecode(bbs)
+    write_bytecode(code, frames, exitline, bcfile)
+    if verbose > 0:  # pragma: no cover
+        print('\n' + ' VM bytecode file '.center(40, '#'))
+        print('%s: %d instructions, %d frames' % (bcfile, len(code), len(frames)))
 
 
-def run(bbs, verbose=0):
+def run(bbs, verbose=0, engine='interpreter', profile=None):
+    ''' engine is one of
+            'interpreter'   decodes every instruction in a single loop
+            'threaded'      pre-compiles every instruction into a closure (see vmthreaded.py)
+            'pygen'         translates every function into Python source code (see vmpygen.py)
+        if a vmprofile.Profile is given, the interpreter fills its counters
+    '''
     if len(bbs) == 0:
         return {}
 
     # code, mem, arg_to_mem = bbs_to_bytecode(bbs)
     code, frames, exitline = bbs_to_bytecode(bbs, verbose)
+    return run_bytecode(code, frames, exitline, verbose, engine, profile)
+
+
+def run_bytecode(code, frames, exitline, verbose=0, engine='interpreter', profile=None):
+    if profile is not None:
+        if engine != 'interpreter':
+            raise NotImplementedError('Only the interpreter can be profiled')
+        from .vmprofile import profiled
+        currframe, mem = profiled(code, frames, exitline, profile)
+    elif engine == 'interpreter':
+        currframe, mem = interpret(code, frames, exitline)
+    elif engine == 'threaded':
+        from .vmthreaded import threaded
+        currframe, mem = threaded(code, frames, exitline)
+    elif engine == 'pygen':
+        from .vmpygen import pygen
+        currframe, mem = pygen(code, frames, exitline)
+    else:
+        raise NotImplementedError('Unknown engine "%s"' % engine)
 
+    vals = {arg: mem[mempos] for arg, mempos in currframe.arg_to_mem.items()
+            if type(arg) is str and not arg.startswith('.')}
+    if verbose > 0:  # pragma: no cover
+        print('\n' + ' VM result '.center(40, '#'))
+        print(vals)
+    if verbose > 1:  # pragma: no cover
+        print('\n' + ' VM bytecode '.center(40, '#'))
+        printbytecode(code, frames)
+    return vals
+
+
+def interpret(code, frames, exitline):
     currframe = frames[0]
     pc = currframe.start
-    mem = [el for el in currframe.mem]
+    mem = list(currframe.mem)
     paramstack = []
-    framestack = [mem, (pc, currframe)]
+    # (return pc, mem, frame, freelist) of the callers
+    framestack = []
+    # the memory of returned calls is recycled for the next call of the same function:
+    # the constants are never overwritten and every variable is assigned before it is read
+    freelists = [[] for _ in frames]
+    freelist = freelists[0]
 
-    while len(framestack) > 2 or pc <= exitline:
+    while framestack or pc <= exitline:
         op, arg1, arg2, result = code[pc]
         # print(pc, paramstack, [(name,mem[i]) for name,i in arg_to_mem.items()],framestack)
         if op == 0:
@@ -136,6 +220,30 @@ def run(bbs, verbose=0):
             if not mem[arg1]:
                 pc = result
                 continue
+        elif op == 27:
+            if not mem[arg1] < mem[arg2]:
+                pc = result
+                continue
+        elif op == 28:
+            if not mem[arg1] > mem[arg2]:
+                pc = result
+                continue
+        elif op == 23:
+            if not mem[arg1] <= mem[arg2]:
+                pc = result
+                continue
+        elif op == 24:
+            if not mem[arg1] >= mem[arg2]:
+                pc = result
+                continue
+        elif op == 25:
+            if not mem[arg1] == mem[arg2]:
+                pc = result
+                continue
+        elif op == 26:
+            if not mem[arg1] != mem[arg2]:
+                pc = result
+                continue
         elif op == 3:
             mem[result] = mem[arg1] <= mem[arg2]
         elif op == 4:
@@ -163,76 +271,139 @@ def run(bbs, verbose=0):
         elif op == 15:
             mem[result] = not mem[arg1]
         elif op == 16:
+            framestack.append((pc, mem, currframe, freelist))
             currframe = frames[result]
-            mem = [el for el in currframe.mem]
-            framestack.extend([mem, (pc, currframe)])
+            freelist = freelists[result]
+            mem = freelist.pop() if freelist else list(currframe.mem)
             pc = currframe.start
             continue
         elif op == 17:
             if pc == exitline:
                 break
-            _, (pc, _) = framestack[-2:]
-            del framestack[-2:]
-            mem, (_, currframe) = framestack[-2:]
+            freelist.append(mem)
+            pc, mem, currframe, freelist = framestack.pop()
         elif op == 18:
             paramstack.append(mem[arg1])
         elif op == 19:
             mem[result] = paramstack.pop()
+        elif op == 20:
+            mem[arg2] = array(arraytypecodes[result], [0]) * mem[arg1]
+        elif op == 21:
+            mem[result] = mem[arg2][mem[arg1]]
+        elif op == 22:
+            mem[result][mem[arg1]] = mem[arg2]
         pc += 1
 
-    vals = {arg: mem[mempos] for arg, mempos in currframe.arg_to_mem.items()
-            if type(arg) is str and not arg.startswith('.t')}
-    if verbose > 0:  # pragma: no cover
-        print('\n' + ' VM result '.center(40, '#'))
-        print(vals)
-    if verbose > 1:  # pragma: no cover
-        print('\n' + ' VM bytecode '.center(40, '#'))
-        mem_to_arg = {k: v for v, k in arg_to_mem.items()}
-        for linenum, (op, arg1, arg2, res) in enumerate(code):
+    return currframe, mem
+
+
+def printbytecode(code, frames):  # pragma: no cover
+    for frame in frames:
+        mem_to_arg = {k: v for v, k in frame.arg_to_mem.items()}
+        for linenum in range(frame.start, frame.end + 1):
+            op, arg1, arg2, res = code[linenum]
             op = opcode[op]
-            if op == 'assign':
-                res = mem_to_arg[res]
-                arg1 = mem_to_arg[arg1]
-            elif op == 'jumpfalse':
-                arg1 = mem_to_arg[arg1]
-            elif op == 'jump':
-                pass
-            else:
-                res = mem_to_arg[res]
-                arg1 = mem_to_arg[arg1]
-                arg2 = mem_to_arg[arg2]
-            if res is None:
-                res = ''
-            if arg1 is None:
-                arg1 = ''
-            if arg2 is None:
-                arg2 = ''
-            res, arg1, arg2 = str(res), str(arg1), str(arg2)
+            if op in ['jump', 'jumpfalse']:
+                arg1 = mem_to_arg.get(arg1)
+            elif op in compare_jumps:
+                arg1, arg2 = mem_to_arg.get(arg1), mem_to_arg.get(arg2)
+            elif op == 'arr-def':
+                arg1, arg2, res = mem_to_arg.get(arg1), mem_to_arg.get(arg2), arraytypes[res]
+            elif op != 'call':
+                res, arg1, arg2 = (mem_to_arg.get(el) for el in [res, arg1, arg2])
+            res, arg1, arg2 = ('' if el is None else str(el) for el in [res, arg1, arg2])
             print('{:>3}\t{:10}\t{:10}\t{:10}\t{:10}'.format(str(linenum), op, arg1, arg2, res))
-    return vals
+
+def benchmark(code, frames, exitline, repeat=3):  # pragma: no cover
+    import timeit
+    print('\n' + ' VM engines '.center(40, '#'))
+    results = {}
+    for engine in engines:
+        vals = []
+        timer = timeit.Timer(lambda: vals.append(run_bytecode(code, frames, exitline, engine=engine)))
+        number, _ = timer.autorange()
+        seconds = min(timer.repeat(number=number, repeat=repeat)) / number
+        results[engine] = (seconds, vals[0])
+        speedup = results['interpreter'][0] / seconds
+        same = 'same result' if vals[0] == results['interpreter'][1] else 'DIFFERENT RESULT'
+        print('%s%10.6fs  %5.2fx  %s' % (engine.ljust(15), seconds, speedup, same))
+    return results
 
 if __name__ == '__main__':
     import argparse
-    from .parser import parsefile
-    from .three import asttothree
-    from .bb import threetobbs
-    from .lvn import lvn
     parser = argparse.ArgumentParser()
-    parser.add_argument("filename", help="The *.mc file to run.")
+    parser.add_argument("filename", nargs='?', help="The *.mc file to run.")
     parser.add_argument('--lvn', '-l', action='count', default=False)
-    parser.add_argument('--bcfile', '-b', default=None)
+    parser.add_argument('--sccp', '-s', action='count', default=False,
+                        help="Propagate the constants and fold the branches on them (sparse conditional)")
+    parser.add_argument('--dce', action='count', default=False,
+                        help="Remove the dead code (alternating with lvn until a fixpoint with --lvn)")
+    parser.add_argument('--licm', action='count', default=False,
+                        help="Hoist the loop-invariant code into preheaders of the loops")
+    parser.add_argument('--bcfile', '-b', default=None, help="Write the binary bytecode to this file")
+    parser.add_argument('--load', default=None,
+                        help="Run a binary bytecode file (without the compiler stages)")
+    parser.add_argument('--cache', '-c', nargs='?', const='.mccache', default=None,
+                        help="Reuse the compiled stages of unchanged files from this cache directory")
+    parser.add_argument('--engine', '-e', choices=engines, default='interpreter')
+    parser.add_argument('--benchmark', action='count', default=False,
+                        help="Run the program with every engine and compare the times")
+    parser.add_argument('--profile', '-p', action='count', default=False,
+                        help="Profile the interpreter (opcodes, lines, functions, loops)")
+    parser.add_argument('--collapsed', default=None,
+                        help="Write the profiled call stacks to this file (for flame graph tools)")
     parser.add_argument('--verbose', '-v', action='count', default=0)
     args = parser.parse_args()
-    bbs = threetobbs(
-        asttothree(
-            parsefile(
-                args.filename,
-                verbose=args.verbose - 2),
-            verbose=args.verbose - 1),
-        verbose=args.verbose)
-    if args.lvn:
-        bbs = lvn(bbs, verbose=1)
-    if args.bcfile is not None:
-        generate_bytecode(bbs, args.bcfile, args.verbose + 1)
+
+    def execute(code, frames, exitline):
+        if args.benchmark:
+            benchmark(code, frames, exitline)
+        elif args.profile or args.collapsed is not None:
+            from .vmprofile import Profile, printreport
+            profile = Profile()
+            run_bytecode(code, frames, exitline, args.verbose + 1, args.engine, profile)
+            printreport(profile)
+            if args.collapsed is not None:
+                with open(args.collapsed, 'w') as f:
+                    f.write(profile.collapsed())
+        else:
+            run_bytecode(code, frames, exitline, args.verbose + 1, args.engine)
+
+    if args.load is not None:
+        from .bytecode import load_bytecode
+        execute(*load_bytecode(args.load))
     else:
-        run(bbs, args.verbose + 1)
+        if args.filename is None:
+            parser.error('the filename (or --load) is required')
+        if args.cache is not None:
+            from .cache import CompilationCache, CachedPipeline
+            pipeline = CachedPipeline(args.filename, CompilationCache(args.cache, verbose=args.verbose), args.lvn,
+                                      usesccp=args.sccp, usedce=args.dce, uselicm=args.licm)
+            bbs = pipeline.bbs()
+        else:
+            from .parser import parsefile
+            from .three import asttothree
+            from .bb import threetobbs
+            from .lvn import lvn
+            from .sccp import sccp
+            from .dce import dce
+            from .licm import licm
+            bbs = threetobbs(
+                asttothree(
+                    parsefile(
+                        args.filename,
+                        verbose=args.verbose - 2),
+                    verbose=args.verbose - 1),
+                verbose=args.verbose)
+            if args.lvn:
+                bbs = lvn(bbs, verbose=1)
+            if args.sccp:
+                bbs = sccp(bbs, verbose=args.verbose)
+            if args.dce:
+                bbs = dce(bbs, verbose=args.verbose, uselvn=args.lvn)
+            if args.licm:
+                bbs = licm(bbs, verbose=args.verbose)
+        if args.bcfile is not None:
+            generate_bytecode(bbs, args.bcfile, args.verbose + 1)
+        elif len(bbs) > 0:
+            execute(*bbs_to_bytecode(bbs))
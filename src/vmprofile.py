@@ -0,0 +1,305 @@
+from array import array
+from time import perf_counter
+from .vm import opcode, arraytypecodes
+
+# Profiling interpreter:
+#   a copy of vm.interpret which additionally counts
+#       * the executions of every pc (the opcode and function counts are derived from them)
+#       * the taken backward jumps (the loops)
+#   and at every call/return the calls, time and executed instructions of the
+#   current call stack. The call stacks are the nodes of a tree (a node is
+#   its caller's node + the called frame), the time and calls of the
+#   functions (inclusive and exclusive) are summed up from the tree afterwards.
+#   vm.interpret stays untouched, so there is no overhead without profiling.
+
+
+class Profile(object):
+    ''' the counters of one profiled run, filled by 'profiled' '''
+
+    def __init__(self):
+        self.reset([], [])
+
+    def reset(self, code, frames):
+        self.code = code
+        self.frames = frames
+        self.pccounts = [0] * len(code)
+        self.backjumps = [0] * len(code)
+        # the call stack tree, node 0 is the top-level frame
+        self.stackframe = []
+        self.stackparent = []
+        self.stackchildren = {}
+        self.stackcalls = []
+        self.stackcounts = []
+        self.stacktimes = []
+        if frames:
+            self.addnode(None, 0)
+
+    def addnode(self, parent, framenum):
+        node = len(self.stackframe)
+        self.stackframe.append(framenum)
+        self.stackparent.append(parent)
+        self.stackchildren[(parent, framenum)] = node
+        self.stackcalls.append(0)
+        self.stackcounts.append(0)
+        self.stacktimes.append(0.0)
+        return node
+
+    def framenum(self, pc):
+        for num, frame in enumerate(self.frames):
+            if frame.start <= pc <= frame.end:
+                return num
+
+    def stack(self, node):
+        res = []
+        while node is not None:
+            res.append(self.frames[self.stackframe[node]].name)
+            node = self.stackparent[node]
+        return res[::-1]
+
+    def inclusive(self):
+        ''' time per frame including the callees, a recursive call is already included in its caller '''
+        subtree = list(self.stacktimes)
+        # the children have larger node numbers than their parents
+        for node in range(len(subtree) - 1, 0, -1):
+            subtree[self.stackparent[node]] += subtree[node]
+        children = [[] for _ in subtree]
+        for node in range(1, len(subtree)):
+            children[self.stackparent[node]].append(node)
+        res = [0.0] * len(self.frames)
+        onpath = [0] * len(self.frames)
+        todo = [(0, True)]
+        while todo:
+            node, enter = todo.pop()
+            framenum = self.stackframe[node]
+            if enter:
+                if onpath[framenum] == 0:
+                    res[framenum] += subtree[node]
+                onpath[framenum] += 1
+                todo.append((node, False))
+                todo += [(child, True) for child in children[node]]
+            else:
+                onpath[framenum] -= 1
+        return res
+
+    def opcodes(self):
+        counts = {}
+        for (op, _, _, _), count in zip(self.code, self.pccounts):
+            if count > 0:
+                counts[opcode[op]] = counts.get(opcode[op], 0) + count
+        return counts
+
+    def functions(self):
+        calls = [0] * len(self.frames)
+        exclusive = [0.0] * len(self.frames)
+        for node, framenum in enumerate(self.stackframe):
+            calls[framenum] += self.stackcalls[node]
+            exclusive[framenum] += self.stacktimes[node]
+        inclusive = self.inclusive()
+        res = []
+        for num, frame in enumerate(self.frames):
+            res.append({
+                'name': frame.name,
+                'calls': calls[num],
+                'instructions': sum(self.pccounts[frame.start:frame.end + 1]),
+                'inclusive': inclusive[num],
+                'exclusive': exclusive[num],
+            })
+        return res
+
+    def loops(self):
+        ''' every taken backward jump is a loop [target, jump] '''
+        res = []
+        for pc, count in enumerate(self.backjumps):
+            if count == 0:
+                continue
+            start = self.code[pc][3]
+            res.append({
+                'function': self.frames[self.framenum(pc)].name,
+                'start': start,
+                'end': pc,
+                'iterations': count,
+                'instructions': sum(self.pccounts[start:pc + 1]),
+            })
+        return sorted(res, key=lambda loop: -loop['instructions'])
+
+    def report(self):
+        return {
+            'instructions': sum(self.pccounts),
+            'opcodes': self.opcodes(),
+            'lines': [(pc, opcode[self.code[pc][0]], count) for pc, count in enumerate(self.pccounts) if count > 0],
+            'functions': self.functions(),
+            'loops': self.loops(),
+        }
+
+    def collapsed(self):
+        ''' 'caller;callee count' lines (weighted by executed instructions) for flame graph tools '''
+        counts = {}
+        for node, count in enumerate(self.stackcounts):
+            if count > 0:
+                stack = ';'.join(self.stack(node))
+                counts[stack] = counts.get(stack, 0) + count
+        return ''.join('%s %d\n' % (stack, count) for stack, count in sorted(counts.items()))
+
+
+def profiled(code, frames, exitline, profile):
+    ''' same semantics as vm.interpret, the counters are stored in 'profile' '''
+    profile.reset(code, frames)
+    counts = profile.pccounts
+    backjumps = profile.backjumps
+    children = profile.stackchildren
+    stackcalls = profile.stackcalls
+    stackcounts = profile.stackcounts
+    stacktimes = profile.stacktimes
+
+    currframe = frames[0]
+    pc = currframe.start
+    mem = list(currframe.mem)
+    paramstack = []
+    framestack = []
+    freelists = [[] for _ in frames]
+    freelist = freelists[0]
+
+    node = 0
+    stackcalls[0] += 1
+    steps = laststeps = 0
+    lasttime = perf_counter()
+
+    while framestack or pc <= exitline:
+        counts[pc] += 1
+        steps += 1
+        op, arg1, arg2, result = code[pc]
+        if op == 0:
+            mem[result] = mem[arg1]
+        elif op == 1:
+            if result <= pc:
+                backjumps[pc] += 1
+            pc = result
+            continue
+        elif op == 2:
+            if not mem[arg1]:
+                if result <= pc:
+                    backjumps[pc] += 1
+                pc = result
+                continue
+        elif op == 27:
+            if not mem[arg1] < mem[arg2]:
+                if result <= pc:
+                    backjumps[pc] += 1
+                pc = result
+                continue
+        elif op == 28:
+            if not mem[arg1] > mem[arg2]:
+                if result <= pc:
+                    backjumps[pc] += 1
+                pc = result
+                continue
+        elif op == 23:
+            if not mem[arg1] <= mem[arg2]:
+                if result <= pc:
+                    backjumps[pc] += 1
+                pc = result
+                continue
+        elif op == 24:
+            if not mem[arg1] >= mem[arg2]:
+                if result <= pc:
+                    backjumps[pc] += 1
+                pc = result
+                continue
+        elif op == 25:
+            if not mem[arg1] == mem[arg2]:
+                if result <= pc:
+                    backjumps[pc] += 1
+                pc = result
+                continue
+        elif op == 26:
+            if not mem[arg1] != mem[arg2]:
+                if result <= pc:
+                    backjumps[pc] += 1
+                pc = result
+                continue
+        elif op == 3:
+            mem[result] = mem[arg1] <= mem[arg2]
+        elif op == 4:
+            mem[result] = mem[arg1] >= mem[arg2]
+        elif op == 5:
+            mem[result] = mem[arg1] == mem[arg2]
+        elif op == 6:
+            mem[result] = mem[arg1] != mem[arg2]
+        elif op == 7:
+            mem[result] = mem[arg1] < mem[arg2]
+        elif op == 8:
+            mem[result] = mem[arg1] > mem[arg2]
+        elif op == 9:
+            mem[result] = mem[arg1] + mem[arg2]
+        elif op == 10:
+            mem[result] = mem[arg1] - mem[arg2]
+        elif op == 11:
+            mem[result] = mem[arg1] * mem[arg2]
+        elif op == 12:
+            mem[result] = mem[arg1] // mem[arg2]
+        elif op == 13:
+            mem[result] = mem[arg1] % mem[arg2]
+        elif op == 14:
+            mem[result] = -mem[arg1]
+        elif op == 15:
+            mem[result] = not mem[arg1]
+        elif op == 16:
+            now = perf_counter()
+            stacktimes[node] += now - lasttime
+            stackcounts[node] += steps - laststeps
+            lasttime, laststeps = now, steps
+            framestack.append((pc, mem, currframe, freelist, node))
+            child = children.get((node, result))
+            node = profile.addnode(node, result) if child is None else child
+            stackcalls[node] += 1
+            currframe = frames[result]
+            freelist = freelists[result]
+            mem = freelist.pop() if freelist else list(currframe.mem)
+            pc = currframe.start
+            continue
+        elif op == 17:
+            if pc == exitline:
+                break
+            now = perf_counter()
+            stacktimes[node] += now - lasttime
+            stackcounts[node] += steps - laststeps
+            lasttime, laststeps = now, steps
+            freelist.append(mem)
+            pc, mem, currframe, freelist, node = framestack.pop()
+        elif op == 18:
+            paramstack.append(mem[arg1])
+        elif op == 19:
+            mem[result] = paramstack.pop()
+        elif op == 20:
+            mem[arg2] = array(arraytypecodes[result], [0]) * mem[arg1]
+        elif op == 21:
+            mem[result] = mem[arg2][mem[arg1]]
+        elif op == 22:
+            mem[result][mem[arg1]] = mem[arg2]
+        pc += 1
+
+    stacktimes[node] += perf_counter() - lasttime
+    stackcounts[node] += steps - laststeps
+    return currframe, mem
+
+
+def printreport(profile, top=10):  # pragma: no cover
+    report = profile.report()
+    print('\n' + ' VM profile '.center(40, '#'))
+    print('%d instructions' % report['instructions'])
+    print('\n' + ' Opcodes '.center(40, '-'))
+    for op, count in sorted(report['opcodes'].items(), key=lambda el: -el[1]):
+        print('{:10}{:>12}'.format(op, count))
+    print('\n' + ' Functions '.center(40, '-'))
+    print('{:20}{:>8}{:>12}{:>12}{:>12}'.format('function', 'calls', 'instr', 'incl [s]', 'excl [s]'))
+    for fun in sorted(report['functions'], key=lambda fun: -fun['inclusive']):
+        if fun['calls'] > 0:
+            print('{:20}{:>8}{:>12}{:>12.6f}{:>12.6f}'.format(
+                fun['name'], fun['calls'], fun['instructions'], fun['inclusive'], fun['exclusive']))
+    print('\n' + ' Hottest lines '.center(40, '-'))
+    for pc, op, count in sorted(report['lines'], key=lambda line: -line[2])[:top]:
+        print('{:>5}  {:10}{:>12}'.format(pc, op, count))
+    print('\n' + ' Hottest loops '.center(40, '-'))
+    for loop in report['loops'][:top]:
+        print('{:20}{:>5} - {:<5}{:>10} iterations{:>12} instructions'.format(
+            loop['function'], loop['start'], loop['end'], loop['iterations'], loop['instructions']))
@@ -0,0 +1,186 @@
+import sys
+from array import array
+from .vm import opcode, arraytypecodes, compare_jumps
+
+# Python source generation engine:
+#   every function (frame) of the bytecode is translated into the source of a
+#   Python function, which is compiled once and then called directly
+#       * the memory slots become local variables 'm0, m1, ...',
+#         constants are inlined as literals
+#       * the basic blocks become the cases of a 'while True' state machine,
+#         a jump sets 'pc' and continues the loop
+#       * 'call' is a Python call of the generated function,
+#         the arguments and return values still use the shared parameter stack
+#   The vm stops if the return at 'exitline' is executed (VMExit is raised
+#   through all active calls) or if the top-level frame runs past its end.
+
+binop_symbol = {
+    '<=': '<=',
+    '>=': '>=',
+    '==': '==',
+    '!=': '!=',
+    '<': '<',
+    '>': '>',
+    '+': '+',
+    '-': '-',
+    '*': '*',
+    '/': '//',
+    '%': '%',
+}
+unop_symbol = {
+    'u-': '-',
+    'u!': 'not ',
+}
+
+# the generated functions recurse as deep as the mC program
+recursionlimit = 1000000
+
+# source code -> compiled code object
+codecache = {}
+
+
+class VMExit(Exception):
+
+    def __init__(self, frame, mem):
+        self.frame = frame
+        self.mem = mem
+
+
+def funname(framenum):
+    return 'f%d' % framenum
+
+
+def slotname(frame, slot):
+    ''' local variable name or literal of a memory slot (only constants have an initial value) '''
+    value = frame.mem[slot]
+    if value is None:
+        return 'm%d' % slot
+    return repr(value)
+
+
+def generate_function(code, frames, exitline, framenum):
+    ''' returns the source code of the Python function of frame 'framenum' '''
+    frame = frames[framenum]
+    start, end = frame.start, frame.end
+
+    def name(slot):
+        return slotname(frame, slot)
+
+    def memlist():
+        return '[%s]' % ', '.join(name(slot) for slot in range(len(frame.mem)))
+
+    def exitcode():
+        return 'raise VMExit(%d, %s)' % (framenum, memlist())
+
+    def goto(target):
+        # the top-level frame stops after its last line, other frames can't get there
+        if target > end:
+            return exitcode() if framenum == 0 else 'return'
+        return 'pc = %d; continue' % target
+
+    # leaders of the blocks
+    leaders = set([start])
+    for line in range(start, end + 1):
+        op, _, _, result = code[line]
+        op = opcode[op]
+        if op in ['jump', 'jumpfalse'] or op in compare_jumps:
+            leaders.add(result)
+            leaders.add(line + 1)
+    leaders = sorted(leader for leader in leaders if leader <= end)
+
+    variables = [name(slot) for slot, value in enumerate(frame.mem) if value is None]
+    lines = ['def %s(stack):' % funname(framenum),
+             '    push = stack.append',
+             '    pop = stack.pop']
+    if variables:
+        lines.append('    %s = None' % ' = '.join(variables))
+    lines += ['    pc = %d' % start,
+              '    while True:']
+    for blocknum, leader in enumerate(leaders):
+        blockend = leaders[blocknum + 1] - 1 if blocknum + 1 < len(leaders) else end
+        lines.append('        if pc == %d:' % leader)
+        body = []
+        jumped = False
+        for line in range(leader, blockend + 1):
+            op, arg1, arg2, result = code[line]
+            op = opcode[op]
+            if op == 'assign':
+                body.append('%s = %s' % (name(result), name(arg1)))
+            elif op in binop_symbol:
+                body.append('%s = %s %s %s' % (name(result), name(arg1), binop_symbol[op], name(arg2)))
+            elif op in unop_symbol:
+                body.append('%s = %s%s' % (name(result), unop_symbol[op], name(arg1)))
+            elif op == 'push':
+                body.append('push(%s)' % name(arg1))
+            elif op == 'pop':
+                body.append('%s = pop()' % name(result))
+            elif op == 'arr-def':
+                body.append('%s = array(%r, [0]) * %s' % (name(arg2), arraytypecodes[result], name(arg1)))
+            elif op == 'arr-acc':
+                body.append('%s = %s[%s]' % (name(result), name(arg2), name(arg1)))
+            elif op == 'arr-ass':
+                body.append('%s[%s] = %s' % (name(result), name(arg1), name(arg2)))
+            elif op == 'call':
+                body.append('%s(stack)' % funname(result))
+            elif op == 'jump':
+                body.append(goto(result))
+                jumped = True
+            elif op == 'jumpfalse':
+                body.append('if not %s:' % name(arg1))
+                body.append('    ' + goto(result))
+            elif op in compare_jumps:
+                body.append('if not %s %s %s:' % (name(arg1), op[len('jumpfalse'):], name(arg2)))
+                body.append('    ' + goto(result))
+            elif op == 'return':
+                body.append(exitcode() if line == exitline else 'return')
+                jumped = True
+            else:
+                raise NotImplementedError
+            if jumped:
+                break
+        if not jumped:
+            body.append(goto(blockend + 1))
+        lines += ['            ' + el for el in body]
+    return '\n'.join(lines) + '\n'
+
+
+def compile_function(source):
+    if source not in codecache:
+        codecache[source] = compile(source, '<vmpygen>', 'exec')
+    return codecache[source]
+
+
+def compile_program(code, frames, exitline):
+    ''' returns the Python function of the top-level frame '''
+    # 'inf' and 'nan' are the reprs of infinite float literals
+    namespace = {'VMExit': VMExit, 'array': array, 'inf': float('inf'), 'nan': float('nan')}
+    for framenum in range(len(frames)):
+        exec(compile_function(generate_function(code, frames, exitline, framenum)), namespace)
+    return namespace[funname(0)]
+
+
+# the last compiled programs, the code list is kept alive so its id stays unique
+programs = []
+maxprograms = 8
+
+
+def pygen(code, frames, exitline):
+    ''' same semantics as vm.interpret, returns the last frame and its memory '''
+    for program in programs:
+        if program[0] is code and program[1] is frames and program[2] == exitline:
+            toplevel = program[3]
+            break
+    else:
+        toplevel = compile_program(code, frames, exitline)
+        programs.insert(0, (code, frames, exitline, toplevel))
+        del programs[maxprograms:]
+
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, recursionlimit))
+    try:
+        toplevel([])
+    except VMExit as e:
+        return frames[e.frame], e.mem
+    finally:
+        sys.setrecursionlimit(limit)
+    raise RuntimeError('The top-level code returned without reaching the exitline')
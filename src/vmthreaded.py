@@ -0,0 +1,225 @@
+from array import array
+from .vm import opcode, arraytypecodes, compare_jumps
+
+# Closure-threaded execution engine:
+#   every bytecode instruction is compiled once into a specialized closure
+#   which executes it on 'mem' and returns the next pc, the main loop is just
+#       pc = handlers[pc](mem)
+#   The closure of an instruction also executes the following straight-line
+#   instructions up to (and including) the next jump/call/return, so most
+#   basic blocks cost a single call.
+#   The closures are created by factories (one per sequence of operations),
+#   operands and successor pcs are bound as cell variables.
+#
+# Calls and returns change the frame, so their handlers return negative markers:
+#   EXIT            stop the VM
+#   RETURN          pop the framestack
+#   CALL - pc       call the function of instruction 'pc'
+#
+# Jumps are threaded away: if the successor of a closure is a 'jump',
+# it directly returns the jump's target.
+
+EXIT = -1
+RETURN = -2
+CALL = -3
+
+# longest sequence of instructions in one closure
+maxrun = 32
+
+binop_symbol = {
+    '<=': '<=',
+    '>=': '>=',
+    '==': '==',
+    '!=': '!=',
+    '<': '<',
+    '>': '>',
+    '+': '+',
+    '-': '-',
+    '*': '*',
+    '/': '//',
+    '%': '%',
+}
+unop_symbol = {
+    'u-': '-',
+    'u!': 'not ',
+}
+control_ops = set(['jump', 'jumpfalse', 'call', 'return'] + compare_jumps)
+
+factories = {}
+
+
+def handler_factory(shape):
+    ''' shape is the tuple of operations of a closure (the last one may be a control op),
+        returns a function creating such a closure from its operands '''
+    if shape in factories:
+        return factories[shape]
+    params = ['append', 'stackpop', 'array']
+    body = []
+    for i, op in enumerate(shape):
+        a, b, r = 'a%d' % i, 'b%d' % i, 'r%d' % i
+        if op == 'assign':
+            params += [a, r]
+            body.append('mem[%s] = mem[%s]' % (r, a))
+        elif op in binop_symbol:
+            params += [a, b, r]
+            body.append('mem[%s] = mem[%s] %s mem[%s]' % (r, a, binop_symbol[op], b))
+        elif op in unop_symbol:
+            params += [a, r]
+            body.append('mem[%s] = %smem[%s]' % (r, unop_symbol[op], a))
+        elif op == 'push':
+            params += [a]
+            body.append('append(mem[%s])' % a)
+        elif op == 'pop':
+            params += [r]
+            body.append('mem[%s] = stackpop()' % r)
+        elif op == 'arr-def':
+            params += [a, b, r]
+            body.append('mem[%s] = array(%s, [0]) * mem[%s]' % (b, r, a))
+        elif op == 'arr-acc':
+            params += [a, b, r]
+            body.append('mem[%s] = mem[%s][mem[%s]]' % (r, b, a))
+        elif op == 'arr-ass':
+            params += [a, b, r]
+            body.append('mem[%s][mem[%s]] = mem[%s]' % (r, a, b))
+        elif op == 'jumpfalse':
+            params += [a, 'target', 'nxt']
+            body += ['if mem[%s]:' % a, '    return nxt', 'return target']
+        elif op in compare_jumps:
+            params += [a, b, 'target', 'nxt']
+            body += ['if mem[%s] %s mem[%s]:' % (a, op[len('jumpfalse'):], b), '    return nxt', 'return target']
+        elif op in ['jump', 'call', 'return']:
+            params += ['target']
+            body.append('return target')
+        else:
+            raise NotImplementedError
+    if shape[-1] not in control_ops:
+        params.append('nxt')
+        body.append('return nxt')
+    source = 'def factory(%s):\n    def handler(mem):\n%s\n    return handler\n' % (
+        ', '.join(params), '\n'.join('        ' + line for line in body))
+    namespace = {}
+    exec(source, namespace)
+    factories[shape] = namespace['factory']
+    return factories[shape]
+
+
+def compile_handlers(code, exitline, paramstack, limit):
+    ''' returns a handler for every instruction and the pc after every call,
+        if the next pc is larger than 'limit' the VM stops (top-level code) '''
+    jumpop = opcode.index('jump')
+
+    def resolve(pc):
+        # follow jumps (at most len(code), infinite loops stay as jumps)
+        for _ in range(len(code)):
+            if pc > limit:
+                return EXIT
+            op, _, _, target = code[pc]
+            if op != jumpop:
+                return pc
+            pc = target
+        return pc
+
+    def compile_handler(pc):
+        shape = []
+        operands = [paramstack.append, paramstack.pop, array]
+        line = pc
+        while line <= limit and len(shape) < maxrun:
+            op, arg1, arg2, result = code[line]
+            op = opcode[op]
+            shape.append(op)
+            if op == 'assign':
+                operands += [arg1, result]
+            elif op in binop_symbol:
+                operands += [arg1, arg2, result]
+            elif op in unop_symbol:
+                operands += [arg1, result]
+            elif op == 'push':
+                operands += [arg1]
+            elif op == 'pop':
+                operands += [result]
+            elif op == 'arr-def':
+                operands += [arg1, arg2, arraytypecodes[result]]
+            elif op in ['arr-acc', 'arr-ass']:
+                operands += [arg1, arg2, result]
+            elif op == 'jump':
+                operands += [resolve(result)]
+            elif op == 'jumpfalse':
+                operands += [arg1, resolve(result), resolve(line + 1)]
+            elif op in compare_jumps:
+                operands += [arg1, arg2, resolve(result), resolve(line + 1)]
+            elif op == 'call':
+                operands += [CALL - line]
+            elif op == 'return':
+                operands += [EXIT if line == exitline else RETURN]
+            else:
+                raise NotImplementedError
+            if op in control_ops:
+                break
+            line += 1
+        if shape[-1] not in control_ops:
+            operands.append(resolve(line))
+        return handler_factory(tuple(shape))(*operands)
+
+    def lazy(pc):
+        # compiles the real handler on the first execution of 'pc'
+        def handler(mem):
+            handlers[pc] = compile_handler(pc)
+            return handlers[pc](mem)
+        return handler
+
+    handlers = [lazy(pc) for pc in range(len(code))]
+    returnpcs = [resolve(pc + 1) for pc in range(len(code))]
+    return handlers, returnpcs
+
+
+# the last compiled programs, the code list is kept alive so its id stays unique
+programs = []
+maxprograms = 8
+
+
+def compile_program(code, frames, exitline):
+    for program in programs:
+        if program[0] is code and program[1] is frames and program[2] == exitline:
+            return program[3:]
+    paramstack = []
+    # the top-level code stops when it runs past 'exitline'
+    top = compile_handlers(code, exitline, paramstack, exitline)
+    inner = compile_handlers(code, exitline, paramstack, len(code) - 1)
+    calltarget = [result if opcode[op] == 'call' else None for op, _, _, result in code]
+    programs.insert(0, (code, frames, exitline, top, inner, calltarget, paramstack))
+    del programs[maxprograms:]
+    return top, inner, calltarget, paramstack
+
+
+def threaded(code, frames, exitline):
+    ''' same semantics as vm.interpret, returns the last frame and its memory '''
+    top, inner, calltarget, paramstack = compile_program(code, frames, exitline)
+    del paramstack[:]
+
+    currframe = frames[0]
+    mem = list(currframe.mem)
+    handlers, returnpcs = top
+    framestack = []
+    # recycled memory of returned calls (see vm.interpret)
+    freelists = [[] for _ in frames]
+    freelist = freelists[0]
+    pc = currframe.start if currframe.start <= exitline else EXIT
+    while pc != EXIT:
+        pc = handlers[pc](mem)
+        if pc < 0:
+            if pc == EXIT:
+                break
+            elif pc == RETURN:
+                freelist.append(mem)
+                pc, mem, currframe, freelist, handlers, returnpcs = framestack.pop()
+            else:
+                callpc = CALL - pc
+                framestack.append((returnpcs[callpc], mem, currframe, freelist, handlers, returnpcs))
+                framenum = calltarget[callpc]
+                currframe = frames[framenum]
+                freelist = freelists[framenum]
+                mem = freelist.pop() if freelist else list(currframe.mem)
+                handlers, returnpcs = inner
+                pc = currframe.start
+
+    return currframe, mem
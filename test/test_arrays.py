@@ -1,12 +1,22 @@
 import unittest
 from itertools import product
+from array import array
+from copy import deepcopy
 from src import three
 from src import parser
+from src import bb
+from src import lvn
+from src import vm
 
 
 def codetothree(stringcode):
     return three.asttothree(parser.parse(stringcode))
 
+
+def codetobbs(stringcode, uselvn=False):
+    bbs = bb.threetobbs(three.asttothree(parser.parse(stringcode)))
+    return lvn.lvn(bbs) if uselvn else bbs
+
 grammar = parser.mcgrammar
 
 
@@ -137,5 +147,83 @@ class TestThree(unittest.TestCase):
         self.checkthree(three[3], ['assign', 5, None, '.t2'])
         self.checkthree(three[4], ['arr-ass', '.t2', '.t1', 'foo'])
 
+
+class TestVM(unittest.TestCase):
+
+    def executecode(self, stringcode):
+        # every engine (with and without lvn) has to compute the same values
+        results = []
+        for uselvn in [False, True]:
+            bbs = codetobbs(stringcode, uselvn)
+            for engine in vm.engines:
+                vals = vm.run(deepcopy(bbs), engine=engine)
+                # without the type names of 'pop'
+                results.append({name: val for name, val in vals.items() if name not in ['int', 'float']})
+        for vals in results[1:]:
+            self.assertEqual(vals, results[0])
+        return results[0]
+
+    def test_array_def(self):
+        for typet, typecode, num in product(['int', 'float'], ['i', 'f'], [0, 1, 8]):
+            if (typet == 'int') != (typecode == 'i'):
+                continue
+            vals = self.executecode('''{ %s foo[%d]; }''' % (typet, num))
+            self.assertEqual(vals['foo'], array(typecode, [0] * num))
+
+    def test_array_assignment(self):
+        vals = self.executecode('''{
+            int foo[10];
+            float bar[3];
+            int x = 2;
+            foo[x + 1] = 5;
+            bar[x] = 1.5;
+            int y = foo[3];
+            float z = bar[2] + 1.0;
+        }''')
+        self.assertEqual((vals['y'], vals['z']), (5, 2.5))
+        self.assertEqual(vals['foo'][3], 5)
+
+    def test_dynamic_size(self):
+        vals = self.executecode('''{
+            int sum(int n) {
+                int arr[n];
+                for (int i = 0; i < n; i = i + 1)
+                    arr[i] = i;
+                int sum = 0;
+                for (int i = 0; i < n; i = i + 1)
+                    sum = sum + arr[i];
+                return sum;
+            }
+            int x = sum(50);
+        }''')
+        self.assertEqual(vals['x'], sum(range(50)))
+
+    def test_float_precision(self):
+        # the elements are 32-bit floats like in the assembler
+        vals = self.executecode('''{
+            float foo[1];
+            foo[0] = 0.1;
+            float x = foo[0];
+        }''')
+        self.assertEqual(vals['x'], array('f', [0.1])[0])
+        self.assertNotEqual(vals['x'], 0.1)
+
+    def test_sort(self):
+        vals = self.executecode('''{
+            int a[20];
+            for (int i = 0; i < 20; i = i + 1)
+                a[i] = (i * 7) % 20;
+            for (int i = 0; i < 19; i = i + 1) {
+                for (int j = i + 1; j < 20; j = j + 1) {
+                    if (a[i] > a[j]) {
+                        int tmp = a[i];
+                        a[i] = a[j];
+                        a[j] = tmp;
+                    }
+                }
+            }
+        }''')
+        self.assertEqual(list(vals['a']), sorted((i * 7) % 20 for i in range(20)))
+
 if __name__ == '__main__':
     unittest.main()
@@ -8,19 +8,20 @@ from src.parser import parse
 from src.bb import threetobbs
 from src.lvn import lvn
 from src.assembler import codetoassembly, ASMInstruction
+from src.regalloc import strategies
 
 
-def codetoasm(stringcode, asmfile=None):
+def codetoasm(stringcode, asmfile=None, regalloc=None, target='x86', optimize=False):
     bbs = threetobbs(asttothree(parse(stringcode)))
     bbs = lvn(bbs)
     code = [tac for bblock in bbs for tac in bblock]
-    return codetoassembly(code, verbose=-1, assemblyfile=asmfile)
+    return codetoassembly(code, verbose=-1, assemblyfile=asmfile, regalloc=regalloc, target=target, optimize=optimize)
 
 
 class TestAssembler(unittest.TestCase):
 
     def evaluate(self, asm):
-        vals = {'%esp': 0}
+        vals = {'%esp': 0, '%ebp': 0, '%ebx': 0, '%esi': 0, '%edi': 0}
         valmapping = {}
         line = 6
         while asm[line].op is None and asm[line].comment is not None:
@@ -40,8 +41,10 @@ class TestAssembler(unittest.TestCase):
         for instr in asm:
             if type(instr) == str or instr.op is None:
                 continue
-            if instr.op in ['mov', 'movl']:
+            if instr.op in ['mov', 'movl', 'movzbl']:
                 vals[instr.arg2] = const(instr.arg1)
+            if instr.op == 'push':
+                vals['(%esp)'] = const(instr.arg1)
             if instr.op == 'add':
                 vals[instr.arg2] += const(instr.arg1)
             if instr.op == 'imull':
@@ -161,8 +164,201 @@ class TestAssembler(unittest.TestCase):
         self.assertEqual(vals['y'], y)
         self.assertEqual(vals['z'], z)
 
+    def test_compare_and_jump(self):
+        code = '''{
+            int main(){
+                int a = read_int();
+                int s = 0;
+                while(a > 0){
+                    s = s + a;
+                    a = a - 1;
+                }
+                int b = s < 10;
+                if(b){
+                    s = 10;
+                }
+                return s;
+            }
+        }'''
+        instrs = [el for el in codetoasm(code) if type(el) is not str and el.op is not None]
+        ops = [el.op for el in instrs]
+        # the loop condition is only used by the jump, 'b' is a variable
+        self.assertIn('jle', ops)
+        self.assertEqual(ops.count('setg'), 0)
+        self.assertEqual(ops.count('setl'), 1)
+        jump = ops.index('jle')
+        self.assertEqual(ops[jump - 2:jump], ['mov', 'cmp'])
+
+    def test_power_of_two_shift(self):
+        code = '''{
+            int main(){
+                int x = read_int();
+                return (x * 8) + ((4 * x) + (x * 3));
+            }
+        }'''
+        for target in ['x86', 'x86-64']:
+            for regalloc in [None] + list(strategies):
+                asm = codetoasm(code, regalloc=regalloc, target=target)
+                instrs = [el for el in asm if type(el) is not str and el.op is not None]
+                # the factors 8 and 4 are shifts, 3 stays a multiplication
+                self.assertIn(ASMInstruction('sall', '$3', '%eax'), instrs)
+                self.assertIn(ASMInstruction('sall', '$2', '%eax'), instrs)
+                self.assertEqual([el.op for el in instrs].count('imull'), 1)
+
+    def test_regalloc_expressions(self):
+        for expr in ['10>2', '2>10', '10<=10', '10==2', '2!=10', '-4', '! 0', '- (! 0)',
+                     '1+2+3+4', '10-4', '1*2*3*4*5', '10/2', '10%4', '(31*20)/(4+(40-3))']:
+            code = '''{
+                int main(){
+                    int x = %s;
+                    int y = x + 1;
+                    return y;
+                }
+            }''' % expr
+            result = int(eval(expr.replace('! ', 'not '))) + 1
+            for regalloc in strategies:
+                asm = codetoasm(code, regalloc=regalloc)
+                vals = self.evaluate(asm)
+                self.assertEqual(vals['%eax'], result)
+
+    def test_regalloc_uses_registers(self):
+        code = '''{
+            int main(){
+                int s = 0;
+                for(int i=0;i<10;i=i+1){
+                    s = s + (i * i);
+                }
+                return s;
+            }
+        }'''
+        asm = codetoasm(code)
+        self.assertTrue(any('(%ebp)' in str(el) for el in asm if type(el) is not str and el.op == 'add'))
+        asm = codetoasm(code, regalloc='linear')
+        instrs = [el for el in asm if type(el) is not str and el.op is not None]
+        # three values are live in the loop, %ebx is saved below the (empty) stack frame
+        self.assertEqual(ASMInstruction('sub', '$4', '%esp'), instrs[3])
+        self.assertEqual(ASMInstruction('movl', '%ebx', '-4(%ebp)'), instrs[4])
+        self.assertEqual(ASMInstruction('movl', '-4(%ebp)', '%ebx'), instrs[-4])
+        self.assertFalse(any('(%ebp)' in str(el) for el in instrs[5:-4]))
+
+    def test_regalloc_params(self):
+        code = '''{
+            int sub(int x, int y){
+                return x - y;
+            }
+            int main(){
+                return sub(10, 3);
+            }
+        }'''
+        asm = codetoasm(code, regalloc='linear')
+        instrs = [el for el in asm if type(el) is not str and el.op is not None]
+        self.assertIn(ASMInstruction('movl', '8(%ebp)', '%ecx'), instrs)
+        self.assertIn(ASMInstruction('movl', '12(%ebp)', '%edx'), instrs)
+        # the result of the call lives across no other call
+        self.assertIn(ASMInstruction('mov', '%eax', '%ecx'), instrs)
+
+    def test_regalloc_callee_saved(self):
+        code = '''{
+            int twice(int x){
+                return x + x;
+            }
+            int main(){
+                int a = twice(1);
+                int b = twice(a);
+                return a + b;
+            }
+        }'''
+        asm = codetoasm(code, regalloc='linear')
+        instrs = [el for el in asm if type(el) is not str and el.op is not None]
+        main = instrs.index(ASMInstruction('main:\t'))
+        # 'a' lives across a call, %ebx is saved below the (empty) stack frame
+        self.assertEqual(ASMInstruction('sub', '$4', '%esp'), instrs[main + 3])
+        self.assertEqual(ASMInstruction('movl', '%ebx', '-4(%ebp)'), instrs[main + 4])
+        self.assertEqual(ASMInstruction('movl', '-4(%ebp)', '%ebx'), instrs[-4])
+        self.assertIn(ASMInstruction('movl', '%ecx', '%ebx'), instrs[main:])
+
+
+class TestAssembler64(unittest.TestCase):
+
+    def instructions(self, code, regalloc=None):
+        asm = codetoasm(code, regalloc=regalloc, target='x86-64')
+        return [el for el in asm if type(el) is not str and el.op is not None]
+
+    def test_sse_floats(self):
+        code = '''{
+            float main(){
+                float x = read_float();
+                float y = (x * 2.5) + x;
+                if(y < x){
+                    y = -y;
+                }
+                return y;
+            }
+        }'''
+        instrs = self.instructions(code)
+        ops = set(el.op for el in instrs)
+        self.assertTrue(set(['mulss', 'addss', 'ucomiss', 'jae']) <= ops)
+        self.assertFalse(any(op.startswith('f') for op in ops))
+        self.assertEqual(ASMInstruction('movss', '%xmm0', '-8(%rbp)'), instrs[instrs.index(ASMInstruction('call', 'read_float')) + 1])
+
+    def test_argument_registers(self):
+        code = '''{
+            float mix(int a, float b, int c){
+                return b;
+            }
+            void main(){
+                print_float(mix(1, 2.0, 3));
+            }
+        }'''
+        instrs = self.instructions(code)
+        mix = instrs.index(ASMInstruction('mix:\t'))
+        self.assertEqual(ASMInstruction('sub', '$32', '%rsp'), instrs[mix + 3])
+        self.assertEqual(instrs[mix + 4:mix + 7], [
+            ASMInstruction('movq', '%rdi', '-8(%rbp)'),
+            ASMInstruction('movss', '%xmm0', '-16(%rbp)'),
+            ASMInstruction('movq', '%rsi', '-24(%rbp)'),
+        ])
+        call = instrs.index(ASMInstruction('call', 'mix'))
+        self.assertEqual(instrs[call - 4:call], [
+            ASMInstruction('pop', '%rdi'),
+            ASMInstruction('movss', '(%rsp)', '%xmm0'),
+            ASMInstruction('add', '$8', '%rsp'),
+            ASMInstruction('pop', '%rsi'),
+        ])
+        self.assertEqual(ASMInstruction('movss', '%xmm0', '-16(%rbp)'), instrs[call + 1])
+
+    def test_regalloc_registers(self):
+        code = '''{
+            int main(){
+                int a = read_int();
+                int b = read_int();
+                print_int(a + b);
+                return a - b;
+            }
+        }'''
+        instrs = self.instructions(code, regalloc='graph')
+        # 'a' lives across two calls, it gets a callee-saved register
+        self.assertIn(ASMInstruction('movq', '%rbx', '-8(%rbp)'), instrs)
+        self.assertIn(ASMInstruction('movl', '%eax', '%ebx'), instrs)
+        self.assertIn(ASMInstruction('pushq', '%rcx'), instrs)
+
+    def test_too_many_arguments(self):
+        code = '''{
+            int f(int a, int b, int c, int d, int e, int g, int h){
+                return a;
+            }
+            int main(){
+                return f(1, 2, 3, 4, 5, 6, 7);
+            }
+        }'''
+        with self.assertRaises(NotImplementedError):
+            self.instructions(code)
+
 
 class IntegrationTest(unittest.TestCase):
+    regalloc = None
+    target = 'x86'
+    optimize = False
 
     def isint(self, s):
         try:
@@ -173,9 +369,11 @@ class IntegrationTest(unittest.TestCase):
 
     def compile(self, codestr):
         asmfile = NamedTemporaryFile(suffix='.s', delete=False)
-        code = codetoasm(codestr, asmfile.name)
+        code = codetoasm(codestr, asmfile.name, self.regalloc, self.target, self.optimize)
         # print('\n'.join(map(str, code)))
-        gcc = ['gcc', '-o', asmfile.name + '.bin', asmfile.name, 'assembler/lib.c', '-m32']
+        gcc = ['gcc', '-o', asmfile.name + '.bin', asmfile.name, 'assembler/lib.c']
+        if self.target == 'x86':
+            gcc.append('-m32')
         call(gcc)
         return asmfile.name
 
@@ -616,5 +814,38 @@ class IntegrationTest(unittest.TestCase):
             self.assertEqual(result, [sum(range(num))])
         self.clean(asmfile)
 
+
+class RegallocIntegrationTest(IntegrationTest):
+    regalloc = 'linear'
+
+
+class GraphRegallocIntegrationTest(IntegrationTest):
+    regalloc = 'graph'
+
+
+class PeepholeIntegrationTest(IntegrationTest):
+    optimize = True
+
+
+class PeepholeGraphRegallocIntegrationTest(IntegrationTest):
+    regalloc = 'graph'
+    optimize = True
+
+
+class X64IntegrationTest(IntegrationTest):
+    target = 'x86-64'
+
+
+class X64GraphRegallocIntegrationTest(IntegrationTest):
+    regalloc = 'graph'
+    target = 'x86-64'
+
+
+class X64PeepholeIntegrationTest(IntegrationTest):
+    regalloc = 'graph'
+    target = 'x86-64'
+    optimize = True
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+from copy import deepcopy
+from src import three
+from src import parser
+from src import bb
+from src import vm
+from src import bytecode
+
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def filebytecodes():
+    fnames = glob.glob(os.path.join(root, 'examples', '*.mc')) + glob.glob(os.path.join(root, 'bench', '*.c'))
+    for fname in sorted(fnames):
+        try:
+            bbs = bb.threetobbs(three.asttothree(parser.parsefile(fname)))
+            yield fname, bbs, vm.bbs_to_bytecode(deepcopy(bbs))
+        except Exception:
+            # examples which are not accepted by the grammar or the vm
+            continue
+
+
+class TestBytecodeFile(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.bcfile = tempfile.mkstemp(suffix='.mcb')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.bcfile)
+
+    def assertSameProgram(self, loaded, program):
+        code, frames, exitline = program
+        self.assertEqual(loaded[0], code)
+        self.assertEqual(loaded[2], exitline)
+        for loadedframe, frame in zip(loaded[1], frames):
+            self.assertEqual((loadedframe.start, loadedframe.end, loadedframe.name), (frame.start, frame.end, frame.name))
+            self.assertEqual([(type(el), el) for el in loadedframe.mem], [(type(el), el) for el in frame.mem])
+            names = {arg: mempos for arg, mempos in frame.arg_to_mem.items() if type(arg) is str}
+            self.assertEqual({arg: mempos for arg, mempos in loadedframe.arg_to_mem.items() if type(arg) is str}, names)
+
+    def test_roundtrip(self):
+        count = 0
+        for fname, _, program in filebytecodes():
+            bytecode.write_bytecode(*program, bcfile=self.bcfile)
+            self.assertSameProgram(bytecode.load_bytecode(self.bcfile), program)
+            count += 1
+        self.assertTrue(count > 5)
+
+    def test_generate_bytecode(self):
+        code = '''{
+            float scale(float x) {
+                return x * 1.5;
+            }
+            int x = 3;
+            float y = scale(2.0);
+            int a[4];
+            a[1] = x;
+        }'''
+        bbs = bb.threetobbs(three.asttothree(parser.parse(code)))
+        expected = vm.run(deepcopy(bbs))
+        vm.generate_bytecode(bbs, self.bcfile)
+        for engine in vm.engines:
+            vals = vm.run_bytecode(*bytecode.load_bytecode(self.bcfile), engine=engine)
+            self.assertEqual(vals, expected)
+        self.assertEqual((expected['x'], expected['y']), (3, 3.0))
+
+    def test_sections_are_aligned(self):
+        program = vm.bbs_to_bytecode(bb.threetobbs(three.asttothree(parser.parse('{ int x = 1; }'))))
+        data = bytecode.dumps_bytecode(*program)
+        self.assertEqual(len(data) % 8, 0)
+        self.assertSameProgram(bytecode.loads_bytecode(data), program)
+
+    def test_errors(self):
+        program = vm.bbs_to_bytecode(bb.threetobbs(three.asttothree(parser.parse('{ int x = 1; }'))))
+        data = bytecode.dumps_bytecode(*program)
+        wrongversion = bytecode.header.pack(bytecode.MAGIC, bytecode.VERSION + 1, 0, 0, 0, 0, 0)
+        for invalid in [b'', b'MCBC', b'XXXX' + data[4:], wrongversion + data[bytecode.header.size:], data[:-16]]:
+            with open(self.bcfile, 'wb') as f:
+                f.write(invalid)
+            with self.assertRaises(bytecode.BytecodeException):
+                bytecode.load_bytecode(self.bcfile)
+
+    def test_load_without_compiler(self):
+        program = vm.bbs_to_bytecode(bb.threetobbs(three.asttothree(parser.parse('{ int x = 6 * 7; }'))))
+        bytecode.write_bytecode(*program, bcfile=self.bcfile)
+        script = ('import sys\n'
+                  'from src import bytecode, vm\n'
+                  'print(vm.run_bytecode(*bytecode.load_bytecode(sys.argv[1]))["x"])\n'
+                  'print(sorted(name for name in sys.modules if name.startswith(("src.", "parsimonious"))))\n')
+        output = subprocess.check_output([sys.executable, '-c', script, self.bcfile], cwd=root).decode()
+        result, modules = output.splitlines()
+        self.assertEqual(result, '42')
+        self.assertEqual(modules, str(['src.bytecode', 'src.utils', 'src.vm']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+import os
+import shutil
+import tempfile
+from src import cache
+from src import vm
+
+
+class TestCompilationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def test_hit_and_miss(self):
+        c = cache.CompilationCache(self.cachedir)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return [['assign', 1, None, 'x']]
+        first = c.stage('three', 'int x = 1;', None, compute)
+        second = c.stage('three', 'int x = 1;', None, compute)
+        self.assertEqual(first, second)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((c.hits, c.misses), (1, 1))
+
+    def test_key(self):
+        c = cache.CompilationCache(self.cachedir)
+        key = c.key('bbs', 'int x = 1;', {'lvn': False})
+        self.assertEqual(key, c.key('bbs', 'int x = 1;', {'lvn': False}))
+        self.assertNotEqual(key, c.key('bbs', 'int x = 2;', {'lvn': False}))
+        self.assertNotEqual(key, c.key('bbs', 'int x = 1;', {'lvn': True}))
+        self.assertNotEqual(key, c.key('three', 'int x = 1;', {'lvn': False}))
+
+    def test_corrupted_entry(self):
+        c = cache.CompilationCache(self.cachedir)
+        key = c.key('ast', 'x;')
+        c.put(key, 'ast')
+        with open(c.path(key), 'wb') as f:
+            f.write(b'garbage')
+        self.assertEqual(c.get(key), (False, None))
+        self.assertFalse(os.path.exists(c.path(key)))
+
+    def test_lru_eviction(self):
+        c = cache.CompilationCache(self.cachedir, maxsize=10 ** 9)
+        keys = [c.key('ast', str(i)) for i in range(4)]
+        for i, key in enumerate(keys):
+            c.put(key, os.urandom(1000))
+            os.utime(c.path(key), (i, i))
+        # touch the oldest entry, it becomes the most recently used one
+        c.get(keys[0])
+        c.maxsize = 2500
+        c.evict()
+        self.assertLessEqual(c.size(), 2500)
+        found = [c.get(key)[0] for key in keys]
+        self.assertEqual(found, [True, False, False, True])
+
+    def test_pipeline(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.mc', delete=False) as mcfile:
+            mcfile.write('int twice(int x){ return x * 2; }\nint main(){ int x = 3; int y = twice(x); return 0; }\n')
+        try:
+            for uselvn in [False, True]:
+                c = cache.CompilationCache(self.cachedir)
+                expected = vm.run_bytecode(*cache.CachedPipeline(mcfile.name, c, uselvn).bytecode())
+                self.assertEqual((expected['x'], expected['y']), (3, 6))
+                # the lvn option only changes the keys from the 'bbs' stage on
+                self.assertEqual(c.hits, 1 if uselvn else 0)
+
+                c = cache.CompilationCache(self.cachedir)
+                pipeline = cache.CachedPipeline(mcfile.name, c, uselvn)
+                self.assertEqual(vm.run_bytecode(*pipeline.bytecode()), expected)
+                # the earlier stages are not even looked up
+                self.assertEqual((c.hits, c.misses), (1, 0))
+                pipeline.assembly()
+                self.assertEqual((c.hits, c.misses), (2, 1))
+        finally:
+            os.remove(mcfile.name)
+
+    def test_sccp(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.mc', delete=False) as mcfile:
+            mcfile.write('int x = 2;\nif(x > 1){ x = x * 3; }\n')
+        try:
+            c = cache.CompilationCache(self.cachedir)
+            bbs = cache.CachedPipeline(mcfile.name, c, uselvn=True, usesccp=True).bbs()
+            self.assertNotIn('jumpfalse', [code[0] for block in bbs for code in block])
+            # the blocks without sccp are another entry, only the 3-address-code is shared
+            cache.CachedPipeline(mcfile.name, c, uselvn=True).bbs()
+            self.assertEqual((c.hits, c.misses), (1, 4))
+        finally:
+            os.remove(mcfile.name)
+
+    def test_dce(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.mc', delete=False) as mcfile:
+            mcfile.write('int f(int n){ int dead = n * 2; return n; }\nint y = f(3);\n')
+        try:
+            c = cache.CompilationCache(self.cachedir)
+            bbs = cache.CachedPipeline(mcfile.name, c, uselvn=True, usedce=True).bbs()
+            self.assertNotIn('*', [code[0] for block in bbs for code in block])
+            cache.CachedPipeline(mcfile.name, c, uselvn=True).bbs()
+            self.assertEqual((c.hits, c.misses), (1, 4))
+        finally:
+            os.remove(mcfile.name)
+
+    def test_licm(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.mc', delete=False) as mcfile:
+            mcfile.write('int f(int n){ int i = 0; while(i < n - 1){ i = i + 1; } return i; }\nint y = f(3);\n')
+        try:
+            c = cache.CompilationCache(self.cachedir)
+            pipeline = cache.CachedPipeline(mcfile.name, c, uselvn=True, uselicm=True)
+            # the preheader is a new block before the header
+            self.assertEqual(len(pipeline.bbs()), len(cache.CachedPipeline(mcfile.name, c, uselvn=True).bbs()) + 1)
+            bound = [b for b, block in enumerate(pipeline.bbs()) if ['-', 'n', 1] in [code[:3] for code in block]]
+            self.assertEqual([pipeline.dominance().depth[b] for b in bound], [0])
+        finally:
+            os.remove(mcfile.name)
+
+    def test_dominance(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.mc', delete=False) as mcfile:
+            mcfile.write('int x = 0;\nwhile(x < 5){ x = x + 1; }\n')
+        try:
+            c = cache.CompilationCache(self.cachedir)
+            loops = cache.CachedPipeline(mcfile.name, c).dominance().loops
+            self.assertEqual(len(loops), 1)
+            c = cache.CompilationCache(self.cachedir)
+            pipeline = cache.CachedPipeline(mcfile.name, c)
+            self.assertEqual([loop.blocks for loop in pipeline.dominance().loops], [loops[0].blocks])
+            self.assertEqual((c.hits, c.misses), (1, 0))
+            # other blocks, other entries
+            pipeline = cache.CachedPipeline(mcfile.name, c, uselvn=True)
+            pipeline.dominance()
+            self.assertEqual(c.misses, 3)
+        finally:
+            os.remove(mcfile.name)
+
+
+if __name__ == '__main__':
+    unittest.main()
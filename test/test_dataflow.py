@@ -312,5 +312,192 @@ class TestLiveness(unittest.TestCase):
         self.assertEqual(outb[6], set(['a', 'b', 'c', 'd', 'i']))
         self.assertEqual(outb[7], set(['i']))
 
+class TestBitVectorLiveness(unittest.TestCase):
+
+    def test_decode(self):
+        names = ['a', 'b', 'c', 'd']
+        self.assertEqual(dataflow.decode(0, names), [])
+        self.assertEqual(dataflow.decode(0b1011, names), ['a', 'b', 'd'])
+        view = dataflow.BitSets({0: 0b0101, 1: 0}, names)
+        self.assertEqual(view.decoded, {})
+        self.assertEqual(view[0], set(['a', 'c']))
+        self.assertEqual(list(view.decoded), [0])
+        self.assertEqual(view, {0: set(['a', 'c']), 1: set()})
+
+    def test_same_as_sets(self):
+        import os
+        from src.lvn import lvn
+        examples = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples')
+        for name in ['whilenested.mc', 'fornested.mc', 'primes.mc', 'assemblerfib.mc', 'funccomplex.mc']:
+            bbs = lvn(bb.threetobbs(three.asttothree(parser.parsefile(os.path.join(examples, name)))))
+            graph = cfg.bbstocfg(bbs)
+            inb, outb = dataflow.liveness(bbs, graph)
+            self.assertEqual((inb, outb), dataflow.liveness_sets(bbs, graph))
+
+
+class TestWorklistOrder(unittest.TestCase):
+
+    def nested(self, depth):
+        lines = ['{', 'int s = 0;']
+        lines += ['int i%d = 0;' % d for d in range(depth)]
+        lines += ['while(i%d < 10){ i%d = i%d + 1;' % (d, d, d) for d in range(depth)]
+        lines.append('s = s + 1;')
+        lines += ['}'] * depth + ['}']
+        return '\n'.join(lines)
+
+    def test_postorder(self):
+        g = {0: set([1]), 1: set([2, 3]), 2: set([1]), 3: set(), 4: set([3])}
+        self.assertEqual(dataflow.postorder(g, [0, 1, 2, 3, 4]), [2, 3, 1, 0, 4])
+        self.assertEqual(dataflow.postorder(g, [0, 1, 2, 3, 4], descending=True), [3, 2, 1, 0, 4])
+
+    def test_whilenested3(self):
+        import os
+        from src.lvn import lvn
+        examples = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples')
+        bbs = lvn(bb.threetobbs(three.asttothree(parser.parsefile(os.path.join(examples, 'whilenested3.mc')))))
+        stats = {}
+        dataflow.liveness(bbs, cfg.bbstocfg(bbs), stats=stats)
+        # every block at most twice: once in order, once for the back edges
+        self.assertLessEqual(stats['iterations'], 2 * len(bbs))
+
+    def test_nested_loops(self):
+        from src.utils import op_sets_result
+        bbs = codetobbs(self.nested(30))
+        graph = cfg.bbstocfg(bbs)
+        stats = {}
+        live = dataflow.liveness(bbs, graph, stats=stats)
+        self.assertLessEqual(stats['iterations'], 2 * len(bbs))
+        self.assertEqual(live, dataflow.liveness_sets(bbs, graph))
+        defined = {b: set(tac[3] for tac in block if tac[0] in op_sets_result) for b, block in enumerate(bbs)}
+        stats = {}
+        inb, _ = dataflow.worklist(bbs, graph, lambda: set(), lambda b, inb: inb | defined[b], stats=stats)
+        self.assertLessEqual(stats['iterations'], 2 * len(bbs))
+        # the innermost loop body is reached by all the definitions
+        self.assertTrue(all(el in inb[len(bbs) // 2] for el in ['s'] + ['i%d' % d for d in range(30)]))
+
+
+class TestAnalyses(unittest.TestCase):
+
+    def diamond(self, left, right, join=[]):
+        ''' 0: a, b = params; jumpfalse -> 1 (left) or 2 (right) -> 3 (join) '''
+        bbs = [
+            [['function', None, None, 'f'], ['pop', None, 'int', 'a'], ['pop', None, 'int', 'b'],
+             ['jumpfalse', 'a', None, 'L1']],
+            left + [['jump', None, None, 'L2']],
+            [['label', None, None, 'L1']] + right,
+            [['label', None, None, 'L2']] + join + [['return', None, None, None], ['end-fun', None, None, None]],
+        ]
+        return bbs, cfg.bbstocfg(bbs)
+
+    def test_reaching_definitions(self):
+        bbs, graph = self.diamond([['assign', 1, None, 'x']], [['assign', 2, None, 'x'], ['assign', 3, None, 'x']])
+        inb, outb = dataflow.reaching_definitions(bbs, graph)
+        self.assertEqual(inb[1], set([('a', 0, 1), ('b', 0, 2)]))
+        # only the last definition of a block reaches its end
+        self.assertEqual(outb[2], set([('a', 0, 1), ('b', 0, 2), ('x', 2, 2)]))
+        self.assertEqual(inb[3], set([('a', 0, 1), ('b', 0, 2), ('x', 1, 0), ('x', 2, 2)]))
+
+    def test_available_expressions(self):
+        bbs, graph = self.diamond(
+            [['+', 'a', 'b', 'x'], ['*', 'a', 2, 'y'], ['-', 'a', 'b', 'z']],
+            [['+', 'b', 'a', 'x'], ['*', 'a', 2, 'y'], ['-', 'a', 'b', 'b']])
+        inb, outb = dataflow.available_expressions(bbs, graph)
+        self.assertEqual(inb[1], set())
+        # the operands of a commutative operation are sorted
+        self.assertEqual(outb[1], set([('+', 'a', 'b'), ('*', 2, 'a'), ('-', 'a', 'b')]))
+        # 'b + a' is the same expression, 'b = a - b' kills the expressions with b
+        self.assertEqual(outb[2], set([('*', 2, 'a')]))
+        self.assertEqual(inb[3], set([('*', 2, 'a')]))
+
+    def test_available_expressions_loop(self):
+        from src.lvn import lvn
+        bbs = lvn(codetobbs('''{
+            int a = read_int();
+            int b = read_int();
+            int x = a + b;
+            while(x < 10){
+                x = x + 1;
+            }
+            int y = a + b;
+        }'''))
+        graph = cfg.bbstocfg(bbs)
+        inb, _ = dataflow.available_expressions(bbs, graph)
+        self.assertIn(('+', 'a', 'b'), inb[len(bbs) - 1])
+        self.assertNotIn(('+', 1, 'x'), inb[len(bbs) - 1])
+
+    def test_very_busy_expressions(self):
+        bbs, graph = self.diamond(
+            [['+', 'a', 'b', 'x']],
+            [['assign', 'b', None, 'y'], ['+', 'a', 'b', 'x'], ['-', 'a', 'b', 'z']])
+        inb, outb = dataflow.very_busy_expressions(bbs, graph)
+        # computed on both paths before a or b change
+        self.assertEqual(inb[0], set([('+', 'a', 'b')]))
+        self.assertEqual(outb[2], set([('+', 'a', 'b'), ('-', 'a', 'b')]))
+        # the parameters are written in block 0
+        self.assertEqual(outb[0], set())
+
+    def test_constant_propagation(self):
+        bbs, graph = self.diamond(
+            [['assign', 1, None, 'x'], ['assign', 2, None, 'y'], ['assign', 1.0, None, 'z']],
+            [['assign', 1, None, 'x'], ['assign', 3, None, 'y'], ['assign', 1, None, 'z']],
+            [['push', 'x', None, None], ['push', 'y', None, None], ['push', 'z', None, None]])
+        inb, outb = dataflow.constant_propagation(bbs, graph)
+        self.assertEqual(inb[0], {})
+        self.assertEqual(outb[1], {'x': 1, 'y': 2, 'z': 1.0})
+        # y differs, z is an int on one path and a float on the other
+        self.assertEqual(inb[3], {'x': 1})
+        evaluate = dataflow.ConstantPropagation.evaluate
+        self.assertEqual(evaluate(['+', 'x', 4, 'w'], {'x': 1}), 5)
+        self.assertIsNone(evaluate(['-', 'a', 'x', 'v'], {'x': 1}))
+        self.assertIsNone(evaluate(['pop', None, 'int', 'v'], {}))
+
+    def test_constant_propagation_loop(self):
+        bbs = codetobbs('''{
+            int c = 3;
+            int i = 0;
+            while(i < 10){
+                int d = c * 2;
+                i = i + d;
+            }
+            int e = c + i;
+        }''')
+        graph = cfg.bbstocfg(bbs)
+        inb, outb = dataflow.constant_propagation(bbs, graph)
+        last = len(bbs) - 1
+        self.assertEqual(inb[last].get('c'), 3)
+        self.assertNotIn('i', inb[last])
+        self.assertNotIn('e', outb[last])
+
+    def test_unreachable(self):
+        bbs = [[['jump', None, None, 'L1']], [['assign', 1, None, 'x']], [['label', None, None, 'L1']]]
+        inb, _ = dataflow.constant_propagation(bbs, cfg.bbstocfg(bbs))
+        self.assertEqual(inb, {0: {}, 1: {}, 2: {}})
+        # an unreachable block after a reachable one stays at the top of the lattice
+        bbs = [[['jump', None, None, 'L1']], [['label', None, None, 'L0'], ['assign', 1, None, 'x']],
+               [['label', None, None, 'L1'], ['jump', None, None, 'L0']]]
+        inb, outb = dataflow.constant_propagation(bbs, cfg.bbstocfg(bbs))
+        self.assertEqual(outb[1], {})
+
+    def test_fold_constant(self):
+        from src.utils import fold_constant
+        self.assertEqual(fold_constant('+', 2, 3), 5)
+        self.assertEqual(fold_constant('<', 2, 3), 1)
+        self.assertEqual(fold_constant('u!', 0), 1)
+        self.assertEqual(fold_constant('u-', 2.5), -2.5)
+        self.assertEqual(fold_constant('/', 7, 2), 3)
+        # not the same result in the vm and on x86
+        self.assertIsNone(fold_constant('/', -7, 2))
+        self.assertIsNone(fold_constant('%', 7, 0))
+        self.assertIsNone(fold_constant('*', 2 ** 30, 4))
+        self.assertIsNone(fold_constant('+', 1, 1.0))
+
+    def test_liveness_is_an_analysis(self):
+        bbs, graph = self.diamond([['+', 'a', 'b', 'x']], [['assign', 'b', None, 'x']], [['push', 'x', None, None]])
+        outb, inb = dataflow.solve(bbs, graph, dataflow.Liveness(bbs))
+        self.assertEqual((outb, inb), dataflow.liveness(bbs, graph))
+        self.assertEqual(inb[1], set(['a', 'b']))
+        self.assertEqual(inb[2], set(['b']))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,155 @@
+import os
+import io
+import copy
+import contextlib
+import unittest
+from src import three
+from src import parser
+from src import bb
+from src import vm
+from src import dce
+
+examples = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples')
+
+
+def codetobbs(stringcode):
+    return bb.threetobbs(three.asttothree(parser.parse(stringcode)))
+
+
+def run(bbs):
+    ''' vm.run changes the blocks it runs '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        return vm.run(copy.deepcopy(bbs))
+
+
+def codes(bbs):
+    return [code for block in bbs for code in block]
+
+
+class TestDCE(unittest.TestCase):
+
+    def test_dead_cycle(self):
+        # 'dead' only feeds itself, liveness alone would keep it
+        bbs = codetobbs('''{
+            int f(int n){
+                int dead = 0;
+                int s = 0;
+                int i = 0;
+                while(i < n){
+                    dead = dead + i;
+                    s = s + 2;
+                    i = i + 1;
+                }
+                int unused = s * 3;
+                return s;
+            }
+            int r = f(4);
+        }''')
+        stats = {}
+        res = dce.dce(bbs, stats=stats)
+        self.assertNotIn('dead', [code[3] for code in codes(res)])
+        self.assertNotIn('unused', [code[3] for code in codes(res)])
+        self.assertNotIn('*', [code[0] for code in codes(res)])
+        self.assertEqual(stats['rounds'], 1)
+        self.assertEqual(run(res), run(bbs))
+        self.assertEqual(run(res)['r'], 8)
+
+    def test_escaping(self):
+        # the variables of the global code and of main are the result of the program
+        bbs = codetobbs('''{
+            int g = 1;
+            int f(int n){
+                int local = n + 1;
+                return g;
+            }
+            int x = 2;
+            x = 3;
+            int y = f(x);
+        }''')
+        res = codes(dce.dce(bbs))
+        self.assertEqual([code[3] for code in res if code[0] == 'assign' and code[3] in ['g', 'x', 'y']],
+                         ['g', 'x', 'x', 'y'])
+        self.assertNotIn('local', [code[3] for code in res])
+        self.assertEqual(dce.escaping(codetobbs('''{
+            int f(int n){
+                int a = n;
+                return a;
+            }
+            void main(){
+                int b = f(1);
+            }
+        }''')), set(['b']))
+
+    def test_effects(self):
+        bbs = codetobbs('''{
+            int f(int n){
+                int a[3];
+                int unread = a[1];
+                a[0] = n;
+                print_int(n * 2);
+                int x = read_int();
+                return 0;
+            }
+            int r = f(1);
+        }''')
+        ops = [code[0] for code in codes(dce.dce(bbs))]
+        # the array access is dead, the store, the call and its result stay
+        self.assertNotIn('arr-acc', ops)
+        for op in ['arr-def', 'arr-ass', 'call', 'pop', '*']:
+            self.assertIn(op, ops)
+
+    def test_with_lvn(self):
+        bbs = codetobbs('''{
+            int f(int a, int b){
+                int x = a + b;
+                int y = x;
+                int z = a + b;
+                return z;
+            }
+            int r = f(1, 2);
+        }''')
+        stats = {}
+        res = dce.dce(bbs, stats=stats, uselvn=True)
+        # lvn reuses 'x' for 'z', then 'y' and the copies are dead
+        start = codes(res).index(['function', None, None, 'f'])
+        self.assertEqual(codes(res)[start + 3:start + 6],
+                         [['+', 'a', 'b', 'x'], ['push', 'x', None, None], ['return', None, None, None]])
+        self.assertGreater(stats['rounds'], 1)
+        self.assertEqual(run(res), run(bbs))
+        # the result is a fixpoint
+        again = {}
+        self.assertEqual(dce.dce(res, stats=again, uselvn=True), res)
+        self.assertEqual(again['removed'], 0)
+
+    def test_reused_temporary(self):
+        # lvn used to switch 'y' between a copy of the temporary of 'x' and 'e * e' in every round
+        bbs = codetobbs('''{
+            int e = read_int();
+            int x = (e * e) >= e;
+            int y = e * e;
+            print_int(y);
+        }''')
+        stats = {}
+        res = dce.dce(bbs, stats=stats, uselvn=True)
+        self.assertLessEqual(stats['rounds'], 2)
+        self.assertEqual(run(res), run(bbs))
+
+    def test_examples(self):
+        for name in sorted(os.listdir(examples)):
+            if not name.endswith('.mc') or name == 'primes.mc':
+                continue
+            with open(os.path.join(examples, name)) as f:
+                if 'read_' in f.read():
+                    continue
+            try:
+                bbs = bb.threetobbs(three.asttothree(parser.parsefile(os.path.join(examples, name))))
+                expected = run(bbs)
+            except Exception:
+                # the examples for the error messages and the ones without global code
+                continue
+            for uselvn in [False, True]:
+                self.assertEqual(run(dce.dce(bbs, uselvn=uselvn)), expected, name)
+
+
+if __name__ == '__main__':
+    unittest.main()
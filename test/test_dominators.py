@@ -0,0 +1,163 @@
+import os
+import unittest
+from src import three
+from src import parser
+from src import bb
+from src import cfg
+from src import dominators
+
+examples = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples')
+
+
+def codetobbs(stringcode):
+    return bb.threetobbs(three.asttothree(parser.parse(stringcode)))
+
+
+def filetobbs(name):
+    return bb.threetobbs(three.asttothree(parser.parsefile(os.path.join(examples, name))))
+
+
+def dominator_sets(graph, roots):
+    ''' the dominators of every block with the data flow equations (the reference) '''
+    pred = {b: set() for b in graph}
+    for b in graph:
+        for child in graph[b]:
+            pred[child].add(b)
+    doms = {b: set([b]) if b in roots else set(graph) for b in graph}
+    changed = True
+    while changed:
+        changed = False
+        for b in graph:
+            if b in roots:
+                continue
+            new = set([b]) | set.intersection(*[doms[p] for p in pred[b]])
+            if new != doms[b]:
+                doms[b] = new
+                changed = True
+    return doms
+
+
+class TestDominators(unittest.TestCase):
+
+    def test_diamond(self):
+        graph = {0: set([1, 2]), 1: set([3]), 2: set([3]), 3: set()}
+        idom, roots = dominators.immediate_dominators(graph, [0])
+        self.assertEqual(idom, {0: None, 1: 0, 2: 0, 3: 0})
+        self.assertEqual(roots, [0])
+        self.assertEqual(dominators.dominator_tree(idom), {0: [1, 2, 3], 1: [], 2: [], 3: []})
+        self.assertEqual(dominators.dominance_frontiers(graph, idom), {0: set(), 1: set([3]), 2: set([3]), 3: set()})
+
+    def test_unreachable(self):
+        graph = {0: set([1]), 1: set(), 2: set([1])}
+        idom, roots = dominators.immediate_dominators(graph, [0])
+        # the unreachable block is an entry of its own, the join is only dominated by the virtual root
+        self.assertEqual(roots, [0, 2])
+        self.assertEqual(idom, {0: None, 1: None, 2: None})
+
+    def test_same_as_sets(self):
+        for name in sorted(os.listdir(examples)):
+            if not name.endswith('.mc'):
+                continue
+            try:
+                bbs = filetobbs(name)
+            except Exception:
+                # the examples for the error messages
+                continue
+            graph = cfg.bbstocfg(bbs)
+            idom, roots = dominators.immediate_dominators(graph, dominators.function_entries(bbs))
+            doms = dominator_sets(graph, roots)
+            for b in graph:
+                chain = set()
+                runner = b
+                while runner is not None:
+                    chain.add(runner)
+                    runner = idom[runner]
+                self.assertEqual(chain, doms[b], '%s: block %d' % (name, b))
+
+
+class TestLoops(unittest.TestCase):
+
+    def test_whilenested3(self):
+        bbs = filetobbs('whilenested3.mc')
+        dom = dominators.dominance(bbs, cfg.bbstocfg(bbs))
+        self.assertEqual(dom.backedges, [(6, 5), (7, 3), (8, 1)])
+        self.assertEqual([loop.header for loop in dom.loops], [1, 3, 5])
+        outer, middle, inner = dom.loops
+        self.assertEqual(inner.parent, middle)
+        self.assertEqual(middle.parent, outer)
+        self.assertEqual(outer.children, [middle])
+        self.assertEqual(inner.blocks, set([5, 6]))
+        self.assertEqual(dom.depth, {0: 0, 1: 1, 2: 1, 3: 2, 4: 2, 5: 3, 6: 3, 7: 2, 8: 1, 9: 0})
+        self.assertEqual(dom.loop_of(6), inner)
+        self.assertIsNone(dom.loop_of(9))
+        self.assertTrue(dom.dominates(1, 6))
+        self.assertFalse(dom.dominates(6, 7))
+
+    def test_functions(self):
+        bbs = codetobbs('''{
+            int f(int n){
+                int s = 0;
+                for(int i=0;i<n;i=i+1){
+                    s = s + i;
+                }
+                return s;
+            }
+            int g(int n){
+                while(n > 0){
+                    n = n - 1;
+                }
+                return n;
+            }
+        }''')
+        graph = cfg.bbstocfg(bbs)
+        dom = dominators.dominance(bbs, graph)
+        entries = dominators.function_entries(bbs)
+        self.assertEqual(dom.roots[:len(entries)], entries)
+        self.assertTrue(all(dom.idom[entry] is None for entry in entries))
+        self.assertEqual(len(dom.loops), 2)
+        # every loop is in the function of its header
+        for loop in dom.loops:
+            self.assertEqual(loop.depth, 1)
+            funstart = max(entry for entry in entries if entry <= loop.header)
+            self.assertTrue(all(funstart <= b for b in loop.blocks))
+
+    def test_loop_at_entry(self):
+        # the global code starts with the loop header, the entry has a predecessor
+        bbs = codetobbs('''{
+            while(1){
+            }
+        }''')
+        graph = cfg.bbstocfg(bbs)
+        dom = dominators.dominance(bbs, graph)
+        self.assertEqual([loop.header for loop in dom.loops], [0])
+        self.assertIn(0, dom.frontiers[0])
+
+    def test_irreducible(self):
+        graph = {0: set([1, 2]), 1: set([2]), 2: set([1])}
+        dom = dominators.Dominance([[['label', None, None, 'L']]] * 3, graph)
+        self.assertEqual(dom.backedges, [])
+        self.assertEqual(dom.loops, [])
+        self.assertEqual(dom.frontiers, {0: set(), 1: set([2]), 2: set([1])})
+
+    def test_join_of_unreachable_code(self):
+        # lvn folds 'if(0)', the dead block still falls through into the code after the if
+        graph = {0: set([2]), 1: set([2]), 2: set()}
+        dom = dominators.Dominance([[['label', None, None, 'L']]] * 3, graph)
+        self.assertEqual(dom.roots, [0, 1, 2])
+        self.assertTrue(dom.dominates(2, 2))
+        self.assertFalse(dom.dominates(0, 2))
+
+    def test_deeply_nested(self):
+        depth = 200
+        lines = ['{', 'int s = 0;'] + ['int i%d = 0;' % d for d in range(depth)]
+        lines += ['while(i%d < 10){ i%d = i%d + 1;' % (d, d, d) for d in range(depth)]
+        lines += ['s = s + 1;'] + ['}'] * depth + ['}']
+        bbs = bb.threetobbs(three.asttothree(parser.parse('\n'.join(lines), backend='fast')))
+        dom = dominators.dominance(bbs, cfg.bbstocfg(bbs))
+        self.assertEqual(len(dom.loops), depth)
+        self.assertEqual(max(dom.depth.values()), depth)
+        self.assertEqual(dom.loops[-1].depth, depth)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import glob
+import os
+from parsimonious.exceptions import ParseError
+from src import parser
+from src import fastparser
+
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def readmcfile(fname):
+    # same wrapping as parser.parsefile
+    with open(fname, 'r') as mcfile:
+        return '{\n' + mcfile.read()[:-1] + '\n}'
+
+
+class TestTokenizer(unittest.TestCase):
+
+    def test_tokens(self):
+        tokens = [text for _, text, _ in fastparser.tokenize('x<=-4.5 ;a!=b')]
+        self.assertEqual(tokens, ['x', '<=', '-', '4.5', ';', 'a', '!=', 'b', ''])
+
+    def test_kinds(self):
+        kinds = [kind for kind, _, _ in fastparser.tokenize('int x = 4 + 2.;')]
+        self.assertEqual(kinds, ['name', 'name', 'op', 'int', 'op', 'float', 'op', 'eof'])
+
+    def test_invalid_character(self):
+        with self.assertRaises(fastparser.ParseException):
+            fastparser.tokenize('int x = 4 $ 2;')
+
+
+class TestDifferential(unittest.TestCase):
+    ''' the fast backend has to produce exactly the same AST as the parsimonious grammar '''
+
+    def checksame(self, stringcode):
+        expected = parser.parse(stringcode, backend='parsimonious')
+        actual = parser.parse(stringcode, backend='fast')
+        self.assertEqual(expected, actual, stringcode)
+        # namedtuples compare equal to plain tuples, check the node types too
+        self.assertEqual(parser.prettyast(expected), parser.prettyast(actual), stringcode)
+
+    def test_examples(self):
+        fnames = glob.glob(os.path.join(root, 'examples', '*.mc')) + \
+            glob.glob(os.path.join(root, 'examples', '*.c')) + \
+            glob.glob(os.path.join(root, 'bench', '*.c'))
+        self.assertTrue(len(fnames) > 0)
+        for fname in sorted(fnames):
+            stringcode = readmcfile(fname)
+            try:
+                parser.parse(stringcode, backend='parsimonious')
+            except ParseError:
+                # some examples use a different array syntax, both backends have to reject them
+                with self.assertRaises(fastparser.ParseException):
+                    parser.parse(stringcode, backend='fast')
+                continue
+            self.checksame(stringcode)
+
+    def test_parser_snippets(self):
+        # the programs of test_parser.py
+        snippets = [
+            'if(1) {\n int x = 2;\n } else {\n int x = 3;\n }',
+            'if(1) {\n int x = 2;\n }',
+            'int x;',
+            'float y = 1.0;',
+            'float y = x;',
+            '{\n int x;\n if(1 == 2) {\n 5+4*8.0;\n 7;\n x = 8;\n } else {\n if(2 < 9) {\n }\n }\n 2.9;\n }',
+            '{\n int x=1;\n float y = 3.0;\n if(x > 0) {\n y = y * 1.5;\n } else {\n y = y + 2.0;\n }\n }',
+            '(4*3)+((-2)-1);',
+            'if(1)\n if(2){\n }else\n 1.0;',
+            '{ 1; { {} 7; }}',
+            'if (1) {} else 5;',
+            'foo()+1;',
+            '2.0*x ;',
+        ]
+        for snippet in snippets:
+            self.checksame(snippet)
+
+    def test_expressions(self):
+        snippets = [
+            'a - b * c + d;',
+            '-5.0*10.0;',
+            '!a == b;',
+            'x = y = z;',
+            'a[i+1] = f(a[i], -b, (c));',
+            'x<-1;',
+            'x = 3.;',
+        ]
+        for snippet in snippets:
+            self.checksame(snippet)
+
+    def test_statements(self):
+        snippets = [
+            '{ int a[n*2]; float b[4]; a[0] = b[1]; }',
+            '{ void f(){} int g(int x, float y){ return x; } void h(){ return; } }',
+            '{ for(int i=0;i<10;i=i+1) x = x + i; for(i=0;i<10;i=i+1){} }',
+            '{ while(x) { while(y) x = y; } }',
+            '{ if(a) if(b) c; else d; else e; }',
+        ]
+        for snippet in snippets:
+            self.checksame(snippet)
+
+    def test_long_expression(self):
+        # deeper than the recursion limit of the right-recursive grammar
+        code = 'x = ' + ' + '.join(['1'] * 5000) + ';'
+        ast = parser.parse(code, backend='fast')
+        self.assertEqual(ast.operation, '=')
+
+    def test_errors(self):
+        for code in ['int x', 'int x = ;', '{ x = 1;', 'if x {}', 'int f(int x {}', 'x = 1; y = 2;']:
+            with self.assertRaises(fastparser.ParseException):
+                parser.parse(code, backend='fast')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import os
+import io
+import copy
+import contextlib
+import unittest
+from src import three
+from src import parser
+from src import bb
+from src import lvn
+from src import vm
+from src import gvn
+
+examples = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples')
+
+
+def codetobbs(stringcode):
+    return lvn.lvn(bb.threetobbs(three.asttothree(parser.parse(stringcode))))
+
+
+def run(bbs):
+    ''' vm.run changes the blocks it runs '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        return vm.run(copy.deepcopy(bbs))
+
+
+def expressions(bbs):
+    return [tuple(code[:3]) for block in bbs for code in block if code[0] not in ['assign', 'label', 'jump']]
+
+
+class TestGVN(unittest.TestCase):
+
+    def test_loop_header(self):
+        bbs = codetobbs('''{
+            int f(int n, int m){
+                int s = 0;
+                int i = 0;
+                while(i < n - 1){
+                    s = s + (n - 1) * m;
+                    i = i + 1;
+                }
+                return s;
+            }
+            int main(){
+                int r = f(5, 3);
+                return 0;
+            }
+        }''')
+        stats = {}
+        res = gvn.gvn(bbs, stats=stats)
+        self.assertEqual(expressions(res).count(('-', 'n', 1)), 1)
+        self.assertEqual(stats, {'f': 1, 'main': 0})
+        self.assertEqual(run(res), run(bbs))
+
+    def test_commutative(self):
+        # the parameters aren't constants for lvn
+        bbs = codetobbs('''{
+            int f(int a, int b){
+                int x = a * b;
+                int y = 0;
+                if(a < b){
+                    y = (b * a) + 1;
+                    int z = (a * b) + 1;
+                    y = y + z;
+                }
+                return y;
+            }
+            int r = f(3, 4);
+        }''')
+        stats = {}
+        res = gvn.gvn(bbs, stats=stats)
+        # 'b * a' is 'x' from the dominating block, lvn already found 'z'
+        self.assertEqual(stats['f'], 1)
+        self.assertEqual(run(res), run(bbs))
+        self.assertIn(['+', 'x', 1, 'y'], [code for block in res for code in block])
+
+    def test_only_dominating_blocks(self):
+        bbs = codetobbs('''{
+            int f(int a, int b){
+                int x = 0;
+                if(a < b){
+                    x = a + b;
+                }else{
+                    x = a - b;
+                }
+                int y = a + b;
+                return x * y;
+            }
+            int r = f(3, 4);
+        }''')
+        stats = {}
+        res = gvn.gvn(bbs, stats=stats)
+        # the branch doesn't dominate the join
+        self.assertEqual(stats['f'], 0)
+        self.assertEqual(expressions(res).count(('+', 'a', 'b')), 2)
+
+    def test_reassigned_variable(self):
+        bbs = codetobbs('''{
+            int a = 3;
+            int x = a + 1;
+            int i = 0;
+            while(i < 3){
+                x = x + 1;
+                int y = a + 1;
+                i = i + 1;
+            }
+        }''')
+        res = gvn.gvn(bbs)
+        # 'x' is overwritten in the loop, its first value isn't available for 'y'
+        self.assertEqual(run(res), run(bbs))
+        self.assertEqual(run(res)['y'], 4)
+
+    def test_int_and_float(self):
+        bbs = codetobbs('''{
+            float f = 2.0;
+            float x = f * 1.0;
+            if(1){
+                float y = f * 1;
+            }
+        }''')
+        stats = {}
+        gvn.gvn(bbs, stats=stats)
+        self.assertEqual(stats['__global__'], 0)
+
+    def test_nested_if_without_else(self):
+        # the join of both 'if's is a block with only its label, it needs the phi of 'e'
+        bbs = bb.threetobbs(three.asttothree(parser.parse('''{
+            int b = 0;
+            int c = 1;
+            int e = 5;
+            if(b){
+                b = 1;
+            }else{
+                if(c){
+                    e = 0;
+                }
+            }
+            b = (e < e);
+        }''')))
+        self.assertEqual(run(gvn.gvn(bbs)), run(bbs))
+        self.assertEqual(run(gvn.gvn(bbs))['e'], 0)
+
+    def test_examples(self):
+        for name in sorted(os.listdir(examples)):
+            if not name.endswith('.mc') or name == 'primes.mc':
+                continue
+            with open(os.path.join(examples, name)) as f:
+                if 'read_' in f.read():
+                    continue
+            try:
+                bbs = bb.threetobbs(three.asttothree(parser.parsefile(os.path.join(examples, name))))
+                expected = run(bbs)
+            except Exception:
+                # the examples for the error messages and the ones without global code
+                continue
+            self.assertEqual(run(gvn.gvn(bbs)), expected, name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,243 @@
+import os
+import io
+import copy
+import contextlib
+import unittest
+from src import three
+from src import parser
+from src import bb
+from src import lvn
+from src import vm
+from src import cfg
+from src import dominators
+from src import dce
+from src import licm
+from src.assembler import codetoassembly
+
+examples = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples')
+bench = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench')
+
+
+def codetobbs(stringcode):
+    return lvn.lvn(bb.threetobbs(three.asttothree(parser.parse(stringcode))))
+
+
+def run(bbs):
+    ''' vm.run changes the blocks it runs '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        return vm.run(copy.deepcopy(bbs))
+
+
+def depths(bbs):
+    ''' {code without its result: the loop depth of its block} '''
+    dom = dominators.Dominance(bbs, cfg.bbstocfg(bbs))
+    return {tuple(code[:3]): dom.depth[b] for b, block in enumerate(bbs) for code in block}
+
+
+class TestLICM(unittest.TestCase):
+
+    def test_loop_bound(self):
+        bbs = codetobbs('''{
+            int f(int n, int m){
+                int s = 0;
+                int i = 0;
+                while(i < n - 1){
+                    s = s + (m * 3);
+                    i = i + 1;
+                }
+                return s;
+            }
+            int r = f(5, 2);
+        }''')
+        stats = {}
+        res = licm.licm(bbs, stats=stats)
+        self.assertEqual(run(res), run(bbs))
+        self.assertEqual(stats, {'hoisted': 2, 'loops': 1})
+        self.assertEqual(depths(res)[('-', 'n', 1)], 0)
+        self.assertEqual(depths(res)[('*', 'm', 3)], 0)
+        self.assertEqual(depths(res)[('+', 'i', 1)], 1)
+
+    def test_nested(self):
+        bbs = codetobbs('''{
+            int f(int n){
+                int s = 0;
+                int i = 0;
+                while(i < n){
+                    int j = 0;
+                    while(j < n){
+                        s = s + ((n * n) + (i * 3));
+                        j = j + 1;
+                    }
+                    i = i + 1;
+                }
+                return s;
+            }
+            int r = f(4);
+        }''')
+        res = licm.licm(bbs)
+        self.assertEqual(run(res), run(bbs))
+        # 'n * n' leaves both loops, 'i * 3' only the inner one
+        self.assertEqual(depths(res)[('*', 'n', 'n')], 0)
+        self.assertEqual(depths(res)[('*', 'i', 3)], 1)
+
+    def test_stores(self):
+        bbs = codetobbs('''{
+            int f(int n){
+                int a[3];
+                a[0] = n;
+                int i = 0;
+                while(i < a[0]){
+                    a[1] = i;
+                    i = i + 1;
+                }
+                int b[3];
+                b[0] = n;
+                int j = 0;
+                while(j < b[0]){
+                    j = j + 1;
+                }
+                return i + j;
+            }
+            int r = f(3);
+        }''')
+        res = licm.licm(bbs)
+        self.assertEqual(run(res)['r'], 6)
+        loads = {code[2]: depth for code, depth in depths(res).items() if code[0] == 'arr-acc'}
+        self.assertEqual(loads, {'a': 1, 'b': 0})
+
+    def test_speculation(self):
+        bbs = codetobbs('''{
+            int f(int n, int d){
+                int i = 0;
+                int x = 0;
+                while(i < n){
+                    if(d != 0){
+                        x = x + (n / d);
+                    }
+                    i = i + 1;
+                }
+                return x;
+            }
+            int r = f(3, 0);
+            int s = f(0, 2);
+            int j = 0;
+            while(j < s){
+                int y = r + 1;
+                j = j + 1;
+            }
+        }''')
+        res = licm.licm(bbs)
+        self.assertEqual(run(res), run(bbs))
+        # the division may fail, 'y' stays undefined after a loop which doesn't run
+        self.assertEqual(depths(res)[('/', 'n', 'd')], 1)
+        self.assertEqual(depths(res)[('+', 'r', 1)], 1)
+
+    def test_temporaries(self):
+        # without lvn every read of a variable is a copy into a temporary
+        bbs = bb.threetobbs(three.asttothree(parser.parse('''{
+            int f(int n){
+                int s = 0;
+                for(int i = 0; i < n; i = i + 1){
+                    s = s + n;
+                }
+                return s;
+            }
+            int r = f(4);
+        }''')))
+        stats = {}
+        res = licm.licm(bbs, stats=stats)
+        self.assertEqual(run(res), run(bbs))
+        # the read of 'n' in the header and the body, the constant 1
+        self.assertEqual(stats, {'hoisted': 3, 'loops': 1})
+
+    def test_later_passes(self):
+        # the hoisted temporaries become variables, lvn keeps them although their uses are in other blocks
+        bbs = bb.threetobbs(three.asttothree(parser.parse('''{
+            int f(int n){
+                int s = 0;
+                for(int i = 0; i < n - 1; i = i + 1){
+                    s = s + (n * 3);
+                }
+                return s;
+            }
+            int main(){
+                int r = f(4);
+                return 0;
+            }
+        }''')))
+        expected = run(bbs)
+        res = licm.licm(bbs)
+        for block in res:
+            temporaries = [code[3] for code in block if code[0] not in ['label', 'jump', 'jumpfalse']]
+            uses = [arg for code in block for arg in dce.uses(code)]
+            self.assertEqual([arg for arg in uses if arg[:2] == '.t' and arg not in temporaries], [])
+        self.assertEqual(run(lvn.lvn(res)), expected)
+        self.assertEqual(run(dce.dce(res, uselvn=True)), expected)
+        self.assertEqual(run(licm.licm(lvn.lvn(res))), expected)
+
+    def test_calls(self):
+        bbs = codetobbs('''{
+            int g = 1;
+            int h(){
+                g = g + 1;
+                return g;
+            }
+            int f(int n){
+                int s = 0;
+                int i = 0;
+                while(i < n){
+                    s = s + (h() + ((g * 3) + (n * 3)));
+                    i = i + 1;
+                }
+                return s;
+            }
+            int r = f(3);
+        }''')
+        res = licm.licm(bbs)
+        # 'h' changes the global 'g', the parameter 'n' stays
+        self.assertEqual(depths(res)[('*', 'g', 3)], 1)
+        self.assertEqual(depths(res)[('*', 'n', 3)], 0)
+
+    def test_jump_to_header(self):
+        # the entry jumps over a block which falls through to the header
+        bbs = [
+            [['function', None, None, 'main'], ['assign', 5, 'int', 'n'], ['assign', 0, 'int', 'i'],
+             ['jump', None, None, 'L1']],
+            [['label', None, None, 'L0'], ['assign', 1, None, 'i']],
+            [['label', None, None, 'L1'], ['<', 'i', 'n', '.t0'], ['jumpfalse', '.t0', None, 'L2']],
+            [['*', 'n', 3, '.t1'], ['+', 'i', '.t1', 'i'], ['jump', None, None, 'L1']],
+            [['label', None, None, 'L2'], ['return', None, None, None], ['end-fun', None, None, None]],
+        ]
+        res = licm.licm(bbs)
+        self.assertEqual(res[2], [['label', None, None, 'L3'], ['*', 'n', 3, '.l0']])
+        self.assertEqual(res[0][-1], ['jump', None, None, 'L3'])
+        # the back edge still goes to the header
+        self.assertEqual(res[4], [['+', 'i', '.l0', 'i'], ['jump', None, None, 'L1']])
+        self.assertEqual(run(res), run(bbs))
+        for target in ['x86', 'x86-64']:
+            codetoassembly([code for block in res for code in block], target=target)
+
+    def test_examples(self):
+        names = [os.path.join(examples, name) for name in sorted(os.listdir(examples))]
+        names += [os.path.join(bench, name) for name in sorted(os.listdir(bench)) if name.endswith('.c')]
+        for name in names:
+            if not name.endswith(('.mc', '.c')) or name.endswith('primes.mc'):
+                continue
+            with open(name) as f:
+                if 'read_' in f.read():
+                    continue
+            try:
+                bbs = bb.threetobbs(three.asttothree(parser.parsefile(name)))
+                run(bbs)
+            except Exception:
+                # the examples for the error messages
+                continue
+            for optimized in [bbs, lvn.lvn(copy.deepcopy(bbs))]:
+                expected = run(optimized)
+                res = licm.licm(optimized)
+                self.assertEqual(run(res), expected, name)
+                self.assertEqual(run(dce.dce(res, uselvn=True)), expected, name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,7 @@ from src import parser
 from src import bb
 from src import cfg
 from src import lvn
+from src.utils import fold_constant, un_ops
 
 
 def codetobbs(stringcode):
@@ -36,6 +37,10 @@ def valrec(values, name):
         op, arg1, arg2 = name
         if op == 'assign':
             return valrec(values, arg1)
+        args = [valrec(values, arg1)] if op in un_ops else [valrec(values, arg1), valrec(values, arg2)]
+        if all(type(arg) in [int, float] for arg in args) and fold_constant(op, *args) is not None:
+            # lvn folds the constants
+            return fold_constant(op, *args)
         else:
             if op in ['+', '*', '==', '!=']:
                 return (op, set([valrec(values, arg1), valrec(values, arg2)]))
@@ -146,5 +151,148 @@ class TestLVN(unittest.TestCase):
         ntmpvars = self.codetest(code)
         self.assertEqual(len(ntmpvars), 0)
 
+
+class TestKills(unittest.TestCase):
+
+    def numbered(self, stringcode):
+        bbs = lvn.lvn(codetobbs(stringcode))
+        return [tac for block in bbs for tac in block if tac[0] not in ['function', 'pop', 'end-fun']]
+
+    def test_swap(self):
+        code = self.numbered('''{
+            int f(int a, int b){
+                int t = a;
+                a = b;
+                b = t;
+                return a - b;
+            }
+        }''')
+        # 't' still has the old value of 'a', it holds the value of 'b' first
+        self.assertIn(['assign', 't', None, 'b'], code)
+        self.assertIn(['-', 'a', 't'], [tac[:3] for tac in code])
+
+    def test_redefined_operand(self):
+        code = self.numbered('''{
+            int f(int a, int b){
+                int x = a + b;
+                a = b;
+                int y = a + b;
+                return x - y;
+            }
+        }''')
+        self.assertIn(['+', 'a', 'b', 'x'], code)
+        self.assertIn(['+', 'b', 'b', 'y'], code)
+
+    def test_redefined_holder(self):
+        code = self.numbered('''{
+            int f(int a, int b){
+                int x = a * b;
+                int y = a * b;
+                x = 0;
+                int z = b * a;
+                return x + y + z;
+            }
+        }''')
+        # the value of 'x' is still in 'y'
+        self.assertEqual([tac[0] for tac in code].count('*'), 1)
+        self.assertIn(['assign', 'x', 'int', 'y'], code)
+        self.assertIn(['assign', 'y', 'int', 'z'], code)
+
+    def test_lost_value(self):
+        code = self.numbered('''{
+            int f(int a, int b){
+                int x = a + b;
+                a = 1;
+                x = a;
+                int y = (a + b) - x;
+                return y;
+            }
+        }''')
+        # 'x' and the old 'a' are gone, 'a + b' is computed again with the new 'a'
+        self.assertEqual([tac[:3] for tac in code if tac[0] == '+'], [['+', 'a', 'b'], ['+', 1, 'b']])
+
+    def test_fixpoint(self):
+        # 'e * e' of 'x' is reused for 'y', the temporary keeps it because 'x' reads it too
+        bbs = lvn.lvn(codetobbs('''{
+            int e = read_int();
+            int x = (e * e) >= e;
+            int y = e * e;
+            print_int(y);
+        }'''))
+        self.assertEqual([tac[0] for block in bbs for tac in block].count('*'), 1)
+        self.assertEqual(lvn.lvn(deepcopy(bbs)), bbs)
+
+
+class TestSimplification(unittest.TestCase):
+
+    def simplified(self, code):
+        stats = {}
+        bbs = lvn.lvn(codetobbs(code), stats=stats)
+        return [tac for block in bbs for tac in block], stats
+
+    def test_rules(self):
+        code, stats = self.simplified('''{
+            int f(int x){
+                int a = x + 0;
+                int b = 1 * x;
+                int c = x * 0;
+                int d = x * 2;
+                int e = 0 - x;
+                int g = x - x;
+                int h = x <= x;
+                return a + b;
+            }
+        }''')
+        for rule in ['add-zero', 'mul-one', 'mul-zero', 'mul-two', 'neg', 'sub-self', 'compare-self']:
+            self.assertEqual(stats[rule], 1, rule)
+        self.assertEqual(stats['fold'], 0)
+        self.assertIn(['assign', 'x', 'int', 'a'], code)
+        self.assertIn(['assign', 'x', 'int', 'b'], code)
+        self.assertIn(['assign', 0, 'int', 'c'], code)
+        self.assertIn(['+', 'x', 'x', 'd'], code)
+        self.assertIn(['u-', 'x', None, 'e'], code)
+        self.assertIn(['assign', 0, 'int', 'g'], code)
+        self.assertIn(['assign', 1, 'int', 'h'], code)
+
+    def test_fold(self):
+        code, stats = self.simplified('''{
+            int a = 6;
+            int b = a * 7;
+            int c = (b - 2) / 8;
+            int d = 7 / 0;
+        }''')
+        self.assertIn(['assign', 42, 'int', 'b'], code)
+        self.assertIn(['assign', 5, 'int', 'c'], code)
+        # a division by zero is left to the runtime
+        self.assertIn(['/', 7, 0], [tac[:3] for tac in code])
+        self.assertEqual(stats['fold'], 3)
+
+    def test_floats(self):
+        code, stats = self.simplified('''{
+            float f(float x){
+                float a = x + 0.0;
+                float b = x * 1.0;
+                float c = x - x;
+                float d = 1.5 * 2.0;
+                return a;
+            }
+        }''')
+        # x + 0.0 is 0.0 for x = -0.0, x - x is nan for x = inf
+        self.assertEqual(sum(stats.values()), 1)
+        self.assertIn(['assign', 3.0, 'float', 'd'], code)
+
+    def test_branch(self):
+        # never taken: the block is skipped, always taken: the jumpfalse disappears
+        for cond, jumps in [('x > 2', 1), ('x < 2', 0)]:
+            code, stats = self.simplified('''{
+                int x = 1;
+                if(%s){
+                    x = 5;
+                }
+            }''' % cond)
+            self.assertEqual(stats['branch'], 1)
+            self.assertNotIn('jumpfalse', [tac[0] for tac in code])
+            self.assertEqual([tac[0] for tac in code].count('jump'), jumps)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import glob
+import os
+import sys
+from copy import deepcopy
+from src import three
+from src import parser
+from src import bb
+from src import packed
+
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def codetothree(stringcode):
+    return three.asttothree(parser.parse(stringcode))
+
+
+def examplethrees():
+    for fname in sorted(glob.glob(os.path.join(root, 'examples', '*.mc'))):
+        with open(fname, 'r') as mcfile:
+            stringcode = '{\n' + mcfile.read()[:-1] + '\n}'
+        try:
+            yield three.asttothree(parser.parse(stringcode, backend='fast'))
+        except Exception:
+            # examples which are not accepted by the grammar / scope checks
+            continue
+
+
+class TestSymbolTable(unittest.TestCase):
+
+    def test_intern(self):
+        symbols = packed.SymbolTable()
+        self.assertEqual(symbols.intern(None), packed.NONE)
+        x = symbols.intern('x')
+        self.assertEqual(symbols.intern('x'), x)
+        self.assertEqual(symbols[x], 'x')
+        self.assertEqual(symbols[packed.NONE], None)
+
+    def test_types_are_distinct(self):
+        symbols = packed.SymbolTable()
+        nums = [symbols.intern(el) for el in [1, 1.0, True, '1']]
+        self.assertEqual(len(set(nums)), 4)
+        self.assertEqual([type(symbols[num]) for num in nums], [int, float, bool, str])
+
+
+class TestPackedTAC(unittest.TestCase):
+
+    def test_roundtrip(self):
+        count = 0
+        for code in examplethrees():
+            p = packed.PackedTAC.fromcode(code)
+            self.assertEqual(len(p), len(code))
+            self.assertEqual(p.tolist(), code)
+            for line, tac in enumerate(code):
+                self.assertEqual(p[line], tac)
+            count += 1
+        self.assertTrue(count > 10)
+
+    def test_setitem_and_slice(self):
+        code = codetothree('{ int x = 1; int y = x + 2; }')
+        p = packed.PackedTAC.fromcode(code)
+        p[0] = ['assign', 5, None, '.t0']
+        code[0] = ['assign', 5, None, '.t0']
+        self.assertEqual(p.tolist(), code)
+        part = p[1:3]
+        self.assertIs(part.symbols, p.symbols)
+        self.assertEqual(part.tolist(), code[1:3])
+
+    def test_opcode_tables(self):
+        for op in packed.opcodes:
+            num = packed.opcode_index[op]
+            self.assertEqual(packed.opcodes[num], op)
+        self.assertEqual(packed.opcode_kind[packed.opcode_index['<=']], 'binop')
+        self.assertEqual(packed.opcode_kind[packed.opcode_index['u!']], 'unop')
+        self.assertEqual(packed.opcode_uses_values[packed.opcode_index['*']], (1, 2))
+        self.assertTrue(packed.opcode_sets_result[packed.opcode_index['pop']])
+        self.assertFalse(packed.opcode_sets_result[packed.opcode_index['push']])
+
+    def test_memory(self):
+        code = [tac for c in examplethrees() for tac in c]
+        p = packed.PackedTAC.fromcode(code)
+        listsize = sys.getsizeof(code) + sum(sys.getsizeof(tac) for tac in code)
+        self.assertEqual(p.nbytes(), 16 * len(code))
+        self.assertLess(p.nbytes() * 5, listsize)
+
+
+class TestPackedBBs(unittest.TestCase):
+
+    def test_threetobbs(self):
+        for code in examplethrees():
+            expected = bb.threetobbs(deepcopy(code))
+            actual = bb.threetobbs(packed.PackedTAC.fromcode(code))
+            self.assertEqual(actual, expected)
+
+    def test_pack_unpack(self):
+        for code in examplethrees():
+            bbs = bb.threetobbs(code)
+            packedbbs = packed.packbbs(bbs)
+            self.assertEqual(len(set(id(p.symbols) for p in packedbbs)), 1)
+            self.assertEqual(packed.unpackbbs(packedbbs), bbs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from src.assembler import ASMInstruction as I
+from src.peephole import peephole, count_instructions
+from test.test_assembler import codetoasm
+
+
+def instructions(assembly):
+    return [el for el in assembly if type(el) is not str and el.op is not None]
+
+
+class TestRules(unittest.TestCase):
+
+    def test_store_load(self):
+        asm, hits = peephole([I('mov', '%eax', '-4(%ebp)', 'x = 1'), I('movl', '-4(%ebp)', '%eax', 'y := x')])
+        self.assertEqual(instructions(asm), [I('mov', '%eax', '-4(%ebp)')])
+        # the comment of the removed instruction is kept
+        self.assertEqual(asm[1].comment, 'y := x')
+        self.assertEqual(hits['store-load'], 1)
+
+    def test_store_forward(self):
+        asm, hits = peephole([I('mov', '%eax', '-4(%ebp)'), I(None, comment='x'), I('mov', '-4(%ebp)', '%ebx')])
+        self.assertEqual(instructions(asm), [I('mov', '%eax', '-4(%ebp)'), I('mov', '%eax', '%ebx')])
+        self.assertEqual(hits['store-forward'], 1)
+
+    def test_commute_reload(self):
+        asm, hits = peephole([I('mov', '%eax', '-4(%ebp)'), I('mov', '$10', '%eax'), I('add', '-4(%ebp)', '%eax')])
+        self.assertEqual(instructions(asm), [I('mov', '%eax', '-4(%ebp)'), I('add', '$10', '%eax')])
+        # not for a non commutative operation
+        asm, hits = peephole([I('mov', '%eax', '-4(%ebp)'), I('mov', '$10', '%eax'), I('sub', '-4(%ebp)', '%eax')])
+        self.assertEqual(count_instructions(asm), 3)
+
+    def test_set_compare_jump(self):
+        asm, hits = peephole([
+            I('cmp', '%eax', '%ebx'),
+            I('movl', '$0', '-8(%ebp)'),
+            I('setl', '-8(%ebp)'),
+            I('cmp', '$0', '-8(%ebp)'),
+            I('je', 'L1'),
+        ])
+        self.assertEqual(instructions(asm)[-1], I('jge', 'L1'))
+        self.assertEqual(count_instructions(asm), 4)
+        # through the registers of the register allocator
+        asm, hits = peephole([
+            I('setnae', '%al'),
+            I('movzbl', '%al', '%eax'),
+            I('mov', '%eax', '%ecx'),
+            I('cmp', '$0', '%ecx'),
+            I('je', 'L1'),
+        ])
+        self.assertEqual(instructions(asm)[-1], I('jae', 'L1'))
+        self.assertEqual(hits['set-compare-jump'], 1)
+
+    def test_jumps(self):
+        asm, hits = peephole([
+            I('jmp', 'L1'),
+            I('mov', '$1', '%eax'),
+            I('L1:', indent=False),
+            I('mov', '%ecx', '%ecx'),
+            I('ret'),
+        ])
+        self.assertEqual(instructions(asm), [I('L1:'), I('ret')])
+        self.assertEqual((hits['unreachable'], hits['jump-to-next'], hits['self-move']), (1, 1, 1))
+
+    def test_fixpoint(self):
+        # removing the unreachable instruction makes the jump redundant
+        asm, hits = peephole([I('jmp', 'L1'), I('ret'), I('L1:', indent=False), I('ret')])
+        self.assertEqual(instructions(asm), [I('L1:'), I('ret')])
+
+
+class TestPeephole(unittest.TestCase):
+
+    def test_fewer_instructions(self):
+        code = '''{
+            int main(){
+                int s = 0;
+                for(int i=0;i<10;i=i+1){
+                    s = (s + i) * 2;
+                }
+                print_int(s);
+                return 0;
+            }
+        }'''
+        for target in ['x86', 'x86-64']:
+            for regalloc in [None, 'graph']:
+                before = count_instructions(codetoasm(code, regalloc=regalloc, target=target))
+                after = count_instructions(codetoasm(code, regalloc=regalloc, target=target, optimize=True))
+                self.assertLess(after, before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+import unittest
+from src import three
+from src import parser
+from src import bb
+from src import lvn
+from src import regalloc
+from src.assembler import calc_types
+from src.utils import function_ranges2
+
+
+def codetofunctions(stringcode):
+    bbs = lvn.lvn(bb.threetobbs(three.asttothree(parser.parse(stringcode))))
+    code = [tac for bblock in bbs for tac in bblock]
+    return {name: code[start:end] for name, start, end in function_ranges2(code)}
+
+
+def overlap(interval1, interval2):
+    return interval1[0] <= interval2[1] and interval2[0] <= interval1[1]
+
+
+class TestLiveIntervals(unittest.TestCase):
+
+    def test_straight_line(self):
+        code = codetofunctions('''{
+            int main(){
+                int x = read_int();
+                int y = x + 1;
+                return y;
+            }
+        }''')['main']
+        intervals = regalloc.live_intervals(code)
+        # x is popped after the call and dies where y is defined
+        self.assertLess(intervals['x'][0], intervals['y'][0])
+        self.assertEqual(intervals['x'][1] + 1, intervals['y'][0])
+
+    def test_loop(self):
+        code = codetofunctions('''{
+            int main(){
+                int s = 0;
+                for(int i=0;i<10;i=i+1){
+                    s = s + i;
+                }
+                return s;
+            }
+        }''')['main']
+        intervals = regalloc.live_intervals(code)
+        lines = [line for line, (op, _, _, _) in enumerate(code) if op in ['label', 'jump']]
+        # both variables are live in the whole loop
+        for var in ['s', 'i']:
+            self.assertLessEqual(intervals[var][0], 2 * lines[0])
+            self.assertGreaterEqual(intervals[var][1], 2 * lines[1])
+
+    def test_call_result(self):
+        code = codetofunctions('''{
+            int f(int x){
+                int y = read_int();
+                return x + y;
+            }
+        }''')['f']
+        intervals = regalloc.live_intervals(code)
+        call = [line for line, (op, _, _, _) in enumerate(code) if op == 'call'][0]
+        self.assertGreater(intervals['y'][0], 2 * call)
+        self.assertIn('%ecx', regalloc.forbidden_registers(intervals['x'], regalloc.clobbers(code)))
+        self.assertEqual(regalloc.forbidden_registers(intervals['y'], regalloc.clobbers(code)), set())
+
+
+class TestLinearScan(unittest.TestCase):
+
+    def test_disjoint_intervals_share(self):
+        allocation = regalloc.linear_scan({'a': [0, 3], 'b': [4, 9], 'c': [1, 5]}, {})
+        self.assertEqual(allocation, {'a': '%ecx', 'c': '%edx', 'b': '%ecx'})
+
+    def test_result_reuses_operand(self):
+        # 'a' is read at 4, 'b' is written at 5
+        allocation = regalloc.linear_scan({'a': [1, 4], 'b': [5, 9]}, {})
+        self.assertEqual(allocation['a'], allocation['b'])
+
+    def test_spill_longest(self):
+        intervals = {str(i): [i, 10] for i in range(len(regalloc.registers))}
+        intervals['long'] = [0, 100]
+        intervals['short'] = [6, 8]
+        allocation = regalloc.linear_scan(intervals, {})
+        self.assertNotIn('long', allocation)
+        self.assertIn('short', allocation)
+        self.assertEqual(len(set(allocation.values())), len(regalloc.registers))
+
+    def test_clobbered(self):
+        # the instruction at line 3 (position 6) overwrites %ecx and %edx, 'b' is its result
+        clobbered = {3: set(['%ecx', '%edx'])}
+        allocation = regalloc.linear_scan({'a': [0, 10], 'b': [7, 9], 'c': [6, 8]}, clobbered)
+        self.assertEqual(allocation, {'a': '%ebx', 'c': '%esi', 'b': '%ecx'})
+        allocation = regalloc.linear_scan({'a': [0, 10]}, clobbered, regs=['%ecx'])
+        self.assertEqual(allocation, {})
+
+
+class TestGraphColoring(unittest.TestCase):
+
+    def test_interference(self):
+        code = codetofunctions('''{
+            int main(){
+                int x = read_int();
+                int y = x + 1;
+                int z = y + x;
+                return z;
+            }
+        }''')['main']
+        graph, _, _, _ = regalloc.interference_graph(code, set(['x', 'y', 'z']))
+        self.assertEqual(graph, {'x': set(['y']), 'y': set(['x']), 'z': set()})
+
+    def test_coalesce_copies(self):
+        code = codetofunctions('''{
+            int main(){
+                int x = read_int();
+                int y = x;
+                int z = y + 1;
+                return z;
+            }
+        }''')['main']
+        graph, moves, costs, forbidden = regalloc.interference_graph(code, set(['x', 'y', 'z']))
+        self.assertEqual([(dst, src) for dst, src, _ in moves], [('y', 'x')])
+        allocation = regalloc.graph_coloring(graph, moves, costs, forbidden)
+        self.assertEqual(allocation['x'], allocation['y'])
+
+    def test_loop_depths(self):
+        bbs = lvn.lvn(bb.threetobbs(three.asttothree(parser.parse('''{
+            void main(){
+                int s = 0;
+                for(int i=0;i<10;i=i+1){
+                    for(int j=0;j<10;j=j+1){
+                        s = s + j;
+                    }
+                }
+                print_int(s);
+            }
+        }'''))))
+        from src.cfg import bbstocfg
+        depths = regalloc.loop_depths(bbs, bbstocfg(bbs))
+        self.assertEqual(depths[0], 0)
+        self.assertEqual(max(depths), 2)
+        self.assertEqual(depths[-1], 0)
+
+    def test_spill_cheapest(self):
+        # a clique of K + 1 nodes, the node with the lowest cost is spilled
+        nodes = ['v%d' % i for i in range(len(regalloc.registers) + 1)]
+        graph = {node: set(nodes) - set([node]) for node in nodes}
+        costs = {node: 100 for node in nodes}
+        costs['v3'] = 1
+        forbidden = {node: set() for node in nodes}
+        allocation = regalloc.graph_coloring(graph, [], costs, forbidden)
+        self.assertEqual(sorted(allocation), sorted(set(nodes) - set(['v3'])))
+
+    def test_forbidden(self):
+        graph = {'a': set(['b']), 'b': set(['a'])}
+        forbidden = {'a': set(['%ecx', '%edx']), 'b': set()}
+        allocation = regalloc.graph_coloring(graph, [], {'a': 1, 'b': 1}, forbidden)
+        self.assertEqual(allocation, {'a': '%ebx', 'b': '%ecx'})
+
+
+class TestAllocate(unittest.TestCase):
+
+    def test_no_overlapping_registers(self):
+        functions = codetofunctions('''{
+            int f(int a, int b, int c){
+                int d = (a * b) / c;
+                int e = (a + b) % (c + 1);
+                int arr[10];
+                arr[1] = d;
+                return ((d + e) + arr[1]) + f(d, e, a);
+            }
+            void main(){
+                int x = read_int();
+                int y = x * x;
+                int z = y - x;
+                float w = 2.0;
+                print_int(((x + y) + z) + f(x, y, z));
+                print_float(w);
+            }
+        }''')
+        for name in ['f', 'main']:
+            code = functions[name]
+            allocation = regalloc.allocate(code, calc_types(code))
+            intervals = regalloc.live_intervals(code)
+            for var1 in allocation:
+                for var2 in allocation:
+                    if var1 != var2 and allocation[var1] == allocation[var2]:
+                        self.assertFalse(overlap(intervals[var1], intervals[var2]))
+            self.assertNotIn('arr', allocation)
+            self.assertNotIn('w', allocation)
+
+            allocation = regalloc.allocate(code, calc_types(code), 'graph')
+            graph, _, _, forbidden = regalloc.interference_graph(code, set(allocation))
+            for var in allocation:
+                self.assertNotIn(allocation[var], forbidden[var])
+                for other in graph[var]:
+                    self.assertNotEqual(allocation[var], allocation[other])
+
+    def test_unknown_strategy(self):
+        code = codetofunctions('{ void main(){ int x = 1; } }')['main']
+        with self.assertRaises(NotImplementedError):
+            regalloc.allocate(code, calc_types(code), 'unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import os
+import io
+import copy
+import contextlib
+import unittest
+from src import three
+from src import parser
+from src import bb
+from src import lvn
+from src import vm
+from src import sccp
+from src.assembler import codetoassembly
+
+examples = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples')
+
+
+def codetobbs(stringcode):
+    return bb.threetobbs(three.asttothree(parser.parse(stringcode)))
+
+
+def run(bbs):
+    ''' vm.run changes the blocks it runs '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        return vm.run(copy.deepcopy(bbs))
+
+
+def codes(bbs):
+    return [code for block in bbs for code in block]
+
+
+class TestSCCP(unittest.TestCase):
+
+    def test_fold_branch(self):
+        bbs = codetobbs('''{
+            int n = 10;
+            int debug = 0;
+            int s = 0;
+            int i = 0;
+            while(i < n){
+                if(debug){
+                    s = s + 100;
+                }
+                s = s + i * 2;
+                i = i + 1;
+            }
+        }''')
+        bbs = lvn.lvn(bbs)
+        stats = {}
+        res = sccp.sccp(bbs, stats=stats)
+        self.assertEqual(run(res), run(bbs))
+        # the loop stays, 'if(debug)' and its block are gone
+        self.assertNotIn(100, [arg for code in codes(res) for arg in code[1:3]])
+        self.assertEqual(len([code for code in codes(res) if code[0] == 'jumpfalse']), 1)
+        self.assertEqual(stats['branches'], 1)
+        # the bound of the loop is a constant now
+        self.assertIn(['<', 'i', 10], [code[:3] for code in codes(res)])
+
+    def test_constant_condition_in_loop(self):
+        # 'x' is only constant because the assignment in the loop is never reached
+        bbs = codetobbs('''{
+            int x = 1;
+            int i = 0;
+            while(i < 5){
+                if(x != 1){
+                    x = 2;
+                }
+                i = i + 1;
+            }
+            int y = x + 1;
+        }''')
+        res = sccp.sccp(bbs)
+        self.assertEqual(run(res), run(bbs))
+        self.assertNotIn(2, [code[1] for code in codes(res) if code[0] == 'assign' and code[3] == 'x'])
+        self.assertIn(['assign', 2, 'int', 'y'], codes(res))
+
+    def test_not_constant(self):
+        bbs = codetobbs('''{
+            int x = 1;
+            int i = 0;
+            while(i < 5){
+                x = x + 1;
+                i = i + 1;
+            }
+            int y = x;
+        }''')
+        res = sccp.sccp(bbs)
+        self.assertEqual(run(res)['y'], 6)
+        self.assertNotIn(['assign', 1, None, 'y'], codes(res))
+
+    def test_semantics(self):
+        bbs = codetobbs('''{
+            int a = 7 / 2;
+            int b = 7 % 3;
+            int c = 0 - 7;
+            int d = c / 2;
+            float f = 1.5 * 2.0;
+            int g = 2147483647;
+            int h = g + 1;
+            int e = 1 / 0;
+        }''')
+        res = codes(sccp.sccp(bbs))
+        self.assertIn(['assign', 3, 'int', 'a'], res)
+        self.assertIn(['assign', 1, 'int', 'b'], res)
+        self.assertIn(['assign', 3.0, 'float', 'f'], res)
+        # rounding of negative divisions, overflows and the division by zero are left to the runtime
+        res = [code[:3] for code in res]
+        self.assertIn(['/', -7, 2], res)
+        self.assertIn(['+', 2147483647, 1], res)
+        self.assertIn(['/', 1, 0], res)
+
+    def test_functions(self):
+        bbs = codetobbs('''{
+            int f(int n){
+                int limit = 3;
+                if(limit > 5){
+                    return 0;
+                }
+                return n * limit;
+            }
+            int main(){
+                int x = f(4);
+                return 0;
+            }
+        }''')
+        res = sccp.sccp(lvn.lvn(bbs))
+        # the parameter isn't a constant
+        self.assertIn(['*', 'n', 3], [code[:3] for code in codes(res)])
+        self.assertEqual([code[0] for code in codes(res)].count('end-fun'), 2)
+        self.assertEqual(run(res)['x'], 12)
+        for target in ['x86', 'x86-64']:
+            codetoassembly(codes(res), target=target)
+
+    def test_nested_if_without_else(self):
+        # the join of both 'if's is a block with only its label, it needs the phi of 'e'
+        bbs = codetobbs('''{
+            int b = 0;
+            int c = 1;
+            int e = 5;
+            if(b){
+                b = 1;
+            }else{
+                if(c){
+                    e = 0;
+                }
+            }
+            b = (e < e);
+        }''')
+        for optimized in [bbs, lvn.lvn(copy.deepcopy(bbs))]:
+            res = run(sccp.sccp(optimized))
+            self.assertEqual(res, run(optimized))
+            self.assertEqual(res['e'], 0)
+
+    def test_examples(self):
+        for name in sorted(os.listdir(examples)):
+            if not name.endswith('.mc') or name == 'primes.mc':
+                continue
+            with open(os.path.join(examples, name)) as f:
+                if 'read_' in f.read():
+                    continue
+            try:
+                bbs = bb.threetobbs(three.asttothree(parser.parsefile(os.path.join(examples, name))))
+                run(bbs)
+            except Exception:
+                # the examples for the error messages and the ones without global code
+                continue
+            versions = [bbs]
+            try:
+                versions.append(lvn.lvn(copy.deepcopy(bbs)))
+            except AttributeError:
+                # lvn fails on the results of void calls
+                pass
+            for optimized in versions:
+                expected = run(optimized)
+                res = run(sccp.sccp(optimized))
+                # the variables which are only declared in deleted blocks disappear
+                self.assertEqual({var: val for var, val in res.items() if var in expected},
+                                 {var: val for var, val in expected.items() if var in res or val is not None},
+                                 name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+import os
+import io
+import copy
+import contextlib
+import unittest
+from src import three
+from src import parser
+from src import bb
+from src import cfg
+from src import lvn
+from src import vm
+from src import ssa
+from src.dataflow import definition
+
+examples = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples')
+
+
+def codetobbs(stringcode):
+    return bb.threetobbs(three.asttothree(parser.parse(stringcode)))
+
+
+def filetobbs(name):
+    return bb.threetobbs(three.asttothree(parser.parsefile(os.path.join(examples, name))))
+
+
+def runnable_examples():
+    ''' the examples which terminate quickly without input '''
+    for name in sorted(os.listdir(examples)):
+        if not name.endswith('.mc') or name == 'primes.mc':
+            continue
+        with open(os.path.join(examples, name)) as f:
+            if 'read_' in f.read():
+                continue
+        try:
+            bbs = filetobbs(name)
+            run(bbs)
+        except Exception:
+            # the examples for the error messages and the ones without global code
+            continue
+        yield name, bbs
+
+
+def run(bbs):
+    ''' vm.run changes the blocks it runs '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        return vm.run(copy.deepcopy(bbs))
+
+
+def copy_propagation(bbs):
+    ''' replaces the uses of copies by their source, this makes the versions of a variable interfere '''
+    source = {}
+    for block in bbs:
+        for code in block:
+            if code[0] == 'assign' and type(code[1]) is str and code[2] is None:
+                source[code[3]] = code[1]
+
+    def origin(arg):
+        while type(arg) is str and arg in source:
+            arg = source[arg]
+        return arg
+    res = []
+    for block in bbs:
+        newblock = []
+        for code in block:
+            code = list(code)
+            if code[0] == 'phi':
+                code[1] = {pred: origin(value) for pred, value in code[1].items()}
+            else:
+                for pos in ssa.uses(code):
+                    code[pos] = origin(code[pos])
+            newblock.append(code)
+        res.append(newblock)
+    return res
+
+
+class TestToSSA(unittest.TestCase):
+
+    def test_basename(self):
+        self.assertEqual(ssa.basename('x.3'), 'x')
+        self.assertEqual(ssa.basename('.t4.12'), '.t4')
+        self.assertEqual(ssa.basename('.t4'), '.t4')
+        self.assertEqual(ssa.basename('x'), 'x')
+
+    def test_single_definition(self):
+        for name, bbs in runnable_examples():
+            defined = set()
+            for block in ssa.tossa(bbs):
+                for code in block:
+                    var = code[3] if code[0] == 'phi' else definition(code)
+                    if var is not None:
+                        self.assertNotIn(var, defined, '%s: %s' % (name, var))
+                        defined.add(var)
+
+    def test_phis_at_the_loop_headers(self):
+        bbs = filetobbs('whilenested3.mc')
+        graph = cfg.bbstocfg(bbs)
+        res = ssa.tossa(bbs, graph)
+        for b, block in enumerate(res):
+            phis = [code for code in block if code[0] == 'phi']
+            if b in [1, 3, 5]:
+                self.assertTrue(phis, 'block %d' % b)
+            start = ssa.phi_position(block)
+            self.assertEqual(block[start:start + len(phis)], phis)
+            for phi in phis:
+                # a value from every predecessor
+                self.assertEqual(set(phi[1]), set(p for p in graph if b in graph[p]))
+
+    def test_pruned(self):
+        bbs = codetobbs('''{
+            int a = 1;
+            if(a > 0){
+                a = 2;
+            }else{
+                a = 3;
+            }
+            int b = 4;
+        }''')
+        # 'a' is dead after the if, it gets no phi
+        self.assertFalse([code for block in ssa.tossa(bbs) for code in block if code[0] == 'phi'])
+
+
+class TestFromSSA(unittest.TestCase):
+
+    def test_round_trip_is_identity(self):
+        for name, bbs in runnable_examples():
+            self.assertEqual(ssa.fromssa(ssa.tossa(bbs)), bbs, name)
+            try:
+                optimized = lvn.lvn(copy.deepcopy(bbs))
+            except AttributeError:
+                # lvn fails on the results of void calls
+                continue
+            self.assertEqual(ssa.fromssa(ssa.tossa(optimized)), optimized, name)
+
+    def test_join_with_only_a_label(self):
+        # the inner 'if' without 'else' ends in the join of the outer one, a block with only its label
+        bbs = codetobbs('''{
+            int b = 0;
+            int c = 1;
+            int e = 5;
+            if(b){
+                b = 1;
+            }else{
+                if(c){
+                    e = 0;
+                }
+            }
+            b = (e < e);
+        }''')
+        converted = ssa.tossa(bbs)
+        self.assertIn('phi', [code[0] for block in converted for code in block if len(block) == 2])
+        self.assertEqual(ssa.fromssa(converted), bbs)
+        self.assertEqual(run(ssa.fromssa(converted))['e'], 0)
+
+    def test_round_trip_after_copy_propagation(self):
+        for name, bbs in runnable_examples():
+            expected = run(bbs)
+            res = run(ssa.fromssa(copy_propagation(ssa.tossa(bbs))))
+            # versions which interfere get a name with a '.', which isn't in the result
+            self.assertEqual(res, expected, name)
+
+    def test_swap(self):
+        # after copy propagation the phis of the loop read each other's values (the swap problem)
+        bbs = codetobbs('''{
+            int a = 1;
+            int b = 2;
+            int i = 0;
+            while(i < 3){
+                int t = a;
+                a = b;
+                b = t;
+                i = i + 1;
+            }
+        }''')
+        res = run(ssa.fromssa(copy_propagation(ssa.tossa(bbs))))
+        self.assertEqual((res['a'], res['b'], res['i']), (2, 1, 3))
+        # the version of 'b' which interferes has a name with a '.', it isn't in the result
+        self.assertEqual([var for var in res if '.' in var], [])
+
+    def test_lost_copy(self):
+        # the old value of 'x' is used after the loop, while the phi already has the new one
+        bbs = codetobbs('''{
+            int x = 0;
+            int y = 0;
+            while(x < 5){
+                y = x;
+                x = x + 1;
+            }
+        }''')
+        res = run(ssa.fromssa(copy_propagation(ssa.tossa(bbs))))
+        self.assertEqual((res['x'], res['y']), (5, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
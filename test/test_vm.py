@@ -859,5 +859,102 @@ class TestAlgorithms(unittest.TestCase):
             vals = executecode(code)
             self.assertEqual(vals['prime'], pythsol(num))
 
+
+class TestConstants(unittest.TestCase):
+
+    def test_int_and_float_constants(self):
+        # '1' and '1.0' are equal in Python but need different memory slots
+        code = '''{
+            float x = 2.0 + 1.0;
+            int y = 2 + 1;
+            float z = 0.0;
+            int w = 0;
+        }'''
+        vals = vm.run(bb.threetobbs(three.asttothree(parser.parse(code))))
+        self.assertEqual([type(vals[name]) for name in 'xyzw'], [float, int, float, int])
+
+
+class TestCalls(unittest.TestCase):
+
+    def test_recursion(self):
+        # the memory of returned calls is reused, active calls must not share it
+        code = '''{
+            int fib(int n) {
+                if (n < 2)
+                    return n;
+                int a = fib(n - 1);
+                int b = fib(n - 2);
+                return a + b;
+            }
+            int x = fib(15);
+            int y = fib(10);
+        }'''
+        for engine in vm.engines:
+            vals = vm.run(bb.threetobbs(three.asttothree(parser.parse(code))), engine=engine)
+            self.assertEqual((vals['x'], vals['y']), (610, 55))
+
+    def test_recycled_frame_is_reinitialized(self):
+        code = '''{
+            int count(int n) {
+                int sum;
+                for (int i = 0; i < n; i = i + 1)
+                    sum = sum + 1;
+                return sum;
+            }
+            int x = count(5);
+            int y = count(3);
+        }'''
+        for engine in vm.engines:
+            vals = vm.run(bb.threetobbs(three.asttothree(parser.parse(code))), engine=engine)
+            self.assertEqual((vals['x'], vals['y']), (5, 3))
+
+
+class TestCompareJump(unittest.TestCase):
+
+    def test_fused_conditions(self):
+        code = '''{
+            int x = 0;
+            int y = 0;
+            float f = 0.0;
+            for (int i = 0; i < 10; i = i + 1) {
+                if (i >= 5)
+                    x = x + 1;
+                if (i != 3)
+                    y = y + i;
+                if (f <= 2.5)
+                    f = f + 1.0;
+            }
+            int c = x == 5;
+        }'''
+        bbs = lvn.lvn(bb.threetobbs(three.asttothree(parser.parse(code))))
+        bytecode, _, _ = vm.bbs_to_bytecode([[list(tac) for tac in block] for block in bbs])
+        ops = [vm.opcode[op] for op, _, _, _ in bytecode]
+        self.assertTrue(set(['jumpfalse<', 'jumpfalse>=', 'jumpfalse!=', 'jumpfalse<=']) <= set(ops))
+        # 'c' is a variable, the comparison is kept
+        self.assertIn('==', ops)
+        self.assertNotIn('jumpfalse', ops)
+        for engine in vm.engines:
+            vals = vm.run([[list(tac) for tac in block] for block in bbs], engine=engine)
+            self.assertEqual((vals['x'], vals['y'], vals['f'], vals['c']), (5, 42, 3.0, True))
+
+
+class TestLibrary(unittest.TestCase):
+
+    def test_lib_functions(self):
+        # the vm has no I/O: print_* drops the argument, read_* returns 0
+        code = '''{
+            int main() {
+                start_measurement();
+                int x = read_int();
+                float y = read_float();
+                print_int(x + 1);
+                print_float(y);
+                end_measurement();
+                return 0;
+            }
+        }'''
+        vals = executecode(code)
+        self.assertEqual((vals['x'], vals['y']), (0, 0.0))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+from copy import deepcopy
+from src import three
+from src import parser
+from src import bb
+from src import vm
+from src import vmprofile
+
+
+def codetobbs(stringcode):
+    return bb.threetobbs(three.asttothree(parser.parse(stringcode)))
+
+
+def profilecode(stringcode):
+    bbs = codetobbs(stringcode)
+    expected = vm.run(deepcopy(bbs))
+    profile = vmprofile.Profile()
+    vals = vm.run(bbs, profile=profile)
+    return vals, expected, profile
+
+
+class TestProfile(unittest.TestCase):
+
+    def test_same_result(self):
+        vals, expected, _ = profilecode('''{
+            int fib(int n) {
+                if (n < 2)
+                    return n;
+                return fib(n - 1) + fib(n - 2);
+            }
+            int main() {
+                int x = fib(10);
+                return 0;
+            }
+        }''')
+        self.assertEqual(vals, expected)
+
+    def test_counts(self):
+        _, _, profile = profilecode('''{
+            int x = 0;
+            int y = x + 1;
+        }''')
+        report = profile.report()
+        self.assertEqual(report['instructions'], len(profile.code))
+        self.assertEqual([count for _, _, count in report['lines']], [1] * len(profile.code))
+        self.assertEqual(report['opcodes']['+'], 1)
+        self.assertEqual(sum(report['opcodes'].values()), report['instructions'])
+        self.assertEqual(report['loops'], [])
+
+    def test_functions(self):
+        _, _, profile = profilecode('''{
+            int fib(int n) {
+                if (n < 2)
+                    return n;
+                return fib(n - 1) + fib(n - 2);
+            }
+            int x = fib(10);
+            int y = fib(3);
+        }''')
+        functions = {fun['name']: fun for fun in profile.report()['functions']}
+        self.assertEqual(functions['fib']['calls'], 177 + 5)
+        self.assertEqual(functions['__global__']['calls'], 1)
+        fib, top = functions['fib'], functions['__global__']
+        # the recursive calls are only counted once in the inclusive time
+        self.assertLessEqual(fib['inclusive'], top['inclusive'])
+        self.assertAlmostEqual(fib['inclusive'], fib['exclusive'])
+        self.assertAlmostEqual(top['inclusive'], top['exclusive'] + fib['exclusive'])
+        self.assertEqual(sum(fun['instructions'] for fun in functions.values()), profile.report()['instructions'])
+
+    def test_loops(self):
+        _, _, profile = profilecode('''{
+            int sum = 0;
+            for (int i = 0; i < 10; i = i + 1) {
+                int j = 0;
+                while (j < 5) {
+                    sum = sum + 1;
+                    j = j + 1;
+                }
+            }
+        }''')
+        loops = profile.report()['loops']
+        self.assertEqual([loop['iterations'] for loop in loops], [10, 50])
+        outer, inner = loops
+        self.assertTrue(outer['start'] < inner['start'] <= inner['end'] < outer['end'])
+        self.assertEqual(outer['function'], '__global__')
+
+    def test_collapsed(self):
+        _, _, profile = profilecode('''{
+            int leaf(int n) {
+                return n + 1;
+            }
+            int twice(int n) {
+                return leaf(leaf(n));
+            }
+            int main() {
+                int x = twice(1);
+                int y = leaf(2);
+                return 0;
+            }
+        }''')
+        lines = profile.collapsed().splitlines()
+        stacks = {line.rsplit(' ', 1)[0]: int(line.rsplit(' ', 1)[1]) for line in lines}
+        self.assertEqual(set(stacks), set(['__global__', '__global__;main', '__global__;main;twice',
+                                           '__global__;main;twice;leaf', '__global__;main;leaf']))
+        self.assertEqual(sum(stacks.values()), profile.report()['instructions'])
+        self.assertEqual(stacks['__global__;main;twice;leaf'], 2 * stacks['__global__;main;leaf'])
+
+    def test_only_interpreter(self):
+        with self.assertRaises(NotImplementedError):
+            vm.run(codetobbs('{ int x = 0; }'), engine='threaded', profile=vmprofile.Profile())
+
+
+if __name__ == '__main__':
+    unittest.main()
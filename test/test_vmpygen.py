@@ -0,0 +1,142 @@
+import unittest
+import glob
+import os
+from copy import deepcopy
+from src import three
+from src import parser
+from src import bb
+from src import lvn
+from src import vm
+from src import vmpygen
+
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def codetobbs(stringcode, uselvn=True):
+    bbs = bb.threetobbs(three.asttothree(parser.parse(stringcode)))
+    return lvn.lvn(bbs) if uselvn else bbs
+
+
+def bothengines(testcase, stringcode):
+    for uselvn in [False, True]:
+        bbs = codetobbs(stringcode, uselvn)
+        # bbs_to_bytecode rewrites the instructions in place
+        expected = vm.run(deepcopy(bbs))
+        testcase.assertEqual(vm.run(bbs, engine='pygen'), expected)
+    return expected
+
+
+class TestPygen(unittest.TestCase):
+
+    def test_assignments(self):
+        vals = bothengines(self, '''{
+            int x = 3;
+            float y = 2.5;
+            int z = -x;
+            int w = !z;
+            float v = y * 2.0;
+            float u = -1.5;
+            float t = -u;
+        }''')
+        self.assertEqual((vals['v'], vals['t']), (5.0, 1.5))
+
+    def test_operators(self):
+        for op in ['+', '-', '*', '/', '%', '<', '>', '<=', '>=', '==', '!=']:
+            for x, y in [(7, 3), (-7, 3), (3, 3)]:
+                bothengines(self, '{ int x = %d; int y = %d; int z = x %s y; }' % (x, y, op))
+
+    def test_loops(self):
+        vals = bothengines(self, '''{
+            int sum = 0;
+            for (int i = 0; i < 100; i = i + 1) {
+                if ((i % 3) == 0)
+                    sum = sum + i;
+                else {
+                    int j = 0;
+                    while (j < 2)
+                        j = j + 1;
+                    sum = sum + j;
+                }
+            }
+        }''')
+        self.assertEqual(vals['sum'], sum(i if i % 3 == 0 else 2 for i in range(100)))
+
+    def test_loop_at_the_end(self):
+        # the jump after the loop leaves the top-level frame
+        vals = bothengines(self, '{ int x = 0; while (x < 5) x = x + 1; }')
+        self.assertEqual(vals['x'], 5)
+
+    def test_functions(self):
+        vals = bothengines(self, '''{
+            int fib(int n) {
+                if (n < 2)
+                    return n;
+                return fib(n - 1) + fib(n - 2);
+            }
+            int add(int a, int b, int c) {
+                return a + b * c;
+            }
+            int x = fib(12);
+            int y = add(1, 2, 3);
+        }''')
+        self.assertEqual((vals['x'], vals['y']), (144, 7))
+
+    def test_main(self):
+        vals = bothengines(self, '''{
+            int twice(int x) {
+                return x * 2;
+            }
+            int main() {
+                int x = twice(21);
+                return 0;
+            }
+        }''')
+        self.assertEqual(vals['x'], 42)
+
+    def test_deep_recursion(self):
+        # deeper than the default recursion limit of Python
+        vals = bothengines(self, '''{
+            int depth(int n) {
+                if (n == 0)
+                    return 0;
+                return 1 + depth(n - 1);
+            }
+            int x = depth(5000);
+        }''')
+        self.assertEqual(vals['x'], 5000)
+
+    def test_generated_source(self):
+        code, frames, exitline = vm.bbs_to_bytecode(codetobbs('{ int x = 0; while (x < 5) x = x + 1; }', False))
+        source = vmpygen.generate_function(code, frames, exitline, 0)
+        self.assertTrue(source.startswith('def f0(stack):'))
+        self.assertIn('while True:', source)
+        self.assertIn('raise VMExit(0, ', source)
+        self.assertIs(vmpygen.compile_function(source), vmpygen.compile_function(source))
+
+    def test_reuse_compiled_program(self):
+        code, frames, exitline = vm.bbs_to_bytecode(codetobbs('{ int x = 0; while (x < 5) x = x + 1; }'))
+        first = vm.run_bytecode(code, frames, exitline, engine='pygen')
+        self.assertIs(vmpygen.programs[0][0], code)
+        self.assertEqual(vm.run_bytecode(code, frames, exitline, engine='pygen'), first)
+
+    def test_examples(self):
+        count = 0
+        fnames = glob.glob(os.path.join(root, 'examples', '*.mc')) + glob.glob(os.path.join(root, 'bench', '*.c'))
+        for fname in sorted(fnames):
+            if os.path.basename(fname) in ['primes.mc']:
+                # too slow for a unit test
+                continue
+            try:
+                bbs = bb.threetobbs(three.asttothree(parser.parsefile(fname)))
+                expected = vm.run(deepcopy(bbs))
+            except Exception:
+                # examples which are not accepted by the grammar or the vm
+                continue
+            self.assertEqual(vm.run(bbs, engine='pygen'), expected, fname)
+            count += 1
+        self.assertTrue(count > 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
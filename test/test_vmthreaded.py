@@ -0,0 +1,131 @@
+import unittest
+import glob
+import os
+from copy import deepcopy
+from src import three
+from src import parser
+from src import bb
+from src import lvn
+from src import vm
+from src import vmthreaded
+
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def codetobbs(stringcode, uselvn=True):
+    bbs = bb.threetobbs(three.asttothree(parser.parse(stringcode)))
+    return lvn.lvn(bbs) if uselvn else bbs
+
+
+def bothengines(testcase, stringcode):
+    for uselvn in [False, True]:
+        bbs = codetobbs(stringcode, uselvn)
+        # bbs_to_bytecode rewrites the instructions in place
+        expected = vm.run(deepcopy(bbs))
+        testcase.assertEqual(vm.run(bbs, engine='threaded'), expected)
+    return expected
+
+
+class TestThreaded(unittest.TestCase):
+
+    def test_assignments(self):
+        vals = bothengines(self, '''{
+            int x = 3;
+            float y = 2.5;
+            int z = -x;
+            int w = !z;
+            float v = y * 2.0;
+        }''')
+        self.assertEqual(vals['v'], 5.0)
+
+    def test_operators(self):
+        for op in ['+', '-', '*', '/', '%', '<', '>', '<=', '>=', '==', '!=']:
+            for x, y in [(7, 3), (-7, 3), (3, 3)]:
+                bothengines(self, '{ int x = %d; int y = %d; int z = x %s y; }' % (x, y, op))
+
+    def test_loops(self):
+        vals = bothengines(self, '''{
+            int sum = 0;
+            for (int i = 0; i < 100; i = i + 1) {
+                if ((i % 3) == 0)
+                    sum = sum + i;
+                else {
+                    int j = 0;
+                    while (j < 2)
+                        j = j + 1;
+                    sum = sum + j;
+                }
+            }
+        }''')
+        self.assertEqual(vals['sum'], sum(i if i % 3 == 0 else 2 for i in range(100)))
+
+    def test_infinite_jump_chain(self):
+        # the jump threading has to stop on cycles of jumps
+        bbs = codetobbs('{ int x = 0; while(1) { } }', False)
+        code, frames, exitline = vm.bbs_to_bytecode(bbs)
+        handlers, _ = vmthreaded.compile_handlers(code, exitline, [], exitline)
+        self.assertEqual(len(handlers), len(code))
+
+    def test_functions(self):
+        vals = bothengines(self, '''{
+            int fib(int n) {
+                if (n < 2)
+                    return n;
+                return fib(n - 1) + fib(n - 2);
+            }
+            int add(int a, int b, int c) {
+                return a + b * c;
+            }
+            int x = fib(12);
+            int y = add(1, 2, 3);
+        }''')
+        self.assertEqual((vals['x'], vals['y']), (144, 7))
+
+    def test_mutual_recursion(self):
+        vals = bothengines(self, '''{
+            int is_even(int n){
+                if (n != 0)
+                    return is_odd(n - 1);
+                return 1;
+            }
+            int is_odd(int n){
+                if (n != 0)
+                    return is_even(n - 1);
+                return 0;
+            }
+            int x = is_even(10);
+            int y = is_odd(7);
+        }''')
+        self.assertEqual((vals['x'], vals['y']), (1, 1))
+
+    def test_reuse_compiled_program(self):
+        code, frames, exitline = vm.bbs_to_bytecode(codetobbs('{ int x = 0; while (x < 5) x = x + 1; }'))
+        first = vm.run_bytecode(code, frames, exitline, engine='threaded')
+        self.assertIs(vmthreaded.programs[0][0], code)
+        self.assertEqual(vm.run_bytecode(code, frames, exitline, engine='threaded'), first)
+        self.assertEqual(first['x'], 5)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(NotImplementedError):
+            vm.run(codetobbs('{ int x = 0; }'), engine='jit')
+
+    def test_examples(self):
+        count = 0
+        for fname in sorted(glob.glob(os.path.join(root, 'examples', '*.mc'))):
+            if os.path.basename(fname) in ['primes.mc']:
+                # too slow for a unit test
+                continue
+            try:
+                bbs = bb.threetobbs(three.asttothree(parser.parsefile(fname)))
+                expected = vm.run(deepcopy(bbs))
+            except Exception:
+                # examples which are not accepted by the grammar or the vm
+                continue
+            self.assertEqual(vm.run(bbs, engine='threaded'), expected, fname)
+            count += 1
+        self.assertTrue(count > 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,14 +7,30 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("filename", help="The *.mc file to compile")
     parser.add_argument('--lvn', '-l', action='count', default=False)
+    parser.add_argument('--sccp', '-s', action='count', default=False)
+    parser.add_argument('--dce', action='count', default=False)
+    parser.add_argument('--licm', action='count', default=False)
     parser.add_argument('--verbose', '-v', action='count', default=0)
     parser.add_argument('--execute', '-e', action='count', default=0)
     parser.add_argument('--debug', '-d', action='count', default=False)
+    parser.add_argument('--cache', '-c', nargs='?', const='.mccache', default=None)
+    parser.add_argument('--regalloc', '-r', default=None)
+    parser.add_argument('--target', '-t', default='x86', help="x86 or x86-64")
+    parser.add_argument('--optimize', '-O', action='count', default=False)
     args = parser.parse_args()
     lvn = ['--lvn'] if args.lvn else []
+    sccp = ['--sccp'] if args.sccp else []
+    dce = ['--dce'] if args.dce else []
+    licm = ['--licm'] if args.licm else []
+    cache = ['--cache', args.cache] if args.cache is not None else []
+    regalloc = ['--regalloc', args.regalloc] if args.regalloc is not None else []
+    target = ['--target', args.target] if args.target != 'x86' else []
+    optimize = ['-O'] if args.optimize else []
     verbose = ['-' + ('v' * args.verbose)] if args.verbose else []
-    pycall = ['python', '-m', 'src.assembler', args.filename] + lvn + verbose
-    gcc = ['gcc', '-o', args.filename + '.bin', args.filename + '.s', 'assembler/lib.c', '-m32']
+    pycall = ['python', '-m', 'src.assembler', args.filename] + lvn + sccp + dce + licm + cache + regalloc + target + optimize + verbose
+    gcc = ['gcc', '-o', args.filename + '.bin', args.filename + '.s', 'assembler/lib.c']
+    if args.target == 'x86':
+        gcc.append('-m32')
     if args.debug:
         gcc.insert(1, '-gdwarf-3')
     run = [args.filename + '.bin']
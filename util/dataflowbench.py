@@ -0,0 +1,85 @@
+#!/usr/bin/python
+
+import os
+import sys
+from timeit import default_timer
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+from src.parser import parse  # noqa: E402
+from src.three import asttothree  # noqa: E402
+from src.bb import threetobbs  # noqa: E402
+from src.cfg import bbstocfg  # noqa: E402
+from src.dataflow import liveness, liveness_sets, worklist  # noqa: E402
+from src.utils import op_sets_result  # noqa: E402
+
+
+def synthetic(statements, variables=None):
+    ''' a function with a loop around 'statements' conditional updates of 'variables' variables,
+        every statement creates 3 temporaries (default: statements // 4 variables) '''
+    variables = variables or max(statements // 4, 2)
+    lines = ['{', 'int f(int n){']
+    lines += ['int v%d = n;' % var for var in range(variables)]
+    lines.append('for(int i=0;i<n;i=i+1){')
+    for num in range(statements):
+        a, b, c = num % variables, (num * 7 + 3) % variables, (num * 13 + 5) % variables
+        lines.append('if(v%d < i){ v%d = (v%d + i) * v%d; }' % (a, b, c, a))
+    lines.append('}')
+    lines += ['print_int(v%d);' % var for var in range(variables)]
+    lines.append('return n;')
+    lines += ['}', '}']
+    return '\n'.join(lines)
+
+
+def nested(depth):
+    ''' 'depth' nested while loops, every loop counter is live in all the inner loops '''
+    lines = ['{', 'int f(int n){', 'int s = 0;']
+    lines += ['int i%d = 0;' % d for d in range(depth)]
+    lines += ['while(i%d < n){ i%d = i%d + 1;' % (d, d, d) for d in range(depth)]
+    lines.append('s = s + 1;')
+    lines += ['}'] * depth
+    lines += ['return s;', '}', '}']
+    return '\n'.join(lines)
+
+
+def iterations(bbs):
+    ''' the worklist iterations of liveness (backward) and of the defined variables (forward) '''
+    cfg = bbstocfg(bbs)
+    defined = {b: set(tac[3] for tac in block if tac[0] in op_sets_result) for b, block in enumerate(bbs)}
+    backward, forward = {}, {}
+    liveness(bbs, cfg, stats=backward)
+    worklist(bbs, cfg, lambda: set(), lambda b, inb: inb | defined[b], stats=forward)
+    return backward['iterations'], forward['iterations']
+
+
+def measure(fun, *args):
+    start = default_timer()
+    res = fun(*args)
+    return default_timer() - start, res
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Compares the set and the bit-vector liveness on synthetic functions')
+    parser.add_argument('statements', nargs='*', type=int,
+                        help="The number of statements of the synthetic functions (default: 100 1000 1500)")
+    parser.add_argument('--nested', '-n', action='store_true',
+                        help="Count the worklist iterations for loops nested 'statements' deep instead (default: 3 10 50 200)")
+    args = parser.parse_args()
+    if args.nested:
+        print('{:>8}{:>8}{:>12}{:>12}'.format('depth', 'blocks', 'backward', 'forward'))
+        for depth in args.statements or [3, 10, 50, 200]:
+            bbs = threetobbs(asttothree(parse(nested(depth), backend='fast')))
+            print('{:>8}{:>8}{:>12}{:>12}'.format(depth, len(bbs), *iterations(bbs)))
+        sys.exit(0)
+    print('{:>12}{:>8}{:>12}{:>12}{:>12}{:>10}'.format('temporaries', 'blocks', 'variables', 'sets [s]', 'bits [s]', 'speedup'))
+    for statements in args.statements or [100, 1000, 1500]:
+        bbs = threetobbs(asttothree(parse(synthetic(statements), backend='fast')))
+        cfg = bbstocfg(bbs)
+        names = set(tac[3] for bb in bbs for tac in bb if type(tac[3]) is str and tac[3].startswith('.t'))
+        setstime, (setsin, setsout) = measure(liveness_sets, bbs, cfg)
+        bitstime, (bitsin, bitsout) = measure(liveness, bbs, cfg)
+        assert all(setsin[b] == bitsin[b] and setsout[b] == bitsout[b] for b in range(len(bbs)))
+        variables = len(set(var for sets in setsin.values() for var in sets))
+        print('{:>12}{:>8}{:>12}{:>12.4f}{:>12.4f}{:>9.1f}x'.format(
+            len(names), len(bbs), variables, setstime, bitstime, setstime / bitstime))
@@ -0,0 +1,42 @@
+#!/usr/bin/python
+
+import os
+import sys
+from timeit import default_timer
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+from src.parser import parse  # noqa: E402
+from src.three import asttothree  # noqa: E402
+from src.bb import threetobbs  # noqa: E402
+from src.lvn import lvn  # noqa: E402
+
+
+def straightline(instructions, variables=100):
+    ''' a function with one block of about 'instructions' three address codes,
+        every statement computes a new expression and overwrites a variable '''
+    lines = ['{', 'int f(int n){']
+    lines += ['int v%d = n + %d;' % (var, var) for var in range(variables)]
+    for num in range(instructions // 6):
+        a, b, c = num % variables, (num * 7 + 3) % variables, (num * 13 + 5) % variables
+        lines.append('v%d = (v%d + %d) * v%d;' % (a, b, num, c))
+    lines.append('return v0;')
+    lines += ['}', '}']
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Local value numbering on long generated blocks, the time per '
+                                                 'instruction stays the same when the blocks grow')
+    parser.add_argument('instructions', nargs='*', type=int,
+                        help="The approximate number of instructions of the blocks (default: 10000 20000 50000 100000)")
+    args = parser.parse_args()
+    print('{:>14}{:>12}{:>16}'.format('instructions', 'lvn [s]', 'per instr. [us]'))
+    for instructions in args.instructions or [10000, 20000, 50000, 100000]:
+        bbs = threetobbs(asttothree(parse(straightline(instructions), backend='fast')))
+        count = sum(len(block) for block in bbs)
+        start = default_timer()
+        lvn(bbs)
+        elapsed = default_timer() - start
+        print('{:>14}{:>12.3f}{:>16.2f}'.format(count, elapsed, elapsed / count * 1e6))
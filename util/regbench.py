@@ -0,0 +1,76 @@
+#!/usr/bin/python
+
+import os
+import re
+import sys
+from subprocess import call, Popen, PIPE
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+from src.regalloc import strategies  # noqa: E402
+from src.assembler import targets  # noqa: E402
+
+
+def count_instructions(asmfile):
+    ''' returns (#instructions, #instructions accessing the stack frame) '''
+    instructions, stack = 0, 0
+    with open(asmfile, 'r') as f:
+        for line in f:
+            instr = line.split('#')[0].strip()
+            if not line.startswith('\t') or not instr:
+                continue
+            instructions += 1
+            if '(%ebp)' in instr or '(%rbp)' in instr:
+                stack += 1
+    return instructions, stack
+
+
+def measure(binary, inp, repeat):
+    ''' median of the ticks printed by end_measurement (None if the binary can't be executed) '''
+    ticks = []
+    for _ in range(repeat):
+        try:
+            p = Popen([binary], stdin=PIPE, stdout=PIPE)
+        except OSError:
+            return None
+        out, _ = p.communicate(b'%d\n' % inp)
+        match = re.search(rb'Time:\s*(\d+) ticks', out)
+        if match is None:
+            return None
+        ticks.append(int(match.group(1)))
+    return sorted(ticks)[len(ticks) // 2]
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Compares the register allocators on the given programs')
+    parser.add_argument('filenames', nargs='+', help="The *.mc/*.c files to compile (e.g. bench/*.c)")
+    parser.add_argument('--lvn', '-l', action='count', default=False)
+    parser.add_argument('--dce', action='count', default=False)
+    parser.add_argument('--licm', action='count', default=False)
+    parser.add_argument('--input', '-i', type=int, default=25, help="The input for read_int")
+    parser.add_argument('--repeat', '-n', type=int, default=5)
+    parser.add_argument('--target', '-t', choices=targets, default='x86')
+    args = parser.parse_args()
+    lvn = ['--lvn'] if args.lvn else []
+    dce = ['--dce'] if args.dce else []
+    licm = ['--licm'] if args.licm else []
+    target = ['--target', args.target]
+    m32 = ['-m32'] if args.target == 'x86' else []
+    print('{:20}{:>10}{:>14}{:>10}{:>14}{:>10}'.format('program', 'regalloc', 'instructions', 'stack', 'ticks', 'speedup'))
+    for filename in args.filenames:
+        baseline = None
+        for strategy in ['stack'] + strategies:
+            regalloc = [] if strategy == 'stack' else ['--regalloc', strategy]
+            asmfile = '%s.%s.s' % (filename, strategy)
+            binary = '%s.%s.bin' % (filename, strategy)
+            call(['python', '-m', 'src.assembler', filename, '-v'] + lvn + dce + licm + regalloc + target, cwd=root, stdout=PIPE)
+            os.rename(filename + '.s', asmfile)
+            instructions, stack = count_instructions(asmfile)
+            gcc = call(['gcc', '-o', binary, asmfile, 'assembler/lib.c'] + m32, cwd=root)
+            ticks = measure(binary, args.input, args.repeat) if gcc == 0 else None
+            if strategy == 'stack':
+                baseline = ticks
+            speedup = '%.2fx' % (baseline / ticks) if baseline and ticks else '-'
+            print('{:20}{:>10}{:>14}{:>10}{:>14}{:>10}'.format(
+                os.path.basename(filename), strategy, instructions, stack, '-' if ticks is None else ticks, speedup))